@@ -1,14 +1,199 @@
 #!/usr/bin/env python3
+import time
+_STARTUP_T0 = time.perf_counter()
+
 import os
 import subprocess
-import requests
 import sys
 import platform
+import json
+import shutil
+import importlib
+
+# Heavier modules (requests, distro, psutil, concurrent.futures, argparse) are
+# imported lazily by the features that need them; see lazy_import().
 
 # Define the current version
 CURRENT_VERSION = "1.5.1"
 GITHUB_REPO_URL = "https://raw.githubusercontent.com/McEwann/QAkit/main/qakit.py?nocache=1"
 
+
+def _cache_dir_settings(cache_dir):
+    """Paths of every state file kept under the cache directory, as {global name: value}."""
+    return {
+        "CACHE_DIR": cache_dir,
+        "PROBE_CACHE_FILE": os.path.join(cache_dir, "probe_cache.json"),
+        "UPDATE_STATE_FILE": os.path.join(cache_dir, "update_state.json"),
+        "UPDATE_BODY_FILE": os.path.join(cache_dir, "qakit_latest.py"),
+        "TRANSCODE_CACHE_DIR": os.path.join(cache_dir, "transcode"),
+        "TRANSCODE_CACHE_INDEX": os.path.join(cache_dir, "transcode", "index.json"),
+        "MEDIA_INDEX_FILE": os.path.join(cache_dir, "media_index.json"),
+        "STRESS_RESULTS_DB": os.path.join(cache_dir, "stress_results.sqlite"),
+        "TRACE_FILE": os.path.join(cache_dir, "trace.jsonl"),
+        "DAEMON_SOCKET": os.path.join(cache_dir, "daemon.sock"),
+        "DAEMON_LOG_FILE": os.path.join(cache_dir, "daemon.log"),
+    }
+
+
+def _environment_settings():
+    """Every setting read from the environment, as {global name: value}.
+
+    Sets the module globals below at import time, and again in a forwarded
+    daemon job (see load_environment_settings()).
+    """
+    settings = _cache_dir_settings(os.path.join(os.getenv("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+                                                "qakit"))
+    config_home = os.getenv("XDG_CONFIG_HOME", os.path.expanduser("~/.config"))
+    settings.update(
+        UPDATE_URL=os.getenv("QAKIT_UPDATE_URL", GITHUB_REPO_URL),
+        UPDATE_CHECK_TTL=int(os.getenv("QAKIT_UPDATE_TTL", "3600")),
+        UPDATE_SHA256_URL=os.getenv("QAKIT_UPDATE_SHA256_URL"),
+        TRANSCODE_CACHE_MAX_BYTES=int(os.getenv("QAKIT_TRANSCODE_CACHE_MB", "10240")) * 1024 * 1024,
+        COMMAND_LOG_FILE=os.getenv("QAKIT_COMMAND_LOG"),
+        MONITOR_INTERVAL=float(os.getenv("QAKIT_MONITOR_INTERVAL", "0.5")),
+        STRESS_PROFILES_FILE=os.getenv("QAKIT_STRESS_PROFILES",
+                                       os.path.join(config_home, "qakit", "stress_profiles.json")),
+        STRESS_RESULTS_DB=os.getenv("QAKIT_RESULTS_DB", settings["STRESS_RESULTS_DB"]),
+        FLEET_INVENTORY_FILE=os.getenv("QAKIT_INVENTORY", os.path.expanduser("~/.qakit_inventory.json")),
+        TRACE_FILE=os.getenv("QAKIT_TRACE", settings["TRACE_FILE"]),
+        DAEMON_SOCKET=os.getenv("QAKIT_SOCKET", settings["DAEMON_SOCKET"]),
+    )
+    return settings
+
+
+_ENV_SETTINGS = _environment_settings()
+
+UPDATE_URL = _ENV_SETTINGS["UPDATE_URL"]  # QAKIT_UPDATE_URL
+UPDATE_CHECK_TTL = _ENV_SETTINGS["UPDATE_CHECK_TTL"]  # QAKIT_UPDATE_TTL: seconds a successful check is reused
+# The script's SHA-256 is published separately ('sha256sum' format); by default at <script URL>.sha256.
+UPDATE_SHA256_URL = _ENV_SETTINGS["UPDATE_SHA256_URL"]  # QAKIT_UPDATE_SHA256_URL
+
+# Local state (probe cache etc.) lives here, under $XDG_CACHE_HOME/qakit.
+CACHE_DIR = _ENV_SETTINGS["CACHE_DIR"]
+PROBE_CACHE_FILE = _ENV_SETTINGS["PROBE_CACHE_FILE"]
+UPDATE_STATE_FILE = _ENV_SETTINGS["UPDATE_STATE_FILE"]
+UPDATE_BODY_FILE = _ENV_SETTINGS["UPDATE_BODY_FILE"]
+PROBE_TIMEOUT = 5  # seconds allowed for a single "<tool> --version" probe
+TRANSCODE_CACHE_DIR = _ENV_SETTINGS["TRANSCODE_CACHE_DIR"]
+TRANSCODE_CACHE_INDEX = _ENV_SETTINGS["TRANSCODE_CACHE_INDEX"]
+# Size bound for cached ffmpeg outputs (QAKIT_TRANSCODE_CACHE_MB); least recently used entries are evicted first.
+TRANSCODE_CACHE_MAX_BYTES = _ENV_SETTINGS["TRANSCODE_CACHE_MAX_BYTES"]
+
+# Startup profiling data, reported by --startup-profile.
+_import_timings = []   # (module, seconds) for lazily imported modules
+_startup_stages = []   # (stage, seconds) for startup stages
+_IMPORTS_DONE = None   # perf_counter() once the module-level imports finished
+
+# Library path the launched tools are run with (applied to every child process).
+TOOL_LIBRARY_PATH = "/usr/local/triplecms/lib"
+
+# Media metadata index: ffprobe/identify results keyed by path, size and mtime,
+# consulted to skip no-op work; and the x264 CRF 'video compress' encodes at.
+MEDIA_INDEX_FILE = _ENV_SETTINGS["MEDIA_INDEX_FILE"]
+VIDEO_COMPRESS_CRF = 28
+
+# Streaming command output: lines kept in memory for the error summary, and an
+# optional file every command's output is appended to (set with --log or QAKIT_COMMAND_LOG).
+COMMAND_TAIL_LINES = 50
+COMMAND_LOG_FILE = _ENV_SETTINGS["COMMAND_LOG_FILE"]
+
+# Multi-group nwtest runs: extra seconds allowed past the test duration before a
+# run is killed, and characters of output kept per group.
+NWTEST_GRACE_SECONDS = 15
+NWTEST_OUTPUT_LIMIT = 4000
+
+# Stress monitoring: seconds between samples, seconds between log flushes, and
+# the header that identifies qakit's compact binary metrics format.
+MONITOR_INTERVAL = _ENV_SETTINGS["MONITOR_INTERVAL"]  # QAKIT_MONITOR_INTERVAL
+MONITOR_FLUSH_INTERVAL = 5.0
+# Samples kept per metric for percentiles (~2.3 hours at the default interval);
+# min/mean/max are tracked over the whole run regardless.
+MONITOR_RING_SIZE = 16384
+METRICS_MAGIC = b"QAKITM1\n"
+
+# Stress profiles. Counts accept N, "N%" of the logical cores or "Nx" the core
+# count; vm_bytes (per memory worker) accepts "512M"/"1G" or "N%" of total RAM.
+# STRESS_PROFILES_FILE (QAKIT_STRESS_PROFILES) can add or override profiles and scenarios.
+STRESS_PROFILES_FILE = _ENV_SETTINGS["STRESS_PROFILES_FILE"]
+BUILTIN_STRESS_PROFILES = {
+    "light": {"description": "Basic test with low load",
+              "cpu": "25%", "vm": 1, "vm_bytes": "5%", "io": 1, "duration": 30},
+    "moderate": {"description": "Standard test with moderate load",
+                 "cpu": "50%", "vm": 2, "vm_bytes": "10%", "io": 2, "duration": 60},
+    "heavy": {"description": "Maximum load for intensive testing",
+              "cpu": "100%", "vm": 4, "vm_bytes": "15%", "io": 4, "duration": 120},
+}
+BUILTIN_STRESS_SCENARIOS = {
+    "ramp": [
+        {"name": "warm-up", "profile": "light", "duration": 30},
+        {"name": "ramp", "profile": "moderate", "duration": 60},
+        {"name": "plateau", "profile": "heavy", "duration": 120},
+        {"name": "cool-down", "profile": "light", "duration": 30},
+    ],
+}
+
+# Multicast discovery: kernel membership tables read instead of running 'ip maddr',
+# and seconds between polls in watch mode.
+PROC_IGMP_FILE = "/proc/net/igmp"
+PROC_IGMP6_FILE = "/proc/net/igmp6"
+MULTICAST_WATCH_INTERVAL = 1.0
+
+# Stress result store (SQLite), and the defaults for comparing a run against its
+# baseline: earlier runs considered, significance level and smallest relative change.
+STRESS_RESULTS_DB = _ENV_SETTINGS["STRESS_RESULTS_DB"]  # QAKIT_RESULTS_DB
+RESULTS_BASELINE_RUNS = 10
+RESULTS_ALPHA = 0.05
+RESULTS_MIN_CHANGE = 0.02
+
+# Fleet runs: inventory used when none is given, seconds allowed for every host to
+# connect and report ready, seconds between live status lines, and seconds hosts
+# get to wind down after an interrupt before they are killed.
+FLEET_INVENTORY_FILE = _ENV_SETTINGS["FLEET_INVENTORY_FILE"]  # QAKIT_INVENTORY
+FLEET_READY_TIMEOUT = 60
+FLEET_STATUS_INTERVAL = 2.0
+FLEET_STOP_TIMEOUT = 10
+
+# Reachability sweeps: concurrent ping processes and the largest target list accepted.
+SWEEP_CONCURRENCY = 32
+SWEEP_MAX_TARGETS = 4096
+
+# Native downloads: chunk size for parallel range requests, connections per file,
+# files fetched at once from a manifest, per-request timeout and retries per chunk.
+DOWNLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+DOWNLOAD_CONNECTIONS = 4
+DOWNLOAD_CONCURRENCY = 4
+DOWNLOAD_TIMEOUT = 30
+DOWNLOAD_RETRIES = 3
+
+# Benchmarks: synthetic images per batch run, and the median change (10%) that
+# counts as a regression when comparing against a baseline.
+BENCH_IMAGES = 50
+BENCH_TOLERANCE = 0.10
+
+# Command/action tracing: JSONL records of every subprocess launch and menu action,
+# rotated at TRACE_MAX_BYTES with TRACE_BACKUPS old files kept. QAKIT_TRACE=off disables it.
+TRACE_FILE = _ENV_SETTINGS["TRACE_FILE"]
+TRACE_MAX_BYTES = 5 * 1024 * 1024
+TRACE_BACKUPS = 3
+
+# Job daemon: Unix socket a long-lived 'qakit daemon start' listens on for forwarded
+# subcommands (QAKIT_SOCKET), and its log file.
+DAEMON_SOCKET = _ENV_SETTINGS["DAEMON_SOCKET"]
+DAEMON_LOG_FILE = _ENV_SETTINGS["DAEMON_LOG_FILE"]
+
+# File extensions picked up when a batch source is a directory.
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".bmp", ".tif", ".tiff", ".webp")
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".mkv", ".avi", ".webm", ".ts", ".m4v", ".mpg", ".mpeg")
+
+# Tools reported by the dependency check.
+DEPENDENCY_TOOLS = {
+    "ImageMagick (convert)": "convert",
+    "FFmpeg (ffmpeg)": "ffmpeg",
+    "NWTest (nwtest)": "nwtest",
+    "Stress (stress)": "stress",
+    "Stress-ng (stress-ng)": "stress-ng",
+}
+
 # ANSI color codes (conditionally enabled)
 if platform.system() == "Windows":
     GREEN = RED = RESET = ""
@@ -18,6 +203,46 @@ else:
     RESET = "\033[0m"
 
 
+_IMPORTS_DONE = time.perf_counter()
+
+
+def lazy_import(module_name):
+    """Import a module on first use, recording how long the import took.
+
+    Raises ImportError like a normal import if the module is not installed.
+    """
+    # Always go through importlib: a module already in sys.modules may still be
+    # initialising in another thread, and import_module waits for it to finish.
+    first_use = module_name not in sys.modules
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    if first_use:
+        _import_timings.append((module_name, time.perf_counter() - start))
+    return module
+
+
+def timed_stage(stage, func, *args, **kwargs):
+    """Run func(*args, **kwargs), recording its duration as a startup stage."""
+    start = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        _startup_stages.append((stage, time.perf_counter() - start))
+
+
+def report_startup_profile():
+    """Print import and startup-stage timings to stderr."""
+    now = time.perf_counter()
+    lines = ["", "--- Startup Profile ---"]
+    lines.append(f"{'module imports':<28}{(_IMPORTS_DONE - _STARTUP_T0) * 1000:9.2f} ms")
+    for module_name, seconds in _import_timings:
+        lines.append(f"{'  import ' + module_name:<28}{seconds * 1000:9.2f} ms")
+    for stage, seconds in _startup_stages:
+        lines.append(f"{stage:<28}{seconds * 1000:9.2f} ms")
+    lines.append(f"{'total':<28}{(now - _STARTUP_T0) * 1000:9.2f} ms")
+    print("\n".join(lines), file=sys.stderr)
+
+
 def alias_exists():
     """Check if the alias for qakit already exists in the shell configuration file."""
     shell = os.getenv("SHELL")
@@ -78,470 +303,4874 @@ Always ensure thorough and appropriate testing for your use case.
 """)
 
 
-def run_command(command):
-    """Runs a shell command and prints its output."""
-    try:
-        result = subprocess.run(
-            command,
-            shell=True,
-            text=True,
-            capture_output=True,
-            env={**os.environ, "LD_LIBRARY_PATH": "/usr/local/triplecms/lib"}
-        )
-        if result.stdout:
-            print(result.stdout)
-        if result.stderr:
-            print(f"{RED}Errors:\n{result.stderr}{RESET}")
-        if result.returncode == 0:
-            print(f"{GREEN}Command executed successfully!{RESET}")
-        else:
-            print(f"{RED}Command failed. Please check the errors above.{RESET}")
-        return result.returncode
-    except Exception as e:
-        print(f"{RED}Error executing command: {e}{RESET}")
-        return None
+_trace_logger = None
+_trace_lock = None
 
 
-def is_tool_installed(tool):
-    """Check if a specific tool is installed on the system."""
+def record_trace(record):
+    """Append one trace record to the rotating JSONL trace file (unless tracing is off)."""
+    global _trace_logger, _trace_lock
+    if not TRACE_FILE or TRACE_FILE.lower() in ("0", "off", "none"):
+        return
+    if _trace_lock is None:
+        _trace_lock = lazy_import("threading").Lock()
     try:
-        subprocess.run([tool, "--version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        return True
-    except FileNotFoundError:
-        return False
-
+        with _trace_lock:
+            if _trace_logger is None:
+                _trace_logger = _open_trace_logger()
+        _trace_logger.info(json.dumps(record, default=str))
+    except OSError:
+        pass
 
-def check_dependencies():
-    """Check for required tools and their availability."""
-    tools = {
-        "ImageMagick (convert)": "convert",
-        "FFmpeg (ffmpeg)": "ffmpeg",
-        "NWTest (nwtest)": "nwtest",
-		"Stress (stress)": "stress",
-		"Stress-ng (stress-ng)": "stress-ng"
-    }
-    return {name: is_tool_installed(command) for name, command in tools.items()}
 
+def _open_trace_logger():
+    logging = lazy_import("logging")
+    handlers = lazy_import("logging.handlers")
+    if os.path.dirname(TRACE_FILE):
+        os.makedirs(os.path.dirname(TRACE_FILE), exist_ok=True)
+    handler = handlers.RotatingFileHandler(TRACE_FILE, maxBytes=TRACE_MAX_BYTES, backupCount=TRACE_BACKUPS)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger = logging.getLogger("qakit.trace")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+    return logger
 
-def display_dependencies():
-    """Display the status of tool dependencies."""
-    print("\nChecking dependencies...")
-    statuses = check_dependencies()
-    for name, status in statuses.items():
-        color = GREEN if status else RED
-        print(f"{color}{name}: {'Installed' if status else 'Not Installed'}{RESET}")
 
+def _close_trace_logger():
+    """Close the trace file so the next record reopens it (at TRACE_FILE as it is then)."""
+    global _trace_logger
+    if _trace_logger is not None:
+        for handler in list(_trace_logger.handlers):
+            _trace_logger.removeHandler(handler)
+            handler.close()
+        _trace_logger = None
 
-def imagemagick_convert():
-    input_file = input("Enter the input image file path: ").strip()
-    output_format = input("Enter the desired output format (e.g., png, jpg): ").strip()
-    output_file = f"{os.path.splitext(input_file)[0]}.{output_format}"
-    run_command(f"convert {input_file} {output_file}")
 
+def _use_cache_dir(cache_dir):
+    """Point every state file kept under the cache directory at cache_dir.
 
-def ffmpeg_compress_video():
-    input_file = input("Enter the input video file path: ").strip()
-    output_file = input("Enter the output video file path: ").strip()
-    run_command(f"ffmpeg -i {input_file} -vcodec libx264 -crf 28 {output_file}")
+    Returns the previous settings, to be restored with _restore_settings().
+    """
+    return _restore_settings(_cache_dir_settings(cache_dir))
 
 
-def imagemagick_resize():
-    input_file = input("Enter the input image file path: ").strip()
-    dimensions = input("Enter the dimensions (e.g., 800x600): ").strip()
-    output_file = input("Enter the output file path: ").strip()
-    run_command(f"convert {input_file} -resize {dimensions} {output_file}")
+def _restore_settings(settings):
+    """Rebind module settings from a {name: value} dict; returns their previous values."""
+    previous = {name: globals()[name] for name in settings}
+    globals().update(settings)
+    _close_trace_logger()
+    return previous
 
 
-def imagemagick_rotate():
-    input_file = input("Enter the input image file path: ").strip()
-    angle = input("Enter the rotation angle (e.g., 90): ").strip()
-    output_file = input("Enter the output file path: ").strip()
-    run_command(f"convert {input_file} -rotate {angle} {output_file}")
+def _children_usage():
+    """resource.getrusage(RUSAGE_CHILDREN), or None where the resource module is unavailable."""
+    try:
+        resource = lazy_import("resource")
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_CHILDREN)
 
 
-def ffmpeg_resize_video():
-    input_file = input("Enter the input video file path: ").strip()
-    dimensions = input("Enter the dimensions (e.g., 1280x720): ").strip()
-    output_file = input("Enter the output file path: ").strip()
-    run_command(f"ffmpeg -i {input_file} -vf scale={dimensions} {output_file}")
+def _rss_kb(maxrss):
+    return maxrss // 1024 if sys.platform == "darwin" else maxrss
 
 
-def ffmpeg_extract_audio():
-    input_file = input("Enter the input video file path: ").strip()
-    output_file = input("Enter the output audio file path: ").strip()
-    run_command(f"ffmpeg -i {input_file} -q:a 0 -map a {output_file}")
+def trace_command(command, started_at, spawn_s, wall_s, returncode, usage_before=None, usage=None,
+                  output_bytes=None, pid=None):
+    """Record a finished subprocess.
 
+    usage is the child's own rusage when known (from wait4); otherwise CPU
+    times are the RUSAGE_CHILDREN delta since usage_before, which also includes
+    any other children reaped concurrently. Peak RSS is only recorded from the
+    child's own rusage: RUSAGE_CHILDREN's is the peak of every child so far.
+    """
+    user_s = sys_s = max_rss_kb = None
+    if usage is None and usage_before is not None:
+        after = _children_usage()
+        if after is not None:
+            user_s = after.ru_utime - usage_before.ru_utime
+            sys_s = after.ru_stime - usage_before.ru_stime
+    elif usage is not None:
+        user_s, sys_s, max_rss_kb = usage.ru_utime, usage.ru_stime, _rss_kb(usage.ru_maxrss)
+    threading = lazy_import("threading")
+    record_trace({
+        "type": "command",
+        "name": os.path.basename(str(command[0] if isinstance(command, (list, tuple)) else command.split()[0])),
+        "command": command if isinstance(command, str) else shell_join([str(arg) for arg in command]),
+        "ts": round(started_at, 6),
+        "qakit_pid": os.getpid(),
+        "thread": threading.current_thread().name,
+        "pid": pid,
+        "spawn_ms": round(spawn_s * 1000, 3) if spawn_s is not None else None,
+        "wall_s": round(wall_s, 6),
+        "user_s": round(user_s, 6) if user_s is not None else None,
+        "sys_s": round(sys_s, 6) if sys_s is not None else None,
+        "max_rss_kb": max_rss_kb,
+        "output_bytes": output_bytes,
+        "returncode": returncode,
+    })
 
-def ffmpeg_set_green_background():
-    input_file = input("Enter the input video file path: ").strip()
-    color = input("Enter the color to replace (e.g., black): ").strip()
-    output_file = input("Enter the output video file path: ").strip()
-    run_command(f"ffmpeg -i {input_file} -vf chromakey={color}:similarity=0.2:blend=0.0 {output_file}")
 
+def _read_pipe(pipe, chunks):
+    chunks.append(pipe.read())
 
-def nwtest_multicast():
-    address = input("Enter the multicast address to test: ").strip()
-    duration = input("Enter the duration for the test (seconds): ").strip()
-    run_command(f"nwtest -cs1 {address} -n {duration}")
 
+def _wait_with_usage(process, timeout=None):
+    """Reap process with os.wait4(), killing it after timeout seconds.
 
-def check_connection():
-    target = input("Enter the IP or domain to ping: ").strip()
-    run_command(f"ping -c 4 {target}")
+    Returns (usage, timed_out); usage is None where wait4 is unavailable and
+    the child was reaped with process.wait() instead. The child is only
+    killed while waitid(WNOWAIT) says it has not exited, so the kill can never
+    hit a pid that has already been reaped and reused.
+    """
+    if not (hasattr(os, "wait4") and hasattr(os, "waitid")):
+        try:
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+            return None, True
+        return None, False
+    signal = lazy_import("signal")
+    threading = lazy_import("threading")
+    lock = threading.Lock()
+    state = {"exited": False, "timed_out": False}
 
+    def expire():
+        with lock:
+            if not state["exited"]:
+                state["timed_out"] = True
+                os.kill(process.pid, signal.SIGKILL)
 
-def download_file():
-    url = input("Enter the file URL: ").strip()
-    output_path = input("Enter the output file path: ").strip()
-    run_command(f"wget -O {output_path} {url}")
+    timer = threading.Timer(timeout, expire) if timeout is not None else None
+    if timer is not None:
+        timer.daemon = True
+        timer.start()
+    os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)
+    with lock:
+        state["exited"] = True
+    if timer is not None:
+        timer.cancel()
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return usage, state["timed_out"]
 
 
-def list_multicast_addresses():
-    run_command("ip maddr show")
+def traced_run(args, timeout=None, **kwargs):
+    """subprocess.run() equivalent that records a trace of the launch.
 
-def stress_test():
-    """Perform an enhanced stress test with a guided interface.
-    
-    Offers:
-      - Simple Mode: Predefined test profiles (Light, Moderate, Heavy)
-      - Advanced Mode: Custom settings for CPU, Memory, and I/O stress
+    Pipes are drained by reader threads while the child is reaped with
+    os.wait4(), so the trace gets the child's own CPU time and peak RSS rather
+    than a RUSAGE_CHILDREN delta shared with concurrent workers.
     """
-    import time  # Ensure time is imported
-    print("\n--- Enhanced Stress Testing ---")
-    
-    # Determine which stress tool is available.
-    stress_tool = None
-    if is_tool_installed("stress-ng"):
-        print(f"{GREEN}Using stress-ng for testing.{RESET}")
-        stress_tool = "stress-ng"
-    elif is_tool_installed("stress"):
-        print(f"{GREEN}Using stress for testing.{RESET}")
-        stress_tool = "stress"
-    else:
-        print(f"{RED}No stress tool found. Please install stress or stress-ng via your package manager.{RESET}")
-        return
+    threading = lazy_import("threading")
+    started_at = time.time()
+    usage_before = _children_usage()
+    start = time.perf_counter()
+    process = subprocess.Popen(args, **kwargs)
+    spawn_s = time.perf_counter() - start
+    with process:
+        outputs = {}
+        readers = []
+        for name in ("stdout", "stderr"):
+            pipe = getattr(process, name)
+            if pipe is not None:
+                outputs[name] = []
+                readers.append(threading.Thread(target=_read_pipe, args=(pipe, outputs[name]), daemon=True))
+        for reader in readers:
+            reader.start()
+        usage, timed_out = _wait_with_usage(process, timeout)
+        for reader in readers:
+            reader.join()
+        stdout = outputs["stdout"][0] if "stdout" in outputs else None
+        stderr = outputs["stderr"][0] if "stderr" in outputs else None
+    output_bytes = len(stdout or "") + len(stderr or "")
+    if timed_out:
+        trace_command(args, started_at, spawn_s, time.perf_counter() - start, None, usage_before, usage,
+                      output_bytes=output_bytes, pid=process.pid)
+        raise subprocess.TimeoutExpired(process.args, timeout, output=stdout, stderr=stderr)
+    trace_command(args, started_at, spawn_s, time.perf_counter() - start, process.returncode, usage_before, usage,
+                  output_bytes=output_bytes, pid=process.pid)
+    return subprocess.CompletedProcess(process.args, process.returncode, stdout, stderr)
 
-    # Attempt to import psutil for monitoring.
+
+def traced_action(kind, name, func, *args, **kwargs):
+    """Call func, recording a trace span for a menu action or subcommand."""
+    started_at = time.time()
+    usage_before = _children_usage()
+    start = time.perf_counter()
+    result = None
     try:
-        import psutil
-    except ImportError:
-        print(f"{RED}psutil module not installed. For monitoring, install it via 'pip install psutil'.{RESET}")
-        psutil = None
+        result = func(*args, **kwargs)
+        return result
+    finally:
+        after = _children_usage()
+        threading = lazy_import("threading")
+        returncode = result[0] if isinstance(result, tuple) and result and isinstance(result[0], int) else (
+            result if isinstance(result, int) and not isinstance(result, bool) else None)
+        record_trace({
+            "type": kind,
+            "name": name,
+            "ts": round(started_at, 6),
+            "qakit_pid": os.getpid(),
+            "thread": threading.current_thread().name,
+            "wall_s": round(time.perf_counter() - start, 6),
+            "children_user_s": round(after.ru_utime - usage_before.ru_utime, 6) if after else None,
+            "children_sys_s": round(after.ru_stime - usage_before.ru_stime, 6) if after else None,
+            "returncode": returncode,
+        })
 
-    # Ask if the user wants to use advanced options.
-    print("\nFor most users, we recommend using the Simple Mode which uses predefined test profiles.")
-    print("If you are familiar with CPU and Memory settings and want to customize them, choose Advanced Mode.")
-    adv_choice = input("Do you want to use advanced options? (y/n): ").strip().lower()
-    if adv_choice not in ("y", "n"):
-        print("Invalid choice, defaulting to Simple Mode.")
-        adv_choice = "n"
 
-    # Initialize parameters.
-    cpu_workers = 0
-    vm_workers = 0
-    vm_bytes = ""
-    io_workers = 0
-    duration = 0
+def load_trace(path=None):
+    """Read trace records from the trace file and its rotated backups, oldest first."""
+    path = path or TRACE_FILE
+    records = []
+    for candidate in [f"{path}.{index}" for index in range(TRACE_BACKUPS, 0, -1)] + [path]:
+        try:
+            with open(candidate, "r") as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        continue
+        except OSError:
+            continue
+    records.sort(key=lambda record: record.get("ts", 0))
+    return records
 
-    if adv_choice == "y":
-        # Advanced Mode: present detailed options.
-        print("\nSelect the type of stress test you want to run:")
-        print(" 1. CPU Stress only")
-        print(" 2. Memory Stress only")
-        print(" 3. I/O Stress only")
-        print(" 4. Combined Stress (CPU + Memory + I/O)")
-        
-        while True:
-            test_type = input("Enter your choice (1-4): ").strip()
-            if test_type in ("1", "2", "3", "4"):
-                break
-            print("Invalid choice. Please enter a number between 1 and 4.")
 
-        def get_int_input(prompt):
-            while True:
-                value = input(prompt).strip()
-                try:
-                    return int(value)
-                except ValueError:
-                    print("Invalid input. Please enter a valid integer.")
+def export_chrome_trace(records, output_file):
+    """Write trace records as Chrome trace-event JSON (open in chrome://tracing or Perfetto)."""
+    events = []
+    thread_ids = {}
+    for record in records:
+        tid = thread_ids.setdefault((record.get("qakit_pid"), record.get("thread")), len(thread_ids) + 1)
+        args = {key: value for key, value in record.items() if key not in ("ts", "wall_s", "name", "type")}
+        events.append({
+            "name": record.get("name", "?"),
+            "cat": record.get("type", "command"),
+            "ph": "X",
+            "ts": int(record.get("ts", 0) * 1e6),
+            "dur": max(1, int(record.get("wall_s", 0) * 1e6)),
+            "pid": record.get("qakit_pid", 0),
+            "tid": tid,
+            "args": args,
+        })
+    for (pid, thread), tid in thread_ids.items():
+        events.append({"name": "thread_name", "ph": "M", "pid": pid or 0, "tid": tid, "args": {"name": thread}})
+    with open(output_file, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    return len(events)
 
-        if test_type == "1":
-            print("\n--- CPU Stress ---")
-            cpu_workers = get_int_input("Enter the number of CPU workers (e.g., 4): ")
-            duration = get_int_input("Enter the test duration in seconds (e.g., 60): ")
-        elif test_type == "2":
-            print("\n--- Memory Stress ---")
-            print("Memory stress simulates heavy memory usage by launching processes (called 'workers') that allocate memory.")
-            print("For most systems, 1 or 2 workers is sufficient. If you're unsure, use a low number.")
-            vm_workers = get_int_input("Enter the number of memory workers (try 1 or 2): ")
-            vm_bytes = input("Enter the memory allocation per worker (e.g., 256M for 256 MB or 1G for 1 GB): ").strip()
-            duration = get_int_input("Enter the test duration in seconds (e.g., 60): ")
-        elif test_type == "3":
-            print("\n--- I/O Stress ---")
-            io_workers = get_int_input("Enter the number of I/O workers (e.g., 1 or 2): ")
-            duration = get_int_input("Enter the test duration in seconds (e.g., 60): ")
-        elif test_type == "4":
-            print("\n--- Combined Stress (CPU + Memory + I/O) ---")
-            cpu_workers = get_int_input("Enter the number of CPU workers (e.g., 2): ")
-            print("Memory stress: A 'worker' allocates memory. Usually 1 or 2 is enough.")
-            vm_workers = get_int_input("Enter the number of memory workers (e.g., 1 or 2): ")
-            vm_bytes = input("Enter the memory allocation per worker (e.g., 256M): ").strip()
-            io_workers = get_int_input("Enter the number of I/O workers (e.g., 1 or 2): ")
-            duration = get_int_input("Enter the test duration in seconds (e.g., 60): ")
-    else:
-        # Simple Mode: Predefined Profiles.
-        print("\n--- Simple Mode: Predefined Test Profiles ---")
-        print("Choose a stress test intensity:")
-        print(" 1. Light    - Basic test with low load")
-        print(" 2. Moderate - Standard test with moderate load")
-        print(" 3. Heavy    - Maximum load for intensive testing")
-        while True:
-            profile = input("Enter your choice (1-3): ").strip()
-            if profile in ("1", "2", "3"):
-                break
-            print("Invalid choice. Please enter 1, 2, or 3.")
-        if profile == "1":
-            cpu_workers, vm_workers, io_workers, default_duration, vm_bytes = 2, 1, 1, 30, "256M"
-        elif profile == "2":
-            cpu_workers, vm_workers, io_workers, default_duration, vm_bytes = 4, 2, 2, 60, "512M"
-        elif profile == "3":
-            cpu_workers, vm_workers, io_workers, default_duration, vm_bytes = 8, 4, 4, 120, "1G"
-        # Allow the user to override the default duration.
-        override = input(f"Default test duration is {default_duration} seconds. Would you like to change it? (y/n): ").strip().lower()
-        if override == 'y':
-            try:
-                duration = int(input("Enter desired duration in seconds: ").strip())
-            except ValueError:
-                print("Invalid input. Using default duration.")
-                duration = default_duration
-        else:
-            duration = default_duration
 
-    # Ask if the user wants to log resource usage.
-    log_file = None
-    while True:
-        log_choice = input("\nDo you want to log resource usage to a file? (y/n): ").strip().lower()
-        if log_choice in ("y", "n"):
-            break
-        print("Please enter 'y' or 'n'.")
-    if log_choice == "y":
-        log_file = input("Enter the full path for the log file (e.g., /home/user/stress_log.txt): ").strip()
-        try:
-            with open(log_file, "w") as f:
-                f.write("TimeElapsed(s),CPU(%),Memory(%)\n")
-        except Exception as e:
-            print(f"{RED}Could not open log file: {e}{RESET}")
-            log_file = None
+def print_trace_summary(records):
+    """Print per-tool totals (count, wall time, CPU time, peak RSS, failures) from trace records."""
+    totals = {}
+    for record in records:
+        if record.get("type") != "command":
+            continue
+        entry = totals.setdefault(record["name"], {"count": 0, "wall": 0.0, "cpu": 0.0, "rss": 0, "failed": 0,
+                                                   "spawn": 0.0})
+        entry["count"] += 1
+        entry["wall"] += record.get("wall_s") or 0.0
+        entry["cpu"] += (record.get("user_s") or 0.0) + (record.get("sys_s") or 0.0)
+        entry["rss"] = max(entry["rss"], record.get("max_rss_kb") or 0)
+        entry["spawn"] += record.get("spawn_ms") or 0.0
+        entry["failed"] += 1 if record.get("returncode") not in (0, None) else 0
+    print(f"{'Tool':<16}{'Runs':>7}{'Wall(s)':>11}{'CPU(s)':>10}{'Spawn(ms)':>11}{'MaxRSS(MB)':>12}{'Failed':>8}")
+    for name, entry in sorted(totals.items(), key=lambda item: -item[1]["wall"]):
+        print(f"{name:<16}{entry['count']:>7}{entry['wall']:>11.2f}{entry['cpu']:>10.2f}"
+              f"{entry['spawn'] / entry['count']:>11.2f}{entry['rss'] / 1024:>12.1f}{entry['failed']:>8}")
 
-    # Ask if CPU usage alerts should be set.
-    threshold = None
-    if psutil:
-        while True:
-            threshold_choice = input("\nWould you like to set a CPU usage threshold alert? (y/n): ").strip().lower()
-            if threshold_choice in ("y", "n"):
-                break
-            print("Please enter 'y' or 'n'.")
-        if threshold_choice == "y":
-            while True:
-                try:
-                    threshold = float(input("Enter the CPU usage threshold percentage (e.g., 90): ").strip())
-                    break
-                except ValueError:
-                    print("Invalid input. Please enter a valid number (e.g., 90).")
 
-                       # Build the stress command.
-    cmd_parts = []
-    if stress_tool in ["stress", "stress-ng"]:
-        if cpu_workers > 0:
-            cmd_parts.append(f"--cpu {cpu_workers}")
-        if vm_workers > 0:
-            cmd_parts.append(f"--vm {vm_workers}")
-            if vm_bytes:
-                cmd_parts.append(f"--vm-bytes {vm_bytes}")
-        if io_workers > 0:
-            cmd_parts.append(f"--io {io_workers}")
-        # For stress-ng, use a timeout with an "s" suffix.
-        if stress_tool == "stress-ng":
-            timeout_arg = f"--timeout {duration}s"
-        else:
-            timeout_arg = f"--timeout {duration}"
-        cmd_parts.append(timeout_arg)
-        cmd = f"{stress_tool} " + " ".join(cmd_parts)
-    else:
-        print(f"{RED}Error: No stress tool selected.{RESET}")
-        return
+def _pump_stream(pipe, forward, log, log_lock, tail, tail_lock, label, counts):
+    """Forward a child's pipe chunk by chunk, teeing to the log and keeping a bounded line tail."""
+    partial = b""
+    for chunk in iter(lambda: pipe.read1(65536), b""):
+        counts[label] += len(chunk)
+        forward.write(chunk)
+        forward.flush()
+        if log is not None:
+            with log_lock:
+                log.write(chunk)
+        # Split on both newlines and carriage returns so progress bars (ffmpeg, wget)
+        # become tail lines instead of one ever-growing partial line.
+        lines = (partial + chunk).replace(b"\r", b"\n").split(b"\n")
+        partial = lines.pop()[-4096:]
+        with tail_lock:
+            tail.extend((label, line.decode(errors="replace")) for line in lines if line.strip())
+    if partial.strip():
+        with tail_lock:
+            tail.append((label, partial.decode(errors="replace")))
+    pipe.close()
 
-    print(f"\n{GREEN}Starting stress test with command:{RESET}\n{cmd}\n")
-    
-    # Force the process to run in /tmp:
-    # 1. Change the current working directory.
-    # 2. Update the environment variables TMPDIR and PWD to /tmp.
-    os.chdir("/tmp")
-    env = os.environ.copy()
-    env["TMPDIR"] = "/tmp"
-    env["PWD"] = "/tmp"
-    
-    process = subprocess.Popen(cmd, shell=True, env=env)
 
-    
-    # Launch the stress test.
-    process = subprocess.Popen(cmd, shell=True)
-    start_time = time.time()
+def stream_command(command, log_file=None, tail_lines=None):
+    """Run a command, streaming stdout/stderr live as the child produces them.
 
+    command is an argument list (executed directly) or a string (run through
+    /bin/sh).
+    Both pipes are read concurrently and forwarded immediately (and appended to
+    log_file if given); only the last tail_lines lines are kept in memory.
+    Returns a dict with returncode, wall_time (s), max_rss_kb (None where the
+    platform cannot report it) and tail (list of (stream, line)).
+    """
+    collections = lazy_import("collections")
+    threading = lazy_import("threading")
+    tail = collections.deque(maxlen=tail_lines or COMMAND_TAIL_LINES)
+    tail_lock = threading.Lock()
+    log_lock = threading.Lock()
+    log = open(log_file, "ab") if log_file else None
+    counts = {"stdout": 0, "stderr": 0}
     try:
-        while process.poll() is None:
-            elapsed = time.time() - start_time
-            remaining = max(0, duration - int(elapsed))
-            status_str = f"Elapsed: {int(elapsed)}s, Remaining: {remaining}s"
-            if psutil:
-                cpu_usage = psutil.cpu_percent(interval=0.5)
-                mem_usage = psutil.virtual_memory().percent
-                status_str += f", CPU: {cpu_usage}%, Memory: {mem_usage}%"
-                if threshold is not None and cpu_usage > threshold:
-                    print(f"\n{RED}Alert: CPU usage exceeded {threshold}%!{RESET}")
-            print(status_str, end="\r", flush=True)
-            if log_file and psutil:
-                with open(log_file, "a") as f:
-                    f.write(f"{int(elapsed)},{cpu_usage},{mem_usage}\n")
-            time.sleep(0.5)
-    except KeyboardInterrupt:
-        print(f"\n{RED}Stress test interrupted by user.{RESET}")
-        process.terminate()
-        return
+        started_at = time.time()
+        usage_before = _children_usage()
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            command,
+            shell=isinstance(command, str),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=tool_env()
+        )
+        spawn_s = time.perf_counter() - start
+        pumps = [
+            threading.Thread(target=_pump_stream, daemon=True,
+                             args=(process.stdout, sys.stdout.buffer, log, log_lock, tail, tail_lock, "stdout", counts)),
+            threading.Thread(target=_pump_stream, daemon=True,
+                             args=(process.stderr, sys.stderr.buffer, log, log_lock, tail, tail_lock, "stderr", counts)),
+        ]
+        for pump in pumps:
+            pump.start()
 
-    print("\n" + f"{GREEN}Stress test completed.{RESET}")
-    if psutil:
-        final_cpu = psutil.cpu_percent(interval=1)
-        final_mem = psutil.virtual_memory().percent
-        print(f"Final CPU Usage: {final_cpu}%")
-        print(f"Final Memory Usage: {final_mem}%")
+        max_rss_kb = usage = None
+        if hasattr(os, "wait4"):
+            # wait4() reaps the child and reports the peak RSS of it and its waited-for children.
+            _, status, usage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            max_rss_kb = _rss_kb(usage.ru_maxrss)
+        else:
+            process.wait()
+        for pump in pumps:
+            pump.join()
+        wall_time = time.perf_counter() - start
+        trace_command(command, started_at, spawn_s, wall_time, process.returncode, usage_before, usage,
+                      output_bytes=counts["stdout"] + counts["stderr"], pid=process.pid)
+    finally:
+        if log is not None:
+            log.close()
+    return {"returncode": process.returncode, "wall_time": wall_time, "max_rss_kb": max_rss_kb,
+            "output_bytes": counts["stdout"] + counts["stderr"], "tail": list(tail)}
 
-def adjust_for_linux_version():
-    """
-    If running on Linux, print the distribution and version.
-    You can expand this function to adjust commands or behavior based on the Linux version.
-    """
-    if platform.system() == "Linux":
-        try:
-            import distro  # Requires 'pip install distro' if not already installed
-            distro_name = distro.name()
-            distro_version = distro.version()
-            print(f"{GREEN}Detected Linux distribution: {distro_name} {distro_version}{RESET}")
-            # Example adjustment: warn if using an older version (customize as needed)
-            # if distro.id() == "ubuntu" and tuple(map(int, distro_version.split('.'))) < (18, 4):
-            #     print(f"{RED}Warning: Your Ubuntu version ({distro_version}) might not support all features of this script.{RESET}")
-        except ImportError:
-            # Fallback if 'distro' is not available
-            print(f"{GREEN}Running on Linux, kernel version: {platform.release()}{RESET}")
 
+def shell_join(args):
+    """Quote an argument list into a shell command string (for display and logs)."""
+    return lazy_import("shlex").join(args)
 
-def main_menu():
-    def image_tools_menu():
-        options = {
-            "1": ("Convert an image", imagemagick_convert),
-            "2": ("Resize an image", imagemagick_resize),
-            "3": ("Rotate an image", imagemagick_rotate),
-            "4": ("Back to Main Menu", None),
-        }
-        handle_menu("Image Tools", options)
 
-    def video_tools_menu():
-        options = {
-            "1": ("Compress a video", ffmpeg_compress_video),
-            "2": ("Resize a video", ffmpeg_resize_video),
-            "3": ("Extract audio from a video", ffmpeg_extract_audio),
-            "4": ("Set a video's background to green", ffmpeg_set_green_background),
-            "5": ("Back to Main Menu", None),
-        }
-        handle_menu("Video Tools", options)
+def tool_env():
+    """Environment for launched tools; built once per process rather than per command."""
+    global _tool_env
+    if _tool_env is None:
+        _tool_env = {**os.environ, "LD_LIBRARY_PATH": TOOL_LIBRARY_PATH}
+    return _tool_env
 
-    def network_tools_menu():
-        options = {
-            "1": ("List multicast addresses", list_multicast_addresses),
-            "2": ("Test a multicast address", nwtest_multicast),
-            "3": ("Ping a specific IP or domain", check_connection),
-            "4": ("Download a file", download_file),
-            "5": ("Back to Main Menu", None),
-        }
-        handle_menu("Network Tools", options)
 
-    options = {
-        "1": ("Image Tools", image_tools_menu),
-        "2": ("Video Tools", video_tools_menu),
-        "3": ("Network Tools", network_tools_menu),
-        "4": ("Check for Updates", lambda: update_script() if check_for_updates() else None),
-        "5": ("Create Alias for qakit", create_alias),
-        "6": ("Display Dependencies", display_dependencies),
-        "7": ("Stress Testing", stress_test),
-        "8": ("Exit", None),
-    }
-    handle_menu("Main Menu", options)
+_tool_env = None
 
 
-def handle_menu(title, options):
-    while True:
-        print(f"\n--- {title} ---")
-        for key, (desc, _) in options.items():
-            print(f"{key}. {desc}")
-        choice = input("Enter your choice: ").strip()
-        if choice in options:
-            _, action = options[choice]
-            if action:
-                action()
-            else:
-                break
+def run_command(command, log_file=None):
+    """Runs a command (argument list, or a shell string), streaming its output live, and prints a summary."""
+    try:
+        result = stream_command(command, log_file=log_file or COMMAND_LOG_FILE)
+        command_results.append({"command": command if isinstance(command, str) else shell_join(command),
+                                "returncode": result["returncode"],
+                                "wall_time": round(result["wall_time"], 3), "max_rss_kb": result["max_rss_kb"]})
+        stats = f"{result['wall_time']:.2f}s"
+        if result["max_rss_kb"] is not None:
+            stats += f", peak RSS {result['max_rss_kb'] / 1024:.1f} MB"
+        if result["returncode"] == 0:
+            print(f"{GREEN}Command executed successfully! ({stats}){RESET}")
         else:
-            print(f"{RED}Invalid choice. Please try again.{RESET}")
+            errors = [line for stream, line in result["tail"] if stream == "stderr"]
+            if errors:
+                print(f"{RED}Errors (last {len(errors)} lines):\n" + "\n".join(errors) + RESET)
+            print(f"{RED}Command failed with exit code {result['returncode']} ({stats}). "
+                  f"Please check the errors above.{RESET}")
+        return result["returncode"]
+    except Exception as e:
+        print(f"{RED}Error executing command: {e}{RESET}")
+        return None
 
 
-def version_tuple(version):
-    return tuple(map(int, version.split(".")))
+# Every command run through run_command() in this process; reported by --json.
+command_results = []
 
+# Probe results already resolved in this process, keyed by tool name.
+_probe_results = {}  # (PATH, tool) -> probe result, for this process
 
-def check_for_updates():
-    print("Checking for updates...")
+
+def _load_probe_cache():
+    """Load the on-disk probe cache, returning an empty cache if it is missing or unreadable."""
     try:
-        response = requests.get(GITHUB_REPO_URL, timeout=10)
-        if response.status_code == 200:
-            for line in response.text.splitlines():
-                if "CURRENT_VERSION" in line:
-                    latest_version = line.split('"')[1]
-                    if version_tuple(latest_version) > version_tuple(CURRENT_VERSION):
-                        print(f"{GREEN}A newer version ({latest_version}) is available!{RESET}")
-                        return True
-                    else:
-                        print(f"{GREEN}You are using the latest version.{RESET}")
-                        return False
-    except Exception as e:
-        print(f"{RED}Error checking for updates: {e}{RESET}")
-    return False
+        with open(PROBE_CACHE_FILE, "r") as f:
+            cache = json.load(f)
+        return cache if isinstance(cache, dict) else {}
+    except (OSError, ValueError):
+        return {}
 
 
-def update_script():
-    print("Updating script...")
+def _save_probe_cache(cache):
+    """Write the probe cache to disk. Failures are ignored; the cache is only an optimisation."""
     try:
-        response = requests.get(GITHUB_REPO_URL, timeout=10)
-        if response.status_code == 200:
-            updated_script = response.text
-            try:
-                with open(__file__, "w") as script_file:
-                    script_file.write(updated_script)
-                print(f"{GREEN}Script updated successfully! Please restart.{RESET}")
-                sys.exit()
-            except PermissionError:
-                print(f"{RED}Permission denied. Please run the script with sudo privileges to update.{RESET}")
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_file = f"{PROBE_CACHE_FILE}.{os.getpid()}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(cache, f, indent=2)
+        os.replace(tmp_file, PROBE_CACHE_FILE)
+    except OSError:
+        pass
+
+
+def probe_version(path):
+    """Run '<path> --version' with a timeout and return the first line of output (or None)."""
+    try:
+        result = traced_run(
+            [path, "--version"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            stdin=subprocess.DEVNULL,
+            text=True,
+            errors="replace",
+            timeout=PROBE_TIMEOUT,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    for line in result.stdout.splitlines():
+        if line.strip():
+            return line.strip()
+    return None
+
+
+def probe_tools(tools, refresh=False):
+    """Resolve tools through PATH and probe their versions in parallel.
+
+    Results are cached on disk keyed by binary path and mtime, so a tool is only
+    spawned again when it has been replaced/upgraded (or when refresh=True).
+    Returns a dict of tool -> {"installed": bool, "path": str|None, "version": str|None}.
+    """
+    results = {}
+    to_probe = []
+    cache = _load_probe_cache()
+    cache_dirty = False
+
+    search_path = os.environ.get("PATH", "")
+    for tool in tools:
+        if (search_path, tool) in _probe_results and not refresh:
+            results[tool] = _probe_results[(search_path, tool)]
+            continue
+        path = shutil.which(tool)
+        if path is None:
+            results[tool] = {"installed": False, "path": None, "version": None}
+            continue
+        path = os.path.realpath(path)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            results[tool] = {"installed": False, "path": None, "version": None}
+            continue
+        entry = cache.get(path)
+        if not refresh and entry and entry.get("mtime") == mtime:
+            results[tool] = {"installed": True, "path": path, "version": entry.get("version")}
+        else:
+            to_probe.append((tool, path, mtime))
+
+    if to_probe:
+        futures = lazy_import("concurrent.futures")
+        with futures.ThreadPoolExecutor(max_workers=len(to_probe)) as pool:
+            versions = pool.map(lambda item: probe_version(item[1]), to_probe)
+            for (tool, path, mtime), version in zip(to_probe, versions):
+                results[tool] = {"installed": True, "path": path, "version": version}
+                cache[path] = {"mtime": mtime, "version": version}
+                cache_dirty = True
+
+    if cache_dirty:
+        _save_probe_cache(cache)
+    _probe_results.update(((search_path, tool), result) for tool, result in results.items())
+    return results
+
+
+def is_tool_installed(tool):
+    """Check if a specific tool is installed on the system."""
+    return probe_tools([tool])[tool]["installed"]
+
+
+def check_dependencies(refresh=False):
+    """Check for required tools and their availability."""
+    probes = probe_tools(DEPENDENCY_TOOLS.values(), refresh=refresh)
+    return {name: probes[command]["installed"] for name, command in DEPENDENCY_TOOLS.items()}
+
+
+def display_dependencies(refresh=False):
+    """Display the status of tool dependencies."""
+    print("\nChecking dependencies...")
+    probes = probe_tools(DEPENDENCY_TOOLS.values(), refresh=refresh)
+    for name, command in DEPENDENCY_TOOLS.items():
+        probe = probes[command]
+        if probe["installed"]:
+            version = f" ({probe['version']})" if probe["version"] else ""
+            print(f"{GREEN}{name}: Installed{version}{RESET}")
+        else:
+            print(f"{RED}{name}: Not Installed{RESET}")
+
+
+def imagemagick_convert(input_file=None, output_format=None):
+    if input_file is None:
+        input_file = input("Enter the input image file path: ").strip()
+    if output_format is None:
+        output_format = input("Enter the desired output format (e.g., png, jpg): ").strip()
+    output_file = f"{os.path.splitext(input_file)[0]}.{output_format}"
+    if image_operation_is_noop(media_info(input_file), [], output_format):
+        return _copy_unchanged(input_file, output_file, f"already in {output_format} format")
+    return run_command(["convert", input_file, output_file])
+
+
+def _load_transcode_index():
+    """Load the transcode cache index ({"hashes": {...}, "entries": {...}})."""
+    try:
+        with open(TRANSCODE_CACHE_INDEX, "r") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+    index.setdefault("hashes", {})
+    index.setdefault("entries", {})
+    return index
+
+
+def _save_transcode_index(index):
+    try:
+        os.makedirs(TRANSCODE_CACHE_DIR, exist_ok=True)
+        tmp_file = f"{TRANSCODE_CACHE_INDEX}.{os.getpid()}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_file, TRANSCODE_CACHE_INDEX)
+    except OSError:
+        pass
+
+
+def file_digest(path, index=None):
+    """Return the SHA-256 of a file's contents.
+
+    When an index is given, digests are memoised by path, size and mtime so an
+    unchanged input is not re-read on every run.
+    """
+    hashlib = lazy_import("hashlib")
+    stat = os.stat(path)
+    real_path = os.path.realpath(path)
+    if index is not None:
+        memo = index["hashes"].get(real_path)
+        if memo and memo["size"] == stat.st_size and memo["mtime"] == stat.st_mtime:
+            return memo["sha256"]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    sha256 = digest.hexdigest()
+    if index is not None:
+        index["hashes"][real_path] = {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": sha256}
+    return sha256
+
+
+_FICLONE = 0x40049409  # ioctl from linux/fs.h: share the source's extents copy-on-write
+
+
+def _clone_file(source, destination):
+    """Copy source to destination (replacing it), as a reflink where the filesystem supports one.
+
+    Never a hardlink: the cache and the user's file must not share an inode,
+    or editing one would change the other.
+    """
+    tmp_file = f"{destination}.{os.getpid()}.tmp"
+    try:
+        cloned = False
+        if sys.platform.startswith("linux"):
+            with open(source, "rb") as src, open(tmp_file, "wb") as dst:
+                try:
+                    lazy_import("fcntl").ioctl(dst.fileno(), _FICLONE, src.fileno())
+                    cloned = True
+                except OSError:
+                    pass  # not supported here (or across filesystems)
+        if not cloned:
+            shutil.copyfile(source, tmp_file)
+        os.replace(tmp_file, destination)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+
+def _evict_transcode_cache(index):
+    """Drop least recently used entries until the cache fits TRANSCODE_CACHE_MAX_BYTES."""
+    entries = index["entries"]
+    total = sum(entry["size"] for entry in entries.values())
+    for key in sorted(entries, key=lambda k: entries[k]["last_used"]):
+        if total <= TRANSCODE_CACHE_MAX_BYTES:
+            break
+        total -= entries[key]["size"]
+        try:
+            os.remove(os.path.join(TRANSCODE_CACHE_DIR, entries[key]["file"]))
+        except OSError:
+            pass
+        del entries[key]
+
+
+def cached_transcode(input_file, ffmpeg_args, output_file, runner=None):
+    """Run 'ffmpeg -i input_file <ffmpeg_args> output_file' through the transcode cache.
+
+    The cache key is the input's content hash plus the full argument list and
+    output container, so a hit is only returned for an identical transcode.
+    runner (default run_command) executes the argument list and returns its
+    exit code. Returns the ffmpeg exit code (0 for a cache hit).
+    """
+    runner = runner or run_command
+    command = ["ffmpeg", "-y", "-i", input_file, *ffmpeg_args, output_file]
+    output_ext = os.path.splitext(output_file)[1].lower()
+    index = _load_transcode_index()
+    try:
+        input_hash = file_digest(input_file, index)
+    except OSError:
+        # Let ffmpeg report the missing/unreadable input as usual.
+        return runner(command)
+
+    hashlib = lazy_import("hashlib")
+    key = hashlib.sha256(json.dumps([input_hash, list(ffmpeg_args), output_ext]).encode()).hexdigest()
+    entry = index["entries"].get(key)
+    if entry:
+        cached_file = os.path.join(TRANSCODE_CACHE_DIR, entry["file"])
+        try:
+            _clone_file(cached_file, output_file)
+            entry["last_used"] = time.time()
+            _save_transcode_index(index)
+            print(f"{GREEN}Cache hit: reused a previous transcode for {output_file}.{RESET}")
+            return 0
+        except OSError:
+            del index["entries"][key]
+
+    # Outputs materialised from the cache by older versions were hardlinks to the
+    # cached artifact; detach them so ffmpeg cannot overwrite it in place.
+    try:
+        if os.stat(output_file).st_nlink > 1:
+            os.remove(output_file)
+    except OSError:
+        pass
+
+    returncode = runner(command)
+    if returncode == 0 and os.path.isfile(output_file):
+        cache_name = f"{key}{output_ext}"
+        try:
+            os.makedirs(TRANSCODE_CACHE_DIR, exist_ok=True)
+            _clone_file(output_file, os.path.join(TRANSCODE_CACHE_DIR, cache_name))
+            index["entries"][key] = {"file": cache_name, "size": os.path.getsize(output_file),
+                                     "last_used": time.time()}
+            _evict_transcode_cache(index)
+        except OSError as e:
+            print(f"{RED}Could not store the result in the transcode cache: {e}{RESET}")
+    _save_transcode_index(index)
+    return returncode
+
+
+def clear_transcode_cache():
+    """Remove every cached transcode."""
+    shutil.rmtree(TRANSCODE_CACHE_DIR, ignore_errors=True)
+    print(f"{GREEN}Transcode cache cleared.{RESET}")
+
+
+def display_transcode_cache():
+    """Print the transcode cache size and entry count."""
+    index = _load_transcode_index()
+    total = sum(entry["size"] for entry in index["entries"].values())
+    print(f"Transcode cache: {TRANSCODE_CACHE_DIR}")
+    print(f"Entries: {len(index['entries'])}, size: {total / (1024 * 1024):.1f} MB "
+          f"of {TRANSCODE_CACHE_MAX_BYTES / (1024 * 1024):.0f} MB")
+
+
+def _load_media_index():
+    """Load the media metadata index ({"entries": {real path: {"size", "mtime_ns", "info"}}})."""
+    try:
+        with open(MEDIA_INDEX_FILE, "r") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+    index.setdefault("entries", {})
+    return index
+
+
+def _save_media_index(index):
+    try:
+        os.makedirs(os.path.dirname(MEDIA_INDEX_FILE), exist_ok=True)
+        tmp_file = f"{MEDIA_INDEX_FILE}.{os.getpid()}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_file, MEDIA_INDEX_FILE)
+    except OSError:
+        pass
+
+
+def _probe_image(path):
+    """Format and size of an image via 'identify -ping' (reads headers only), or None."""
+    try:
+        result = traced_run(["identify", "-ping", "-format", "%m %w %h\n", path], stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL, stdin=subprocess.DEVNULL, text=True, errors="replace",
+                            env=tool_env(), timeout=PROBE_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    frames = result.stdout.split("\n")
+    fields = frames[0].split() if result.returncode == 0 and frames else []
+    if len(fields) != 3 or not fields[1].isdigit() or not fields[2].isdigit():
+        return None
+    return {"kind": "image", "format": fields[0].lower(), "width": int(fields[1]), "height": int(fields[2]),
+            "frames": sum(1 for frame in frames if frame.strip())}
+
+
+def _x264_crf(path):
+    """CRF from the x264 options string written near the start of an H.264 stream, or None."""
+    re = lazy_import("re")
+    try:
+        with open(path, "rb") as f:
+            head = f.read(1024 * 1024)
+    except OSError:
+        return None
+    match = re.search(rb"x264 - core \d+[^\x00]*? crf=([\d.]+)", head)
+    return float(match.group(1)) if match else None
+
+
+def _probe_video(path):
+    """Container, stream codecs, size and duration of a video via ffprobe, or None."""
+    try:
+        result = traced_run(["ffprobe", "-v", "error", "-print_format", "json", "-show_format", "-show_streams", path],
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, stdin=subprocess.DEVNULL, text=True,
+                            errors="replace", env=tool_env(), timeout=PROBE_TIMEOUT * 6)
+        probe = json.loads(result.stdout) if result.returncode == 0 else None
+    except (OSError, subprocess.TimeoutExpired, ValueError):
+        return None
+    if not probe or "format" not in probe:
+        return None
+    streams = probe.get("streams", [])
+    video = next((stream for stream in streams if stream.get("codec_type") == "video"), {})
+    audio = next((stream for stream in streams if stream.get("codec_type") == "audio"), {})
+    info = {
+        "kind": "video",
+        "container": probe["format"].get("format_name"),
+        "duration": float(probe["format"].get("duration") or 0),
+        "bit_rate": int(probe["format"].get("bit_rate") or 0),
+        "video_codec": video.get("codec_name"),
+        "width": video.get("width"),
+        "height": video.get("height"),
+        "pix_fmt": video.get("pix_fmt"),
+        "audio_codec": audio.get("codec_name"),
+        "crf": None,
+    }
+    if info["video_codec"] == "h264":
+        info["crf"] = _x264_crf(path)
+    return info
+
+
+def media_info(path, index=None, probe=True, refresh=False):
+    """Metadata for an image or video, from the media index when its size and mtime still match.
+
+    On a miss the file is probed (identify for images, ffprobe otherwise) and
+    the result recorded, unless probe=False. When no index is passed the
+    on-disk index is loaded and saved. Returns a dict, or None if unknown.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    own_index = index is None
+    if own_index:
+        index = _load_media_index()
+    key = os.path.realpath(path)
+    entry = index["entries"].get(key)
+    if entry and not refresh and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+        return entry["info"]
+    if not probe:
+        return None
+    info = _probe_image(path) if path.lower().endswith(IMAGE_EXTENSIONS) else _probe_video(path)
+    index["entries"][key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "info": info}
+    if own_index:
+        _save_media_index(index)
+    return info
+
+
+def scan_media(source, workers=None, refresh=False):
+    """Index every image and video under a directory (recursively), glob or file ahead of use.
+
+    Probes run concurrently; files whose size and mtime are unchanged are not
+    re-probed unless refresh=True. Returns a summary dict.
+    """
+    extensions = IMAGE_EXTENSIONS + VIDEO_EXTENSIONS
+    if os.path.isdir(source):
+        files = sorted(os.path.join(root, name) for root, _, names in os.walk(source)
+                       for name in names if name.lower().endswith(extensions))
+    else:
+        files = [path for path in collect_input_files(source, extensions) if path.lower().endswith(extensions)]
+    index = _load_media_index()
+    before = dict(index["entries"])
+    summary = {"files": len(files), "images": 0, "videos": 0, "unreadable": 0, "probed": 0, "elapsed": 0.0}
+    start = time.perf_counter()
+    futures = lazy_import("concurrent.futures")
+    with futures.ThreadPoolExecutor(max_workers=max(1, workers or os.cpu_count() or 1)) as pool:
+        infos = pool.map(lambda path: media_info(path, index, refresh=refresh), files)
+        for path, info in zip(files, infos):
+            if info is None:
+                summary["unreadable"] += 1
+            else:
+                summary["images" if info["kind"] == "image" else "videos"] += 1
+    summary["probed"] = sum(1 for path in files
+                            if index["entries"].get(os.path.realpath(path)) is not before.get(os.path.realpath(path)))
+    # Forget files that have been deleted since they were indexed.
+    for key in [key for key in index["entries"] if not os.path.exists(key)]:
+        del index["entries"][key]
+    _save_media_index(index)
+    summary["elapsed"] = time.perf_counter() - start
+    print(f"{GREEN}Indexed {summary['files']} file(s): {summary['images']} image(s), {summary['videos']} video(s), "
+          f"{summary['unreadable']} unreadable; {summary['probed']} probed in {summary['elapsed']:.2f}s.{RESET}")
+    return summary
+
+
+_IMAGE_FORMAT_ALIASES = {"jpg": "jpeg", "jpe": "jpeg", "tif": "tiff"}
+
+
+def image_resize_is_noop(info, geometry):
+    """True if 'convert -resize geometry' would leave an image with this info at its current size."""
+    re = lazy_import("re")
+    match = re.fullmatch(r"(\d*)(?:x(\d*))?([%!>]?)", geometry.strip())
+    if not info or not match or not any(match.group(1, 2)):
+        return False
+    width, height, flag = match.groups()
+    if flag == "%":
+        return width in ("", "100") and height in (None, "", "100")
+    width, height = int(width) if width else None, int(height) if height else None
+    fits = (width is None or info["width"] <= width) and (height is None or info["height"] <= height)
+    if flag == ">":
+        return fits
+    if flag == "!":
+        return width in (None, info["width"]) and height in (None, info["height"])
+    # Plain geometry scales to fit the box keeping the aspect ratio: a no-op when one side already touches it.
+    return fits and (width == info["width"] or height == info["height"])
+
+
+def image_operation_is_noop(info, convert_args, output_ext=None):
+    """True if convert_args (pairs of -resize/-rotate options) and the output format would not change the image."""
+    if not info or info.get("kind") != "image":
+        return False
+    if output_ext and _IMAGE_FORMAT_ALIASES.get(output_ext.lower(), output_ext.lower()) != info["format"]:
+        return False
+    for option, value in zip(convert_args[::2], convert_args[1::2]):
+        if option == "-resize" and image_resize_is_noop(info, value):
+            continue
+        if option == "-rotate":
+            try:
+                if float(value) % 360 == 0:
+                    continue
+            except ValueError:
+                pass
+        return False
+    return len(convert_args) % 2 == 0
+
+
+def _copy_unchanged(input_file, output_file, reason):
+    """Copy input_file to output_file in place of a no-op re-encode. Returns 0 (or None on error).
+
+    reason completes the message "<input_file> is ...".
+    """
+    try:
+        if os.path.abspath(input_file) != os.path.abspath(output_file):
+            shutil.copy2(input_file, output_file)
+    except OSError as e:
+        print(f"{RED}Could not copy {input_file}: {e}{RESET}")
+        return None
+    print(f"{GREEN}{input_file} is {reason}; copied it instead of re-encoding.{RESET}")
+    return 0
+
+
+def ffmpeg_threads(info):
+    """ffmpeg thread count for an encode: about one per 0.3 Mpixel of frame, within the CPU count (None if unknown)."""
+    if not info or not info.get("width") or not info.get("height"):
+        return None
+    return max(1, min(os.cpu_count() or 1, 16, round(info["width"] * info["height"] / 300000)))
+
+
+def _with_threads(ffmpeg_args, info):
+    threads = ffmpeg_threads(info)
+    return ffmpeg_args + ["-threads", str(threads)] if threads else ffmpeg_args
+
+
+# Audio codecs that can be stream-copied into a file with the given extension.
+_AUDIO_COPY_EXTENSIONS = {"mp3": ("mp3",), "aac": ("aac", "m4a"), "opus": ("opus", "ogg"),
+                          "vorbis": ("ogg",), "flac": ("flac",), "pcm_s16le": ("wav",)}
+
+
+def ffmpeg_compress_video(input_file=None, output_file=None):
+    if input_file is None:
+        input_file = input("Enter the input video file path: ").strip()
+    if output_file is None:
+        output_file = input("Enter the output video file path: ").strip()
+    info = media_info(input_file)
+    if info and info.get("video_codec") == "h264" and (info.get("crf") or 0) >= VIDEO_COMPRESS_CRF:
+        # Already x264 at this CRF or coarser: re-encoding would only lose quality, so remux.
+        print(f"{GREEN}{input_file} is already H.264 at CRF {info['crf']:g}; remuxing without re-encoding.{RESET}")
+        return cached_transcode(input_file, ["-c", "copy"], output_file)
+    return cached_transcode(input_file, _with_threads(["-vcodec", "libx264", "-crf", str(VIDEO_COMPRESS_CRF)], info),
+                            output_file)
+
+
+def imagemagick_resize(input_file=None, dimensions=None, output_file=None):
+    if input_file is None:
+        input_file = input("Enter the input image file path: ").strip()
+    if dimensions is None:
+        dimensions = input("Enter the dimensions (e.g., 800x600): ").strip()
+    if output_file is None:
+        output_file = input("Enter the output file path: ").strip()
+    if image_operation_is_noop(media_info(input_file), ["-resize", dimensions], os.path.splitext(output_file)[1][1:]):
+        return _copy_unchanged(input_file, output_file, f"already within {dimensions}")
+    return run_command(["convert", input_file, "-resize", dimensions, output_file])
+
+
+def imagemagick_rotate(input_file=None, angle=None, output_file=None):
+    if input_file is None:
+        input_file = input("Enter the input image file path: ").strip()
+    if angle is None:
+        angle = input("Enter the rotation angle (e.g., 90): ").strip()
+    if output_file is None:
+        output_file = input("Enter the output file path: ").strip()
+    if image_operation_is_noop(media_info(input_file), ["-rotate", str(angle)], os.path.splitext(output_file)[1][1:]):
+        return _copy_unchanged(input_file, output_file, f"unchanged by a {angle} degree rotation")
+    return run_command(["convert", input_file, "-rotate", str(angle), output_file])
+
+
+def collect_input_files(source, extensions):
+    """Expand a directory, glob pattern or single file into a sorted list of input files."""
+    if os.path.isdir(source):
+        return sorted(
+            os.path.join(source, name) for name in os.listdir(source)
+            if name.lower().endswith(extensions) and os.path.isfile(os.path.join(source, name))
+        )
+    if os.path.isfile(source):
+        return [source]
+    glob = lazy_import("glob")
+    return sorted(path for path in glob.glob(source, recursive=True) if os.path.isfile(path))
+
+
+def parse_image_operation(spec):
+    """Parse an operation spec such as 'convert:png', 'resize:800x600' or 'rotate:90'.
+
+    Returns (convert arguments, output extension or None to keep the input's).
+    """
+    operation, _, value = spec.partition(":")
+    operation, value = operation.strip().lower(), value.strip()
+    if not value:
+        raise ValueError(f"Operation '{spec}' is missing a value (e.g. resize:800x600).")
+    if operation == "convert":
+        return [], value.lstrip(".")
+    if operation == "resize":
+        return ["-resize", value], None
+    if operation == "rotate":
+        return ["-rotate", value], None
+    raise ValueError(f"Unknown image operation '{operation}'. Use convert, resize or rotate.")
+
+
+def is_output_fresh(input_file, output_file):
+    """True if output_file exists and is at least as new as input_file."""
+    try:
+        return os.path.getmtime(output_file) >= os.path.getmtime(input_file)
+    except OSError:
+        return False
+
+
+def _run_convert_job(input_file, convert_args, output_file, copy=False):
+    """Run one 'convert' job (or copy the input when copy=True). Returns (input_file, error message or None)."""
+    if copy:
+        try:
+            shutil.copy2(input_file, output_file)
+        except OSError as e:
+            return input_file, str(e)
+        return input_file, None
+    try:
+        result = traced_run(
+            ["convert", input_file, *convert_args, output_file],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            stdin=subprocess.DEVNULL,
+            text=True,
+            errors="replace",
+            env=tool_env(),
+        )
+    except OSError as e:
+        return input_file, str(e)
+    if result.returncode != 0:
+        return input_file, result.stderr.strip() or f"exit code {result.returncode}"
+    return input_file, None
+
+
+def imagemagick_batch(source, operation, output_dir, workers=None, force=False):
+    """Apply one ImageMagick operation to every image in a directory or glob.
+
+    Jobs are fanned out over a bounded pool (default: one worker per CPU), each
+    worker driving its own 'convert' process. Outputs newer than their inputs
+    are skipped unless force=True, and images the media index (see scan_media())
+    shows the operation would not change are copied instead of re-encoded.
+    Returns a summary dict.
+    """
+    convert_args, output_ext = parse_image_operation(operation)
+    input_files = collect_input_files(source, IMAGE_EXTENSIONS)
+    summary = {"total": len(input_files), "processed": 0, "skipped": 0, "unchanged": 0, "failed": 0,
+               "failures": [], "elapsed": 0.0, "files_per_second": 0.0}
+    if not input_files:
+        print(f"{RED}No input images found for '{source}'.{RESET}")
+        return summary
+
+    os.makedirs(output_dir, exist_ok=True)
+    media_index = _load_media_index()
+    outputs = {}
+    for input_file in input_files:
+        stem, ext = os.path.splitext(os.path.basename(input_file))
+        output_file = os.path.join(output_dir, f"{stem}.{output_ext}" if output_ext else f"{stem}{ext}")
+        outputs.setdefault(os.path.normcase(os.path.abspath(output_file)), []).append((input_file, output_file))
+    jobs = []
+    for claimants in outputs.values():
+        if len(claimants) > 1:
+            # e.g. a.png and a.jpg under convert:webp, or x/a.png and y/a.png from a recursive glob:
+            # converting both would leave whichever finished last, so neither is written.
+            output_file = claimants[0][1]
+            for input_file, _ in claimants:
+                others = ", ".join(other for other, _ in claimants if other != input_file)
+                summary["failed"] += 1
+                summary["failures"].append((input_file, f"output {output_file} would also be written by {others}"))
+            continue
+        input_file, output_file = claimants[0]
+        if not force and is_output_fresh(input_file, output_file):
+            summary["skipped"] += 1
+            continue
+        # Only already-indexed images are checked: probing each one would cost as much as converting it.
+        copy = image_operation_is_noop(media_info(input_file, media_index, probe=False), convert_args, output_ext)
+        summary["unchanged"] += copy
+        jobs.append((input_file, output_file, copy))
+
+    workers = max(1, workers or os.cpu_count() or 1)
+    print(f"Processing {len(jobs)} image(s) with {min(workers, max(1, len(jobs)))} worker(s), "
+          f"{summary['skipped']} up to date...")
+    start = time.perf_counter()
+    if jobs:
+        futures = lazy_import("concurrent.futures")
+        with futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = [pool.submit(_run_convert_job, input_file, convert_args, output_file, copy)
+                       for input_file, output_file, copy in jobs]
+            for done, future in enumerate(futures.as_completed(pending), 1):
+                input_file, error = future.result()
+                if error:
+                    summary["failed"] += 1
+                    summary["failures"].append((input_file, error))
+                else:
+                    summary["processed"] += 1
+                print(f"Progress: {done}/{len(jobs)}", end="\r", flush=True)
+        print()
+    summary["elapsed"] = time.perf_counter() - start
+    if summary["elapsed"] > 0:
+        summary["files_per_second"] = summary["processed"] / summary["elapsed"]
+
+    for input_file, error in summary["failures"]:
+        print(f"{RED}Failed: {input_file}: {error}{RESET}")
+    color = RED if summary["failed"] else GREEN
+    print(f"{color}Batch complete: {summary['processed']} processed ({summary['unchanged']} copied unchanged), "
+          f"{summary['skipped']} skipped, "
+          f"{summary['failed']} failed in {summary['elapsed']:.2f}s "
+          f"({summary['files_per_second']:.1f} files/s).{RESET}")
+    return summary
+
+
+def imagemagick_batch_menu():
+    source = input("Enter the input directory or glob (e.g., ./assets/*.jpg): ").strip()
+    operation = input("Enter the operation (convert:png, resize:800x600 or rotate:90): ").strip()
+    output_dir = input("Enter the output directory: ").strip()
+    try:
+        imagemagick_batch(source, operation, output_dir)
+    except ValueError as e:
+        print(f"{RED}{e}{RESET}")
+
+
+def ffmpeg_resize_video(input_file=None, dimensions=None, output_file=None):
+    if input_file is None:
+        input_file = input("Enter the input video file path: ").strip()
+    if dimensions is None:
+        dimensions = input("Enter the dimensions (e.g., 1280x720): ").strip()
+    if output_file is None:
+        output_file = input("Enter the output file path: ").strip()
+    info = media_info(input_file)
+    if info and info.get("width") and dimensions.replace(":", "x") == f"{info['width']}x{info['height']}":
+        print(f"{GREEN}{input_file} is already {dimensions}; copying the streams without re-encoding.{RESET}")
+        return cached_transcode(input_file, ["-c", "copy"], output_file)
+    return cached_transcode(input_file, _with_threads(["-vf", f"scale={dimensions}"], info), output_file)
+
+
+def ffmpeg_extract_audio(input_file=None, output_file=None):
+    if input_file is None:
+        input_file = input("Enter the input video file path: ").strip()
+    if output_file is None:
+        output_file = input("Enter the output audio file path: ").strip()
+    info = media_info(input_file)
+    output_ext = os.path.splitext(output_file)[1][1:].lower()
+    if info and output_ext in _AUDIO_COPY_EXTENSIONS.get(info.get("audio_codec"), ()):
+        print(f"{GREEN}The audio is already {info['audio_codec']}; copying it without re-encoding.{RESET}")
+        return cached_transcode(input_file, ["-map", "a", "-c:a", "copy"], output_file)
+    return cached_transcode(input_file, ["-q:a", "0", "-map", "a"], output_file)
+
+
+def ffmpeg_set_green_background(input_file=None, color=None, output_file=None):
+    if input_file is None:
+        input_file = input("Enter the input video file path: ").strip()
+    if color is None:
+        color = input("Enter the color to replace (e.g., black): ").strip()
+    if output_file is None:
+        output_file = input("Enter the output video file path: ").strip()
+    return cached_transcode(input_file, _with_threads(["-vf", f"chromakey={color}:similarity=0.2:blend=0.0"],
+                                                      media_info(input_file)), output_file)
+
+
+def _parse_video_step(step):
+    """Parse a video pipeline step into ("filter", expr), ("codec", args) or ("audio", ext)."""
+    operation, _, value = step.partition(":")
+    operation, value = operation.strip().lower(), value.strip()
+    if operation == "resize" and value:
+        return "filter", f"scale={value}"
+    if operation == "green" and value:
+        return "filter", f"chromakey={value}:similarity=0.2:blend=0.0"
+    if operation == "compress":
+        return "codec", ["-vcodec", "libx264", "-crf", value or "28"]
+    if operation == "extract-audio":
+        return "audio", (value or "mp3").lstrip(".")
+    raise ValueError(f"Unknown video step '{step}'. Use resize:<WxH>, green:<color>, compress[:crf] "
+                     f"or extract-audio[:ext].")
+
+
+def fuse_image_steps(steps):
+    """Fuse image steps into one convert invocation. Returns (convert args, output extension or None)."""
+    convert_args, output_ext = [], None
+    for step in steps:
+        args, ext = parse_image_operation(step)
+        convert_args += args
+        output_ext = ext or output_ext
+    return convert_args, output_ext
+
+
+def fuse_video_steps(steps, threads=None):
+    """Fuse video steps into one ffmpeg invocation.
+
+    Filters are chained into a single -vf filtergraph and codec settings are
+    applied to the same output; extract-audio becomes a second output of the
+    same run rather than a separate pass over an intermediate file. Returns
+    (video args or None when only audio is wanted, audio extension or None).
+    """
+    filters, codec_args, audio_ext = [], [], None
+    for step in steps:
+        kind, value = _parse_video_step(step)
+        if kind == "filter":
+            filters.append(value)
+        elif kind == "codec":
+            codec_args = value
+        else:
+            audio_ext = value
+    video_args = None
+    if filters or codec_args or not audio_ext:
+        video_args = (["-vf", ",".join(filters)] if filters else []) + codec_args
+        if threads:
+            video_args += ["-threads", str(threads)]
+    return video_args, audio_ext
+
+
+def _run_captured(command):
+    """Run a command without streaming (for concurrent jobs). Returns (returncode, last stderr lines)."""
+    try:
+        result = traced_run(command, shell=isinstance(command, str), stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, stdin=subprocess.DEVNULL, text=True, errors="replace",
+                            env=tool_env())
+    except OSError as e:
+        return None, str(e)
+    return result.returncode, "\n".join(result.stderr.strip().splitlines()[-5:])
+
+
+def build_pipeline_job(job, default_cost=None, media_index=None):
+    """Validate a declared job and attach its fused command.
+
+    A job is {"id", "input", "steps": [...], "output", "after": [ids]}; "kind"
+    ("image" or "video") is inferred from the input's extension when missing.
+    With a media_index, jobs reading an existing file (no "after") use its
+    metadata: no-op image jobs become copies and a video job's default cost
+    (its ffmpeg thread count) follows the frame size.
+    """
+    for key in ("id", "input", "steps", "output"):
+        if key not in job:
+            raise ValueError(f"Pipeline job {job.get('id', '?')} is missing '{key}'.")
+    job = dict(job)
+    job.setdefault("after", [])
+    if "kind" not in job:
+        job["kind"] = "image" if job["input"].lower().endswith(IMAGE_EXTENSIONS) else "video"
+    info = None
+    if media_index is not None and not job["after"]:
+        info = media_info(job["input"], media_index, probe=job["kind"] == "video")
+    if job["kind"] == "image":
+        job["cost"] = int(job.get("cost", 1))
+        convert_args, output_ext = fuse_image_steps(job["steps"])
+        job["command"] = ["convert", job["input"], *convert_args, job["output"]]
+        job["copy"] = image_operation_is_noop(info, convert_args,
+                                              output_ext or os.path.splitext(job["output"])[1][1:])
+    elif job["kind"] == "video":
+        job["cost"] = int(job.get("cost", default_cost or ffmpeg_threads(info) or min(4, os.cpu_count() or 1)))
+        video_args, audio_ext = fuse_video_steps(job["steps"], threads=job["cost"])
+        if video_args is None:
+            job["ffmpeg_args"] = None
+            job["command"] = ["ffmpeg", "-y", "-i", job["input"], "-q:a", "0", "-map", "a", job["output"]]
+        else:
+            job["ffmpeg_args"] = video_args
+            parts = ["ffmpeg", "-y", "-i", job["input"], *video_args, job["output"]]
+            if audio_ext:
+                job["audio_output"] = f"{os.path.splitext(job['output'])[0]}.{audio_ext}"
+                parts += ["-q:a", "0", "-map", "a", job["audio_output"]]
+            job["command"] = parts
+    else:
+        raise ValueError(f"Pipeline job {job['id']} has unknown kind '{job['kind']}'.")
+    return job
+
+
+def _run_pipeline_job(job):
+    """Execute one built job. Returns (returncode, error text)."""
+    for output in (job["output"], job.get("audio_output")):
+        if output and os.path.dirname(output):
+            os.makedirs(os.path.dirname(output), exist_ok=True)
+    if job.get("copy"):
+        _, error = _run_convert_job(job["input"], None, job["output"], copy=True)
+        return (None, error) if error else (0, "")
+    if job["kind"] == "video" and job["ffmpeg_args"] is not None and "audio_output" not in job:
+        # Single-output transcodes can be served from the transcode cache.
+        errors = []
+
+        def runner(command):
+            returncode, error = _run_captured(command)
+            errors.append(error)
+            return returncode
+
+        return cached_transcode(job["input"], job["ffmpeg_args"], job["output"], runner=runner), "".join(errors)
+    return _run_captured(job["command"])
+
+
+def run_job_graph(jobs, cpu_budget=None):
+    """Run pipeline jobs concurrently, respecting "after" dependencies and a global CPU budget.
+
+    A job starts once all of its dependencies succeeded and its cost fits in
+    the remaining budget (default: CPU count); jobs whose dependencies failed
+    are skipped. Returns {job id: {"status", "returncode", "error", "elapsed"}}.
+    """
+    ids = [job["id"] for job in jobs]
+    if len(set(ids)) != len(ids):
+        raise ValueError("Pipeline job ids must be unique.")
+    by_id = {job["id"]: job for job in jobs}
+    for job in jobs:
+        missing = [dep for dep in job["after"] if dep not in by_id]
+        if missing:
+            raise ValueError(f"Job {job['id']} depends on unknown job(s): {', '.join(missing)}")
+    # Reject cycles up front (Kahn's algorithm).
+    indegree = {job["id"]: len(job["after"]) for job in jobs}
+    ready = [job_id for job_id, degree in indegree.items() if degree == 0]
+    visited = 0
+    while ready:
+        job_id = ready.pop()
+        visited += 1
+        for job in jobs:
+            if job_id in job["after"]:
+                indegree[job["id"]] -= 1
+                if indegree[job["id"]] == 0:
+                    ready.append(job["id"])
+    if visited != len(jobs):
+        raise ValueError("Pipeline jobs have circular dependencies.")
+
+    budget = max(1, cpu_budget or os.cpu_count() or 1)
+    futures = lazy_import("concurrent.futures")
+    results = {}
+    pending = list(jobs)
+    running = {}
+    available = budget
+    with futures.ThreadPoolExecutor(max_workers=len(jobs) or 1) as pool:
+        while pending or running:
+            for job in list(pending):
+                if any(results.get(dep, {}).get("status") in ("failed", "skipped") for dep in job["after"]):
+                    results[job["id"]] = {"status": "skipped", "returncode": None,
+                                          "error": "a dependency failed", "elapsed": 0.0}
+                    pending.remove(job)
+                    continue
+                if not all(results.get(dep, {}).get("status") == "ok" for dep in job["after"]):
+                    continue
+                cost = min(job["cost"], budget)
+                if cost > available:
+                    continue
+                available -= cost
+                pending.remove(job)
+                future = pool.submit(_run_pipeline_job, job)
+                running[future] = (job, cost, time.perf_counter())
+            if not running:
+                continue
+            done, _ = futures.wait(running, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                job, cost, started = running.pop(future)
+                available += cost
+                returncode, error = future.result()
+                status = "ok" if returncode == 0 else "failed"
+                results[job["id"]] = {"status": status, "returncode": returncode,
+                                      "error": error if status == "failed" else "",
+                                      "elapsed": round(time.perf_counter() - started, 3)}
+                color = GREEN if status == "ok" else RED
+                print(f"{color}[{status}] {job['id']} ({results[job['id']]['elapsed']:.2f}s){RESET}")
+    return results
+
+
+def run_pipeline(jobs, cpu_budget=None):
+    """Build, run and summarise a list of declared pipeline jobs. Returns the results dict."""
+    media_index = _load_media_index()
+    built = [build_pipeline_job(job, media_index=media_index) for job in jobs]
+    _save_media_index(media_index)
+    budget = max(1, cpu_budget or os.cpu_count() or 1)
+    print(f"Running {len(built)} pipeline job(s) with a budget of {budget} CPU(s)...")
+    start = time.perf_counter()
+    results = run_job_graph(built, budget)
+    elapsed = time.perf_counter() - start
+    for job_id, result in results.items():
+        if result["status"] == "failed" and result["error"]:
+            print(f"{RED}{job_id}: {result['error']}{RESET}")
+    counts = {status: sum(1 for r in results.values() if r["status"] == status) for status in ("ok", "failed", "skipped")}
+    color = GREEN if counts["ok"] == len(results) else RED
+    print(f"{color}Pipeline complete: {counts['ok']} ok, {counts['failed']} failed, "
+          f"{counts['skipped']} skipped in {elapsed:.2f}s.{RESET}")
+    return results
+
+
+def pipeline_jobs_for_inputs(source, steps, output_dir):
+    """Declare one job per input file (directory, glob or file) applying the same steps.
+
+    Only inputs the steps apply to are picked up, so 'rotate:90' over a mixed
+    directory processes the images and leaves the videos alone.
+    """
+    extensions, errors = (), []
+    for kind_extensions, fuse in ((IMAGE_EXTENSIONS, fuse_image_steps), (VIDEO_EXTENSIONS, fuse_video_steps)):
+        try:
+            fuse(steps)
+            extensions += kind_extensions
+        except ValueError as e:
+            errors.append(str(e))
+    if not extensions:
+        raise ValueError(" / ".join(errors))
+    input_files = collect_input_files(source, extensions)
+    jobs = []
+    for input_file in input_files:
+        stem, ext = os.path.splitext(os.path.basename(input_file))
+        if input_file.lower().endswith(IMAGE_EXTENSIONS):
+            output_ext = fuse_image_steps(steps)[1]
+        else:
+            video_args, audio_ext = fuse_video_steps(steps)
+            output_ext = audio_ext if video_args is None else None
+        output_file = os.path.join(output_dir, f"{stem}.{output_ext}" if output_ext else f"{stem}{ext}")
+        jobs.append({"id": os.path.relpath(input_file), "input": input_file, "steps": steps, "output": output_file})
+    return jobs
+
+
+def load_pipeline_file(path):
+    """Load declared jobs from a JSON pipeline file ({"jobs": [...]} or a bare list)."""
+    with open(path, "r") as f:
+        data = json.load(f)
+    jobs = data.get("jobs", []) if isinstance(data, dict) else data
+    if not isinstance(jobs, list):
+        raise ValueError(f"{path} does not contain a list of jobs.")
+    return jobs
+
+
+def media_pipeline_menu():
+    print("Steps are applied in order and fused into one command per file, e.g.")
+    print("  images: resize:800x600,rotate:90,convert:png")
+    print("  videos: resize:1280x720,compress,extract-audio")
+    source = input("Enter the input directory, glob or file: ").strip()
+    steps = [step.strip() for step in input("Enter the steps (comma separated): ").split(",") if step.strip()]
+    output_dir = input("Enter the output directory: ").strip()
+    try:
+        jobs = pipeline_jobs_for_inputs(source, steps, output_dir)
+        if not jobs:
+            print(f"{RED}No input files found for '{source}'.{RESET}")
+            return
+        run_pipeline(jobs)
+    except ValueError as e:
+        print(f"{RED}{e}{RESET}")
+
+
+def nwtest_multicast(address=None, duration=None):
+    if address is None:
+        address = input("Enter the multicast address to test: ").strip()
+    if duration is None:
+        duration = input("Enter the duration for the test (seconds): ").strip()
+    return run_command(["nwtest", "-cs1", address, "-n", str(duration)])
+
+
+def check_connection(target=None):
+    if target is None:
+        target = input("Enter the IP or domain to ping: ").strip()
+    return run_command(["ping", "-c", "4", target])
+
+
+def expand_targets(specs, limit=SWEEP_MAX_TARGETS):
+    """Expand hosts, IPs and CIDR ranges (e.g. 10.0.0.0/28) into a de-duplicated target list."""
+    ipaddress = lazy_import("ipaddress")
+    targets = []
+    seen = set()
+    for spec in specs:
+        spec = spec.strip()
+        if not spec or spec.startswith("#"):
+            continue
+        if "/" in spec:
+            try:
+                network = ipaddress.ip_network(spec, strict=False)
+            except ValueError as e:
+                raise ValueError(f"Invalid CIDR range '{spec}': {e}")
+            if network.num_addresses > limit:
+                raise ValueError(f"Range {spec} has {network.num_addresses} addresses (limit {limit}).")
+            hosts = [str(host) for host in network.hosts()] or [str(network.network_address)]
+        else:
+            hosts = [spec]
+        for host in hosts:
+            if host not in seen:
+                seen.add(host)
+                targets.append(host)
+    if len(targets) > limit:
+        raise ValueError(f"{len(targets)} targets given (limit {limit}).")
+    return targets
+
+
+def read_target_file(path):
+    """Read sweep targets from a file: whitespace or comma separated, '#' starts a comment."""
+    specs = []
+    with open(path, "r") as f:
+        for line in f:
+            specs += line.split("#", 1)[0].replace(",", " ").split()
+    return specs
+
+
+def parse_ping_output(text):
+    """Extract packets sent/received, loss % and RTT min/avg/max (ms) from ping's summary."""
+    re = lazy_import("re")
+    result = {"sent": 0, "received": 0, "loss": 100.0, "rtt_min": None, "rtt_avg": None, "rtt_max": None}
+    packets = re.search(r"(\d+) packets transmitted, (\d+) (?:packets )?received", text)
+    if packets:
+        result["sent"], result["received"] = int(packets.group(1)), int(packets.group(2))
+        if result["sent"]:
+            result["loss"] = round(100.0 * (result["sent"] - result["received"]) / result["sent"], 1)
+    rtt = re.search(r"(?:rtt|round-trip) min/avg/max/(?:mdev|stddev) = ([\d.]+)/([\d.]+)/([\d.]+)", text)
+    if rtt:
+        result["rtt_min"], result["rtt_avg"], result["rtt_max"] = (float(value) for value in rtt.groups())
+    return result
+
+
+async def _ping_host(host, count, timeout, semaphore):
+    asyncio = lazy_import("asyncio")
+    async with semaphore:
+        started_at = time.time()
+        start = time.perf_counter()
+        command = ["ping", "-n", "-c", str(count), "-W", str(timeout), host]
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *command,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT,
+                stdin=asyncio.subprocess.DEVNULL,
+            )
+            spawn_s = time.perf_counter() - start
+            output, _ = await process.communicate()
+            result = parse_ping_output(output.decode(errors="replace"))
+            result["returncode"] = process.returncode
+            # Pings run concurrently, so per-child CPU/RSS deltas are not attributable here.
+            trace_command(command, started_at, spawn_s, time.perf_counter() - start, process.returncode,
+                          output_bytes=len(output), pid=process.pid)
+        except OSError as e:
+            result = parse_ping_output("")
+            result.update(returncode=None, error=str(e))
+        result["host"] = host
+        result["elapsed"] = round(time.perf_counter() - start, 3)
+        return result
+
+
+def _format_rtt(value):
+    return "-" if value is None else f"{value:.3f}"
+
+
+async def _sweep(targets, count, timeout, concurrency, on_result):
+    asyncio = lazy_import("asyncio")
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = [asyncio.ensure_future(_ping_host(host, count, timeout, semaphore)) for host in targets]
+    results = []
+    for task in asyncio.as_completed(tasks):
+        result = await task
+        results.append(result)
+        on_result(result)
+    return results
+
+
+def reachability_sweep(targets, count=4, timeout=1, concurrency=SWEEP_CONCURRENCY):
+    """Ping many targets concurrently (at most `concurrency` ping processes at once).
+
+    Prints each host's loss and RTT min/avg/max as soon as its ping finishes and
+    returns the results in target order.
+    """
+    if not targets:
+        print(f"{RED}No targets given.{RESET}")
+        return []
+    concurrency = max(1, min(concurrency, len(targets)))
+    print(f"Pinging {len(targets)} target(s), {concurrency} at a time ({count} packets each)...")
+    print(f"{'Host':<40}{'Sent':>6}{'Recv':>6}{'Loss%':>8}{'Min':>10}{'Avg':>10}{'Max':>10}")
+
+    def on_result(result):
+        color = GREEN if result["received"] == result["sent"] and result["sent"] else RED
+        note = f"  {result['error']}" if "error" in result else ""
+        print(f"{color}{result['host']:<40}{result['sent']:>6}{result['received']:>6}{result['loss']:>8.1f}"
+              f"{_format_rtt(result['rtt_min']):>10}{_format_rtt(result['rtt_avg']):>10}"
+              f"{_format_rtt(result['rtt_max']):>10}{note}{RESET}", flush=True)
+
+    asyncio = lazy_import("asyncio")
+    results = asyncio.run(_sweep(targets, count, timeout, concurrency, on_result))
+    order = {host: index for index, host in enumerate(targets)}
+    results.sort(key=lambda result: order[result["host"]])
+    reachable = sum(1 for result in results if result["received"])
+    color = GREEN if reachable == len(results) else RED
+    print(f"{color}{reachable}/{len(results)} target(s) reachable.{RESET}")
+    return results
+
+
+def reachability_sweep_menu():
+    specs = input("Enter IPs, domains or CIDR ranges (space or comma separated): ").replace(",", " ").split()
+    try:
+        targets = expand_targets(specs)
+    except ValueError as e:
+        print(f"{RED}{e}{RESET}")
+        return
+    reachability_sweep(targets)
+
+
+def _download_session(pool_size):
+    """A requests session whose connection pool can serve pool_size concurrent requests."""
+    requests = lazy_import("requests")
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=2)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["User-Agent"] = f"qakit/{CURRENT_VERSION}"
+    return session
+
+
+def _header_size(value):
+    """A byte count from a Content-Length (or Content-Range total) header; None if missing or malformed."""
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return None
+    return size if size >= 0 else None
+
+
+def _probe_download(session, url):
+    """Return (size or None, supports byte ranges, validator) for a URL."""
+    size, ranges, validator = None, False, None
+    try:
+        response = session.head(url, allow_redirects=True, timeout=DOWNLOAD_TIMEOUT)
+        if response.ok:
+            size = _header_size(response.headers.get("Content-Length"))
+            ranges = response.headers.get("Accept-Ranges", "").lower() == "bytes"
+            validator = response.headers.get("ETag") or response.headers.get("Last-Modified")
+    except lazy_import("requests").RequestException:
+        pass
+    if size is None or not ranges:
+        # Some servers reject HEAD or omit Accept-Ranges; ask for the first byte instead.
+        with session.get(url, headers={"Range": "bytes=0-0"}, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+            response.raise_for_status()
+            content_range = response.headers.get("Content-Range", "")
+            total = _header_size(content_range.rsplit("/", 1)[1]) if "/" in content_range else None
+            if response.status_code == 206 and total is not None:
+                size, ranges = total, True
+            elif response.status_code == 200 and _header_size(response.headers.get("Content-Length")) is not None:
+                size = _header_size(response.headers["Content-Length"])
+            validator = validator or response.headers.get("ETag") or response.headers.get("Last-Modified")
+    return size, ranges, validator
+
+
+def _chunk_digest(path, start, length):
+    hashlib = lazy_import("hashlib")
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            data = f.read(min(remaining, 1024 * 1024))
+            if not data:
+                break
+            digest.update(data)
+            remaining -= len(data)
+    return digest.hexdigest() if remaining == 0 else None
+
+
+def _fetch_range(session, url, part_file, start, end, validator):
+    """Download bytes start..end (inclusive) into part_file at the same offset. Returns the chunk's SHA-256."""
+    hashlib = lazy_import("hashlib")
+    headers = {"Range": f"bytes={start}-{end}"}
+    if validator:
+        headers["If-Range"] = validator  # the server sends the whole (new) file if it changed
+    for attempt in range(1, DOWNLOAD_RETRIES + 1):
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+                if response.status_code != 206:
+                    raise IOError(f"server answered a range request with HTTP {response.status_code}")
+                digest = hashlib.sha256()
+                offset = start
+                with open(part_file, "r+b") as f:
+                    f.seek(start)
+                    for data in response.iter_content(256 * 1024):
+                        f.write(data)
+                        digest.update(data)
+                        offset += len(data)
+                if offset != end + 1:
+                    raise IOError(f"short read for bytes {start}-{end}")
+                return digest.hexdigest()
+        except (IOError, lazy_import("requests").RequestException):
+            if attempt == DOWNLOAD_RETRIES:
+                raise
+            time.sleep(attempt)
+
+
+def _save_download_state(state_file, state):
+    tmp_file = f"{state_file}.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_file, state_file)
+
+
+def download_url(url, output_path, sha256=None, connections=DOWNLOAD_CONNECTIONS,
+                 chunk_size=DOWNLOAD_CHUNK_SIZE, session=None, quiet=False):
+    """Download url to output_path with parallel range requests and resume support.
+
+    Data goes to '<output>.part' and progress to '<output>.part.json' (per-chunk
+    SHA-256s); an interrupted download resumes from the chunks whose checksums
+    still match. Servers without range support get a single streamed request.
+    If sha256 is given the finished file must match it. The file is only moved
+    into place once complete. Raises IOError/requests errors on failure.
+    """
+    session = session or _download_session(connections)
+    part_file = f"{output_path}.part"
+    state_file = f"{part_file}.json"
+    if os.path.dirname(output_path):
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    size, ranges, validator = _probe_download(session, url)
+    start_time = time.perf_counter()
+
+    if size is not None and ranges:
+        try:
+            with open(state_file, "r") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = None
+        if (not state or state.get("url") != url or state.get("size") != size
+                or state.get("validator") != validator or state.get("chunk_size") != chunk_size
+                or not os.path.exists(part_file)):
+            state = {"url": url, "size": size, "validator": validator, "chunk_size": chunk_size, "chunks": {}}
+            with open(part_file, "wb") as f:
+                f.truncate(size)
+        chunk_count = max(1, -(-size // chunk_size))
+        todo = []
+        for index in range(chunk_count):
+            start = index * chunk_size
+            end = min(size, start + chunk_size) - 1
+            recorded = state["chunks"].get(str(index))
+            if recorded and _chunk_digest(part_file, start, end - start + 1) == recorded:
+                continue
+            state["chunks"].pop(str(index), None)
+            todo.append((index, start, end))
+        if not quiet and len(todo) < chunk_count:
+            print(f"Resuming {os.path.basename(output_path)}: {chunk_count - len(todo)}/{chunk_count} chunk(s) already verified.")
+
+        threading = lazy_import("threading")
+        state_lock = threading.Lock()
+        futures = lazy_import("concurrent.futures")
+        if size == 0:
+            todo = []
+        with futures.ThreadPoolExecutor(max_workers=max(1, min(connections, len(todo) or 1))) as pool:
+            pending = {pool.submit(_fetch_range, session, url, part_file, start, end, validator): index
+                       for index, start, end in todo}
+            error = None
+            for future in futures.as_completed(pending):
+                try:
+                    digest = future.result()
+                except (IOError, lazy_import("requests").RequestException) as e:
+                    error = error or e  # keep recording the other chunks so a resume can skip them
+                    continue
+                with state_lock:
+                    state["chunks"][str(pending[future])] = digest
+                    _save_download_state(state_file, state)
+                if not quiet:
+                    print(f"Downloaded {len(state['chunks'])}/{chunk_count} chunk(s)", end="\r", flush=True)
+        if not quiet and todo:
+            print()
+        if error is not None:
+            raise error
+    else:
+        # No byte ranges (or unknown size): one streamed request.
+        with session.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+            response.raise_for_status()
+            with open(part_file, "wb") as f:
+                for data in response.iter_content(256 * 1024):
+                    f.write(data)
+
+    if size is not None and os.path.getsize(part_file) != size:
+        raise IOError(f"expected {size} bytes but have {os.path.getsize(part_file)}")
+    if sha256:
+        actual = file_digest(part_file)
+        if actual.lower() != sha256.lower():
+            os.remove(part_file)
+            if os.path.exists(state_file):
+                os.remove(state_file)
+            raise IOError(f"checksum mismatch: expected {sha256}, got {actual}")
+    os.replace(part_file, output_path)
+    if os.path.exists(state_file):
+        os.remove(state_file)
+    elapsed = time.perf_counter() - start_time
+    downloaded = os.path.getsize(output_path)
+    if not quiet:
+        print(f"{GREEN}Downloaded {output_path} ({downloaded / 1048576:.1f} MB in {elapsed:.2f}s, "
+              f"{downloaded / 1048576 / max(elapsed, 1e-6):.1f} MB/s).{RESET}")
+    return {"url": url, "output": output_path, "bytes": downloaded, "elapsed": round(elapsed, 3)}
+
+
+def load_download_manifest(path, output_dir):
+    """Read a manifest: JSON [{"url", "output"?, "sha256"?}, ...] or lines of 'url [output] [sha256]'."""
+    with open(path, "r") as f:
+        text = f.read()
+    try:
+        entries = json.loads(text)
+    except ValueError:
+        entries = []
+        for line in text.splitlines():
+            fields = line.split()
+            if not fields or fields[0].startswith("#"):
+                continue
+            entries.append({"url": fields[0], "output": fields[1] if len(fields) > 1 else None,
+                            "sha256": fields[2] if len(fields) > 2 else None})
+    for entry in entries:
+        name = entry.get("output") or os.path.basename(entry["url"].split("?", 1)[0]) or "download"
+        entry["output"] = name if os.path.isabs(name) else os.path.join(output_dir, name)
+    return entries
+
+
+def download_manifest(entries, concurrency=DOWNLOAD_CONCURRENCY, connections=DOWNLOAD_CONNECTIONS):
+    """Download many files concurrently over one pooled session. Returns a result per entry."""
+    if not entries:
+        print(f"{RED}The manifest is empty.{RESET}")
+        return []
+    session = _download_session(concurrency * connections)
+    futures = lazy_import("concurrent.futures")
+    requests = lazy_import("requests")
+    results = []
+    print(f"Downloading {len(entries)} file(s), {concurrency} at a time...")
+    with futures.ThreadPoolExecutor(max_workers=concurrency) as pool:
+        pending = {pool.submit(download_url, entry["url"], entry["output"], entry.get("sha256"),
+                               connections, session=session, quiet=True): entry for entry in entries}
+        for future in futures.as_completed(pending):
+            entry = pending[future]
+            try:
+                result = future.result()
+                result["ok"] = True
+                print(f"{GREEN}[ok] {entry['output']} ({result['bytes'] / 1048576:.1f} MB){RESET}")
+            except (IOError, requests.RequestException) as e:
+                result = {"url": entry["url"], "output": entry["output"], "ok": False, "error": str(e)}
+                print(f"{RED}[failed] {entry['url']}: {e}{RESET}")
+            results.append(result)
+    ok = sum(1 for result in results if result["ok"])
+    print(f"{GREEN if ok == len(results) else RED}{ok}/{len(results)} download(s) complete.{RESET}")
+    return results
+
+
+def download_file(url=None, output_path=None, sha256=None, connections=DOWNLOAD_CONNECTIONS):
+    if url is None:
+        url = input("Enter the file URL: ").strip()
+    if output_path is None:
+        output_path = input("Enter the output file path: ").strip()
+    try:
+        requests = lazy_import("requests")
+    except ImportError:
+        print(f"{RED}requests module not installed; falling back to wget without resume support.{RESET}")
+        return run_command(["wget", "-O", output_path, url])
+    try:
+        download_url(url, output_path, sha256, connections)
+        return 0
+    except (IOError, requests.RequestException) as e:
+        print(f"\n{RED}Download failed: {e}{RESET}")
+        if os.path.exists(f"{output_path}.part"):
+            print("Run the same download again to resume it.")
+        return 1
+
+
+def parse_ip_maddr(text):
+    """Parse 'ip maddr show' output into {interface: [group, ...]}.
+
+    Each group is a dict with family ("link", "inet" or "inet6"), address,
+    users (join count) and static (True for statically added groups).
+    """
+    groups = {}
+    interface = None
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        if not line[0].isspace():
+            # Interface header, e.g. "2:\teth0" or "5:\teth0.100@eth0".
+            _, _, name = line.partition(":")
+            interface = name.strip().split("@")[0]
+            groups.setdefault(interface, [])
+            continue
+        fields = line.split()
+        if interface is None or len(fields) < 2 or fields[0] not in ("link", "inet", "inet6"):
+            continue
+        users = 1
+        if "users" in fields[2:]:
+            try:
+                users = int(fields[fields.index("users") + 1])
+            except (IndexError, ValueError):
+                pass
+        groups[interface].append({
+            "family": fields[0],
+            "address": fields[1],
+            "users": users,
+            "static": "static" in fields[2:],
+        })
+    return groups
+
+
+def is_link_local_group(address):
+    """True for link-local control groups (224.0.0.0/24, ff02::/16, ff01::/16) that nwtest should not target."""
+    ipaddress = lazy_import("ipaddress")
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    if ip.version == 4:
+        return ip in ipaddress.ip_network("224.0.0.0/24")
+    return ip in ipaddress.ip_network("ff02::/16") or ip in ipaddress.ip_network("ff01::/16")
+
+
+def parse_proc_igmp(text):
+    """Parse /proc/net/igmp into {interface: [group, ...]} (groups as in parse_ip_maddr())."""
+    socket = lazy_import("socket")
+    struct = lazy_import("struct")
+    groups = {}
+    interface = None
+    for line in text.splitlines()[1:]:
+        fields = line.split()
+        if not fields:
+            continue
+        if not line[0].isspace():
+            # Device line, e.g. "4\teth0      :     1      V3".
+            interface = fields[1].rstrip(":")
+            groups.setdefault(interface, [])
+            continue
+        if interface is None or len(fields) < 2:
+            continue
+        try:
+            # The kernel prints the network-order address as a host-order hex word.
+            address = socket.inet_ntoa(struct.pack("=I", int(fields[0], 16)))
+            users = int(fields[1])
+        except (ValueError, struct.error):
+            continue
+        groups[interface].append({"family": "inet", "address": address, "users": users, "static": False})
+    return groups
+
+
+def parse_proc_igmp6(text):
+    """Parse /proc/net/igmp6 into {interface: [group, ...]} (groups as in parse_ip_maddr())."""
+    ipaddress = lazy_import("ipaddress")
+    groups = {}
+    for line in text.splitlines():
+        fields = line.split()
+        if len(fields) < 4:
+            continue
+        try:
+            address = str(ipaddress.IPv6Address(bytes.fromhex(fields[2])))
+            users = int(fields[3])
+        except ValueError:
+            continue
+        groups.setdefault(fields[1], []).append({"family": "inet6", "address": address, "users": users,
+                                                 "static": False})
+    return groups
+
+
+class MulticastGroups:
+    """Indexed snapshot of joined multicast groups.
+
+    Built from {interface: [group, ...]} as returned by parse_ip_maddr();
+    memberships are indexed by interface and by address (kept sorted, so
+    prefix queries are a bisect plus a scan of the matching range).
+    """
+
+    def __init__(self, groups_by_interface):
+        self.groups = {}  # (interface, address) -> group dict
+        for interface, groups in groups_by_interface.items():
+            for group in groups:
+                self.groups[(interface, group["address"])] = dict(group, interface=interface)
+        self.by_interface = {}
+        self.by_address = {}
+        for interface, address in self.groups:
+            self.by_interface.setdefault(interface, []).append(address)
+            self.by_address.setdefault(address, []).append(interface)
+        for addresses in self.by_interface.values():
+            addresses.sort()
+        self.addresses = sorted(self.by_address)
+
+    def __len__(self):
+        return len(self.groups)
+
+    def query(self, interface=None, prefix=None, families=None, include_local=True):
+        """Sorted group dicts matching an interface, an address prefix and families."""
+        if prefix:
+            bisect = lazy_import("bisect")
+            start = bisect.bisect_left(self.addresses, prefix)
+            addresses = []
+            for address in self.addresses[start:]:
+                if not address.startswith(prefix):
+                    break
+                addresses.append(address)
+        else:
+            addresses = self.addresses
+        if interface:
+            wanted = set(self.by_interface.get(interface, ()))
+            keys = [(interface, address) for address in addresses if address in wanted]
+        else:
+            keys = [(name, address) for address in addresses for name in sorted(self.by_address[address])]
+        selected = []
+        for key in sorted(keys):
+            group = self.groups[key]
+            if families and group["family"] not in families:
+                continue
+            if not include_local and is_link_local_group(group["address"]):
+                continue
+            selected.append(group)
+        return selected
+
+    def diff(self, previous, **filters):
+        """(joined, left) group dicts relative to an earlier snapshot, limited by query() filters."""
+        current = {(group["interface"], group["address"]): group for group in self.query(**filters)}
+        before = {(group["interface"], group["address"]): group for group in previous.query(**filters)}
+        return ([current[key] for key in sorted(current.keys() - before.keys())],
+                [before[key] for key in sorted(before.keys() - current.keys())])
+
+
+def _read_proc_igmp():
+    """Raw /proc/net/igmp and /proc/net/igmp6 text ("" for igmp6 when IPv6 is off). Raises OSError."""
+    with open(PROC_IGMP_FILE, "r") as f:
+        igmp = f.read()
+    try:
+        with open(PROC_IGMP6_FILE, "r") as f:
+            igmp6 = f.read()
+    except OSError:
+        igmp6 = ""
+    return igmp, igmp6
+
+
+def _proc_multicast_groups(igmp, igmp6):
+    groups = parse_proc_igmp(igmp)
+    for interface, entries in parse_proc_igmp6(igmp6).items():
+        groups.setdefault(interface, []).extend(entries)
+    return MulticastGroups(groups)
+
+
+def multicast_source(source="auto", families=None):
+    """Resolve a multicast source: "auto" picks "proc" when it can answer the query, else "ip".
+
+    /proc only has IPv4/IPv6 groups and no static flag, so queries that may
+    include link-layer groups (families None or "link") use 'ip maddr show'
+    while the ip command is available.
+    """
+    if source != "auto":
+        return source
+    if families and set(families) <= {"inet", "inet6"} and os.path.exists(PROC_IGMP_FILE):
+        return "proc"
+    return "ip" if shutil.which("ip") else "proc"
+
+
+def _warn_proc_limits(source, families):
+    if source == "proc" and (not families or "link" in families):
+        print(f"{RED}Reading {PROC_IGMP_FILE}: link-layer groups and static joins are not listed "
+              f"(install iproute2 for 'ip maddr show', or use --source ip).{RESET}")
+
+
+def read_multicast_groups(source="auto", families=None):
+    """Read the joined multicast groups as a MulticastGroups snapshot (None on failure).
+
+    source "proc" reads /proc/net/igmp and /proc/net/igmp6 directly (no
+    process launch, IPv4/IPv6 groups only); "ip" parses 'ip maddr show' (also
+    lists link-layer groups and static joins); "auto" picks one for the
+    families wanted (see multicast_source()).
+    """
+    if multicast_source(source, families) == "proc":
+        try:
+            return _proc_multicast_groups(*_read_proc_igmp())
+        except OSError as e:
+            if source == "proc" or not shutil.which("ip"):
+                print(f"{RED}Could not read {PROC_IGMP_FILE}: {e}{RESET}")
+                return None
+    try:
+        result = traced_run(["ip", "maddr", "show"], stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, text=True, timeout=10)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        print(f"{RED}Could not list multicast addresses: {e}{RESET}")
+        return None
+    if result.returncode != 0:
+        print(f"{RED}ip maddr show failed: {result.stderr.strip()}{RESET}")
+        return None
+    return MulticastGroups(parse_ip_maddr(result.stdout))
+
+
+def list_multicast_addresses(interface=None, prefix=None, families=None, source="auto"):
+    """Print the joined multicast groups as a table, optionally filtered. Returns 0, or None on failure."""
+    source = multicast_source(source, families)
+    _warn_proc_limits(source, families)
+    table = read_multicast_groups(source)
+    if table is None:
+        return None
+    groups = table.query(interface, prefix, families)
+    print(f"{'Interface':<16}{'Family':<8}{'Address':<40}{'Users':>6}")
+    for group in groups:
+        static = " static" if group["static"] else ""
+        print(f"{group['interface']:<16}{group['family']:<8}{group['address']:<40}{group['users']:>6}{static}")
+    print(f"{len(groups)} membership(s) on {len({group['interface'] for group in groups})} interface(s).")
+    return 0
+
+
+def watch_multicast_groups(interval=None, interface=None, prefix=None, families=None, source="auto",
+                           duration=None):
+    """Poll the multicast memberships and print joins (+) and leaves (-) as they happen.
+
+    Only changes are printed; an unchanged membership table is not re-parsed.
+    Runs until interrupted, or for duration seconds. Returns the list of
+    change events.
+    """
+    interval = interval or MULTICAST_WATCH_INTERVAL
+    filters = {"interface": interface, "prefix": prefix, "families": families}
+    source = multicast_source(source, families)
+    _warn_proc_limits(source, families)
+    use_proc = source == "proc"
+    last_raw = None
+    if use_proc:
+        try:
+            last_raw = _read_proc_igmp()
+        except OSError as e:
+            print(f"{RED}Could not read {PROC_IGMP_FILE}: {e}{RESET}")
+            return []
+        current = _proc_multicast_groups(*last_raw)
+    else:
+        current = read_multicast_groups("ip")
+        if current is None:
+            return []
+    print(f"Watching {len(current.query(**filters))} multicast membership(s); polling every {interval:g}s. "
+          f"Press Ctrl+C to stop.")
+    events = []
+    deadline = time.monotonic() + duration if duration else None
+    try:
+        while deadline is None or time.monotonic() < deadline:
+            time.sleep(interval if deadline is None else max(0, min(interval, deadline - time.monotonic())))
+            if use_proc:
+                try:
+                    raw = _read_proc_igmp()
+                except OSError:
+                    continue
+                if raw == last_raw:
+                    continue  # nothing joined or left anywhere: skip the parse
+                last_raw = raw
+                latest = _proc_multicast_groups(*raw)
+            else:
+                latest = read_multicast_groups("ip")
+                if latest is None:
+                    continue
+            joined, left = latest.diff(current, **filters)
+            stamp = time.strftime("%H:%M:%S")
+            for change, color, sign, groups in (("join", GREEN, "+", joined), ("leave", RED, "-", left)):
+                for group in groups:
+                    events.append({"time": stamp, "change": change, **group})
+                    print(f"{color}{stamp} {sign} {group['interface']:<16}{group['family']:<7}"
+                          f"{group['address']}{RESET}")
+            current = latest
+    except KeyboardInterrupt:
+        print()
+    print(f"{len(events)} change(s) seen.")
+    return events
+
+
+def discover_multicast_groups(interface=None, prefix=None, include_local=False, families=("inet",)):
+    """Return the joined multicast groups as a sorted list of (interface, address).
+
+    Groups are filtered by interface, address prefix and family; link-local
+    control groups are left out unless include_local=True.
+    """
+    table = read_multicast_groups(families=families)
+    if table is None:
+        return []
+    return sorted((group["interface"], group["address"])
+                  for group in table.query(interface, prefix, families, include_local))
+
+
+def _run_nwtest_job(interface, address, duration):
+    """Run nwtest against one group and return its result record."""
+    start = time.perf_counter()
+    record = {"interface": interface, "address": address, "duration": duration}
+    try:
+        result = traced_run(
+            ["nwtest", "-cs1", address, "-n", str(duration)],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            stdin=subprocess.DEVNULL,
+            text=True,
+            errors="replace",
+            timeout=duration + NWTEST_GRACE_SECONDS,
+            env=tool_env(),
+        )
+        record["returncode"] = result.returncode
+        record["output"] = result.stdout[-NWTEST_OUTPUT_LIMIT:]
+    except subprocess.TimeoutExpired as e:
+        output = e.output or ""
+        record["returncode"] = None
+        record["output"] = (output if isinstance(output, str) else output.decode(errors="replace"))[-NWTEST_OUTPUT_LIMIT:]
+        record["error"] = f"timed out after {duration + NWTEST_GRACE_SECONDS}s"
+    except OSError as e:
+        record["returncode"] = None
+        record["output"] = ""
+        record["error"] = str(e)
+    record["elapsed"] = round(time.perf_counter() - start, 3)
+    return record
+
+
+def run_nwtest_groups(targets, duration, concurrency=4, json_file=None):
+    """Run nwtest against many (interface, address) targets, at most `concurrency` at a time.
+
+    Prints a results table as tests finish, optionally writes every record
+    (exit status and output) to json_file, and returns the list of records.
+    """
+    if not targets:
+        print(f"{RED}No multicast groups selected.{RESET}")
+        return []
+    concurrency = max(1, min(concurrency, len(targets)))
+    print(f"Running nwtest against {len(targets)} group(s), {concurrency} at a time, {duration}s each...")
+    print(f"{'Interface':<16}{'Address':<40}{'Exit':>6}{'Time(s)':>10}")
+    records = []
+    futures = lazy_import("concurrent.futures")
+    with futures.ThreadPoolExecutor(max_workers=concurrency) as pool:
+        pending = [pool.submit(_run_nwtest_job, interface, address, duration) for interface, address in targets]
+        for future in futures.as_completed(pending):
+            record = future.result()
+            records.append(record)
+            status = "-" if record["returncode"] is None else str(record["returncode"])
+            color = GREEN if record["returncode"] == 0 else RED
+            print(f"{color}{record['interface']:<16}{record['address']:<40}{status:>6}{record['elapsed']:>10.1f}"
+                  f"{'  ' + record['error'] if 'error' in record else ''}{RESET}")
+
+    records.sort(key=lambda r: (r["interface"], r["address"]))
+    passed = sum(1 for record in records if record["returncode"] == 0)
+    color = GREEN if passed == len(records) else RED
+    print(f"{color}{passed}/{len(records)} multicast tests passed.{RESET}")
+    if json_file:
+        try:
+            with open(json_file, "w") as f:
+                json.dump(records, f, indent=2)
+            print(f"{GREEN}Results written to {json_file}{RESET}")
+        except OSError as e:
+            print(f"{RED}Could not write results file: {e}{RESET}")
+    return records
+
+
+def nwtest_multiple_groups():
+    targets = discover_multicast_groups()
+    if not targets:
+        print(f"{RED}No joined (non link-local) IPv4 multicast groups found.{RESET}")
+        return
+    for number, (interface, address) in enumerate(targets, 1):
+        print(f"{number}. {interface} {address}")
+    selection = input("Enter the groups to test (e.g., 1,3-5) or press Enter for all: ").strip()
+    if selection:
+        chosen = set()
+        try:
+            for part in selection.split(","):
+                first, _, last = part.strip().partition("-")
+                chosen.update(range(int(first), int(last or first) + 1))
+        except ValueError:
+            print(f"{RED}Invalid selection.{RESET}")
+            return
+        targets = [target for number, target in enumerate(targets, 1) if number in chosen]
+    try:
+        duration = int(input("Enter the duration for each test (seconds): ").strip())
+        concurrency = int(input("Enter the number of tests to run at once (e.g., 4): ").strip() or "4")
+    except ValueError:
+        print(f"{RED}Invalid number.{RESET}")
+        return
+    json_file = input("Enter a path to save JSON results (or press Enter to skip): ").strip() or None
+    run_nwtest_groups(targets, duration, concurrency=concurrency, json_file=json_file)
+
+
+class MetricsWriter:
+    """Buffered writer for monitoring samples.
+
+    Writes CSV, or - for paths ending in .bin - a compact binary format: the
+    METRICS_MAGIC line, a JSON line with the field names, then one row of
+    little-endian doubles per sample. The file is opened once and flushed every
+    flush_interval seconds rather than on every sample.
+    """
+
+    def __init__(self, path, fields, flush_interval=MONITOR_FLUSH_INTERVAL):
+        self.path = path
+        self.fields = list(fields)
+        self.binary = path.lower().endswith(".bin")
+        self.flush_interval = flush_interval
+        self._last_flush = time.monotonic()
+        if self.binary:
+            struct = lazy_import("struct")
+            self._row = struct.Struct("<" + "d" * len(self.fields))
+            self._file = open(path, "wb", buffering=1024 * 1024)
+            self._file.write(METRICS_MAGIC + json.dumps({"fields": self.fields}).encode() + b"\n")
+        else:
+            self._file = open(path, "w", buffering=1024 * 1024)
+            self._file.write(",".join(self.fields) + "\n")
+
+    def write(self, values):
+        if self.binary:
+            self._file.write(self._row.pack(*values))
+        else:
+            self._file.write(",".join(f"{value:g}" for value in values) + "\n")
+        now = time.monotonic()
+        if now - self._last_flush >= self.flush_interval:
+            self._file.flush()
+            self._last_flush = now
+
+    def close(self):
+        self._file.close()
+
+
+def read_metrics_file(path):
+    """Read a file written by MetricsWriter (CSV or binary). Returns (fields, rows)."""
+    with open(path, "rb") as f:
+        if f.read(len(METRICS_MAGIC)) != METRICS_MAGIC:
+            f.seek(0)
+            lines = f.read().decode().splitlines()
+            fields = lines[0].split(",")
+            return fields, [tuple(float(value) for value in line.split(",")) for line in lines[1:] if line]
+        fields = json.loads(f.readline())["fields"]
+        struct = lazy_import("struct")
+        row = struct.Struct("<" + "d" * len(fields))
+        data = f.read()
+    usable = len(data) - len(data) % row.size  # ignore a partially written final row
+    return fields, list(row.iter_unpack(data[:usable]))
+
+
+class MetricSeries:
+    """Preallocated ring buffer for one metric.
+
+    Holds the last `capacity` samples for percentiles and keeps running
+    min/max/sum over every sample, so memory stays flat on long runs.
+    """
+
+    def __init__(self, capacity=MONITOR_RING_SIZE):
+        array = lazy_import("array")
+        self.values = array.array("d", bytes(8 * capacity))
+        self.capacity = capacity
+        self.count = 0
+        self.minimum = float("inf")
+        self.maximum = float("-inf")
+        self.total = 0.0
+        self._mean = 0.0
+        self._m2 = 0.0  # sum of squared deviations (Welford), for the standard deviation
+
+    def append(self, value):
+        self.values[self.count % self.capacity] = value
+        self.count += 1
+        self.total += value
+        delta = value - self._mean
+        self._mean += delta / self.count
+        self._m2 += delta * (value - self._mean)
+        if value < self.minimum:
+            self.minimum = value
+        if value > self.maximum:
+            self.maximum = value
+
+    def percentile(self, percent):
+        """Nearest-rank percentile over the samples still in the ring."""
+        window = sorted(self.values[:min(self.count, self.capacity)])
+        if not window:
+            return None
+        rank = max(1, -(-len(window) * percent // 100))  # ceil without importing math
+        return window[int(rank) - 1]
+
+    def summary(self):
+        if not self.count:
+            return None
+        stdev = (self._m2 / (self.count - 1)) ** 0.5 if self.count > 1 else 0.0
+        return {"min": self.minimum, "mean": self.total / self.count, "stdev": stdev,
+                "p95": self.percentile(95), "max": self.maximum, "samples": self.count}
+
+
+class ResourceSampler:
+    """Samples system and stress-process metrics on a background thread at a fixed rate.
+
+    Captures overall, per-core and per-process-tree CPU, memory and RSS, disk
+    throughput, context switches and load average. Uses non-blocking psutil
+    calls and schedules each sample against the start time, so a slow sample
+    does not shift later ones; if the thread falls more than one interval
+    behind, the missed ticks are dropped rather than sampled back to back.
+    """
+
+    BASE_FIELDS = ("TimeElapsed(s)", "CPU(%)", "Memory(%)")
+    EXTRA_FIELDS = ("ProcCPU(%)", "ProcRSS(MB)", "DiskRead(MB/s)", "DiskWrite(MB/s)",
+                    "CtxSwitches(/s)", "Load1")
+
+    def __init__(self, psutil, interval=None, root_pid=None):
+        self.psutil = psutil
+        self.interval = interval or MONITOR_INTERVAL
+        self.root_pid = root_pid
+        self.writer = None
+        self.latest = None
+        self.samples_taken = 0
+        self.ticks_missed = 0
+        self.cores = len(psutil.cpu_percent(interval=None, percpu=True))
+        self.fields = (self.BASE_FIELDS + tuple(f"CPU{core}(%)" for core in range(self.cores))
+                       + self.EXTRA_FIELDS)
+        self.series = {field: MetricSeries() for field in self.fields[1:]}
+        self._processes = {}
+        self._last_counters = None
+        threading = lazy_import("threading")
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="qakit-sampler", daemon=True)
+
+    def start(self, writer=None):
+        self.writer = writer
+        self.psutil.cpu_percent(interval=None, percpu=True)  # prime the counters; the first reading is meaningless
+        self.start_time = time.monotonic()
+        self._last_counters = (self.start_time,) + self._read_counters()
+        self._process_tree()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        if self.writer is not None:
+            self.writer.close()
+
+    def _run(self):
+        next_tick = self.start_time + self.interval
+        while not self._stop.wait(max(0.0, next_tick - time.monotonic())):
+            self.sample(next_tick - self.start_time)
+            next_tick += self.interval
+            behind = time.monotonic() - next_tick
+            if behind > self.interval:
+                skipped = int(behind // self.interval)
+                self.ticks_missed += skipped
+                next_tick += skipped * self.interval
+
+    def _read_counters(self):
+        """Cumulative (disk read bytes, disk write bytes, context switches)."""
+        disk = self.psutil.disk_io_counters()
+        stats = self.psutil.cpu_stats()
+        return (disk.read_bytes if disk else 0, disk.write_bytes if disk else 0, stats.ctx_switches)
+
+    def _process_tree(self):
+        """Processes in the stress process tree, reusing Process objects so cpu_percent() has a baseline."""
+        if self.root_pid is None:
+            return []
+        try:
+            root = self._processes.get(self.root_pid) or self.psutil.Process(self.root_pid)
+            tree = [root] + root.children(recursive=True)
+        except self.psutil.Error:
+            return []
+        current = {}
+        for proc in tree:
+            if proc.pid not in self._processes:
+                try:
+                    proc.cpu_percent(interval=None)  # prime; counted from the next sample
+                except self.psutil.Error:
+                    continue
+            current[proc.pid] = self._processes.get(proc.pid, proc)
+        self._processes = current
+        return list(current.values())
+
+    def sample(self, elapsed):
+        psutil = self.psutil
+        per_core = psutil.cpu_percent(interval=None, percpu=True)
+        cpu = round(sum(per_core) / len(per_core), 1) if per_core else 0.0
+        proc_cpu = proc_rss = 0.0
+        for proc in self._process_tree():
+            try:
+                proc_cpu += proc.cpu_percent(interval=None)
+                proc_rss += proc.memory_info().rss
+            except psutil.Error:
+                pass
+        now = time.monotonic()
+        counters = self._read_counters()
+        last_time, *last_counters = self._last_counters
+        dt = max(now - last_time, 1e-6)
+        read_rate, write_rate, ctx_rate = ((value - last) / dt for value, last in zip(counters, last_counters))
+        self._last_counters = (now,) + counters
+
+        values = ((round(elapsed, 3), cpu, psutil.virtual_memory().percent) + tuple(per_core[:self.cores])
+                  + (round(proc_cpu, 1), round(proc_rss / 1048576, 1), round(read_rate / 1048576, 3),
+                     round(write_rate / 1048576, 3), round(ctx_rate), psutil.getloadavg()[0]))
+        self.latest = values
+        self.samples_taken += 1
+        for field, value in zip(self.fields[1:], values[1:]):
+            self.series[field].append(value)
+        if self.writer is not None:
+            self.writer.write(values)
+
+    def summary(self):
+        """Return {field: {"min", "mean", "stdev", "p95", "max", "samples"}} for every sampled metric."""
+        return {field: series.summary() for field, series in self.series.items() if series.count}
+
+
+def print_metrics_summary(summary):
+    """Print a min/mean/p95/max table for a ResourceSampler summary."""
+    if not summary:
+        return
+    print(f"\n{'Metric':<18}{'Min':>10}{'Mean':>10}{'P95':>10}{'Max':>10}")
+    for field, stats in summary.items():
+        print(f"{field:<18}{stats['min']:>10.1f}{stats['mean']:>10.1f}{stats['p95']:>10.1f}{stats['max']:>10.1f}")
+
+
+def monitor_stress_process(process, duration, psutil=None, log_file=None, threshold=None,
+                           interval=None, sample_writer=None):
+    """Show progress (and resource usage if psutil is available) until the stress process exits.
+
+    sample_writer, if given, is called with the field names and returns the
+    writer (write(values)/close()) samples go to instead of log_file.
+    Returns (completed, summary): completed is False if the user interrupted the
+    test, and summary is ResourceSampler.summary() ({} without psutil).
+    """
+    sampler = None
+    if psutil:
+        sampler = ResourceSampler(psutil, interval=interval, root_pid=process.pid)
+        writer = None
+        if sample_writer:
+            writer = sample_writer(sampler.fields)
+        elif log_file:
+            try:
+                writer = MetricsWriter(log_file, sampler.fields)
+            except OSError as e:
+                print(f"{RED}Could not open log file: {e}{RESET}")
+        sampler.start(writer)
+    start_time = time.monotonic()
+    alerted = False
+    completed = True
+
+    try:
+        while process.poll() is None:
+            elapsed = time.monotonic() - start_time
+            remaining = max(0, duration - int(elapsed))
+            status_str = f"Elapsed: {int(elapsed)}s, Remaining: {remaining}s"
+            if sampler and sampler.latest:
+                _, cpu_usage, mem_usage = sampler.latest[:3]
+                status_str += f", CPU: {cpu_usage}%, Memory: {mem_usage}%"
+                if threshold is not None and cpu_usage > threshold and not alerted:
+                    print(f"\n{RED}Alert: CPU usage exceeded {threshold}%!{RESET}")
+                alerted = threshold is not None and cpu_usage > threshold
+            print(status_str, end="\r", flush=True)
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        print(f"\n{RED}Stress test interrupted by user.{RESET}")
+        process.terminate()
+        completed = False
+    finally:
+        if sampler:
+            sampler.stop()
+            if sampler.ticks_missed:
+                print(f"\n{RED}Monitor fell behind and skipped {sampler.ticks_missed} sample(s).{RESET}")
+    return completed, sampler.summary() if sampler else {}
+
+
+def host_resources():
+    """Return (logical CPU count, total RAM in bytes) for scaling stress profiles."""
+    cores = os.cpu_count() or 1
+    try:
+        ram = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        try:
+            ram = lazy_import("psutil").virtual_memory().total
+        except ImportError:
+            ram = 1024 ** 3
+    return cores, ram
+
+
+def _parse_size(value):
+    """Parse a size such as '512M', '1G' or '1048576' into bytes."""
+    text = str(value).strip().upper().rstrip("B")
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def _resolve_count(value, cores):
+    """Resolve a worker count: an int, 'N%' of the cores or 'Nx' the core count."""
+    text = str(value).strip().lower()
+    if text.endswith("%"):
+        count = cores * float(text[:-1]) / 100
+    elif text.endswith("x"):
+        count = cores * float(text[:-1])
+    else:
+        return int(text)
+    return max(1, round(count)) if count > 0 else 0
+
+
+def resolve_stress_profile(profile, cores=None, ram=None):
+    """Turn a (possibly host-relative) profile into concrete stress settings.
+
+    'cpu', 'vm' and 'io' accept a worker count, 'N%' of the logical cores or
+    'Nx' the core count; 'vm_bytes' (per memory worker) accepts '512M'/'1G'
+    style sizes or 'N%' of total RAM. Raises ValueError for invalid values.
+    """
+    if cores is None or ram is None:
+        cores, ram = host_resources()
+    try:
+        settings = {
+            "cpu": _resolve_count(profile.get("cpu", 0), cores),
+            "vm": _resolve_count(profile.get("vm", 0), cores),
+            "io": _resolve_count(profile.get("io", 0), cores),
+            "duration": int(profile.get("duration", 60)),
+            "vm_bytes": "",
+        }
+        vm_bytes = str(profile.get("vm_bytes", "")).strip()
+        if vm_bytes.endswith("%"):
+            size = int(ram * float(vm_bytes[:-1]) / 100)
+            settings["vm_bytes"] = f"{max(1, size // 1024 ** 2)}M"
+        elif vm_bytes:
+            settings["vm_bytes"] = f"{max(1, _parse_size(vm_bytes) // 1024 ** 2)}M"
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid stress profile {profile}: {e}")
+    return settings
+
+
+def load_stress_profiles(path=None):
+    """Load stress profiles and scenarios, layering the profiles file over the built-ins.
+
+    The file (STRESS_PROFILES_FILE unless path is given) is JSON of the form
+    {"profiles": {name: {...}}, "scenarios": {name: [stage, ...]}}; a stage is
+    a profile plus a "name", either inline or via {"profile": name, ...overrides}.
+    Returns (profiles, scenarios). Raises ValueError if the file is malformed.
+    """
+    profiles = {name: dict(profile) for name, profile in BUILTIN_STRESS_PROFILES.items()}
+    scenarios = {name: [dict(stage) for stage in stages] for name, stages in BUILTIN_STRESS_SCENARIOS.items()}
+    path = path or STRESS_PROFILES_FILE
+    if not os.path.exists(path):
+        return profiles, scenarios
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+        profiles.update(data.get("profiles", {}))
+        scenarios.update(data.get("scenarios", {}))
+    except (OSError, ValueError, AttributeError) as e:
+        raise ValueError(f"Could not load stress profiles from {path}: {e}")
+    return profiles, scenarios
+
+
+def expand_scenario(stages, profiles):
+    """Resolve each scenario stage's profile reference into a flat profile dict."""
+    expanded = []
+    for number, stage in enumerate(stages, 1):
+        stage = dict(stage)
+        base = stage.pop("profile", None)
+        if base is not None:
+            if base not in profiles:
+                raise ValueError(f"Scenario stage {number} refers to unknown profile '{base}'.")
+            stage = {**profiles[base], **stage}
+        stage.setdefault("name", base or f"stage-{number}")
+        expanded.append(stage)
+    return expanded
+
+
+def select_stress_tool():
+    """Return the stress tool to use ('stress-ng' preferred), or None if neither is installed."""
+    if is_tool_installed("stress-ng"):
+        return "stress-ng"
+    if is_tool_installed("stress"):
+        return "stress"
+    return None
+
+
+def build_stress_command(stress_tool, settings):
+    """Build the stress/stress-ng command line for resolved settings."""
+    cmd_parts = []
+    if settings["cpu"] > 0:
+        cmd_parts.append(f"--cpu {settings['cpu']}")
+    if settings["vm"] > 0:
+        cmd_parts.append(f"--vm {settings['vm']}")
+        if settings["vm_bytes"]:
+            cmd_parts.append(f"--vm-bytes {settings['vm_bytes']}")
+    if settings["io"] > 0:
+        cmd_parts.append(f"--io {settings['io']}")
+    # For stress-ng, use a timeout with an "s" suffix.
+    if stress_tool == "stress-ng":
+        cmd_parts.append(f"--timeout {settings['duration']}s")
+    else:
+        cmd_parts.append(f"--timeout {settings['duration']}")
+    return f"{stress_tool} " + " ".join(cmd_parts)
+
+
+def run_stress_stage(stress_tool, settings, psutil=None, log_file=None, threshold=None, sample_writer=None):
+    """Launch one stress run and monitor it. Returns (completed, summary) like monitor_stress_process()."""
+    cmd = build_stress_command(stress_tool, settings)
+    print(f"\n{GREEN}Starting stress test with command:{RESET}\n{cmd}\n")
+
+    # Force the process to run in /tmp: start it there and set TMPDIR and PWD to /tmp.
+    env = os.environ.copy()
+    env["TMPDIR"] = "/tmp"
+    env["PWD"] = "/tmp"
+
+    # Launch the stress test.
+    started_at = time.time()
+    usage_before = _children_usage()
+    start = time.perf_counter()
+    process = subprocess.Popen(cmd, shell=True, env=env, cwd="/tmp")
+    spawn_s = time.perf_counter() - start
+    try:
+        return monitor_stress_process(process, settings["duration"], psutil, log_file, threshold,
+                                      sample_writer=sample_writer)
+    finally:
+        trace_command(cmd, started_at, spawn_s, time.perf_counter() - start, process.poll(), usage_before,
+                      pid=process.pid)
+
+
+def stage_log_file(log_file, stage_name):
+    """Per-stage log path: /path/log.csv -> /path/log.<stage>.csv."""
+    root, ext = os.path.splitext(log_file)
+    safe_name = "".join(c if c.isalnum() or c in "-_" else "_" for c in stage_name)
+    return f"{root}.{safe_name}{ext}"
+
+
+def run_stress_scenario(stress_tool, stages, psutil=None, log_file=None, threshold=None, scenario=None,
+                        sample_writer=None):
+    """Run scenario stages back to back, keeping each stage's settings and metrics separate.
+
+    Each monitored stage is recorded in the result store under its name
+    ("<scenario>/<stage>" for a named scenario). Stops early if a stage is
+    interrupted. Returns a list of {"stage", "settings", "completed",
+    "summary", "run_id"} records.
+    """
+    cores, ram = host_resources()
+    resolved = [(stage["name"], resolve_stress_profile(stage, cores, ram)) for stage in stages]
+    total = sum(settings["duration"] for _, settings in resolved)
+    print(f"\nRunning {len(resolved)} stage(s), {total}s in total.")
+    results = []
+    for number, (name, settings) in enumerate(resolved, 1):
+        print(f"\n{GREEN}--- Stage {number}/{len(resolved)}: {name} ({settings['duration']}s) ---{RESET}")
+        completed, summary = run_stress_stage(stress_tool, settings, psutil,
+                                              stage_log_file(log_file, name) if log_file else None, threshold,
+                                              sample_writer)
+        run_id = record_stress_result(stress_tool, f"{scenario}/{name}" if scenario else name, settings,
+                                      completed, summary)
+        results.append({"stage": name, "settings": settings, "completed": completed, "summary": summary,
+                        "run_id": run_id})
+        print_metrics_summary(summary)
+        if not completed:
+            break
+
+    if psutil and results:
+        print(f"\n{'Stage':<16}{'CPU mean':>10}{'CPU p95':>10}{'Mem mean':>10}{'Mem max':>10}")
+        for result in results:
+            cpu = result["summary"].get("CPU(%)")
+            mem = result["summary"].get("Memory(%)")
+            if cpu and mem:
+                print(f"{result['stage']:<16}{cpu['mean']:>10.1f}{cpu['p95']:>10.1f}"
+                      f"{mem['mean']:>10.1f}{mem['max']:>10.1f}")
+    return results
+
+
+def stress_test():
+    """Perform an enhanced stress test with a guided interface.
+    
+    Offers:
+      - Simple Mode: Test profiles (built-in Light, Moderate, Heavy plus any from
+        the profiles file) and multi-stage scenarios
+      - Advanced Mode: Custom settings for CPU, Memory, and I/O stress
+    """
+    print("\n--- Enhanced Stress Testing ---")
+    
+    # Determine which stress tool is available.
+    stress_tool = select_stress_tool()
+    if stress_tool is None:
+        print(f"{RED}No stress tool found. Please install stress or stress-ng via your package manager.{RESET}")
+        return
+    print(f"{GREEN}Using {stress_tool} for testing.{RESET}")
+
+    # Attempt to import psutil for monitoring.
+    try:
+        psutil = lazy_import("psutil")
+    except ImportError:
+        print(f"{RED}psutil module not installed. For monitoring, install it via 'pip install psutil'.{RESET}")
+        psutil = None
+
+    try:
+        profiles, scenarios = load_stress_profiles()
+    except ValueError as e:
+        print(f"{RED}{e}\nUsing the built-in profiles.{RESET}")
+        profiles, scenarios = dict(BUILTIN_STRESS_PROFILES), dict(BUILTIN_STRESS_SCENARIOS)
+
+    # Ask if the user wants to use advanced options.
+    print("\nFor most users, we recommend using the Simple Mode which uses predefined test profiles.")
+    print("If you are familiar with CPU and Memory settings and want to customize them, choose Advanced Mode.")
+    adv_choice = input("Do you want to use advanced options? (y/n): ").strip().lower()
+    if adv_choice not in ("y", "n"):
+        print("Invalid choice, defaulting to Simple Mode.")
+        adv_choice = "n"
+
+    # Initialize parameters.
+    settings = {"cpu": 0, "vm": 0, "vm_bytes": "", "io": 0, "duration": 0}
+    stages = None
+
+    if adv_choice == "y":
+        # Advanced Mode: present detailed options.
+        print("\nSelect the type of stress test you want to run:")
+        print(" 1. CPU Stress only")
+        print(" 2. Memory Stress only")
+        print(" 3. I/O Stress only")
+        print(" 4. Combined Stress (CPU + Memory + I/O)")
+        
+        while True:
+            test_type = input("Enter your choice (1-4): ").strip()
+            if test_type in ("1", "2", "3", "4"):
+                break
+            print("Invalid choice. Please enter a number between 1 and 4.")
+
+        def get_int_input(prompt):
+            while True:
+                value = input(prompt).strip()
+                try:
+                    return int(value)
+                except ValueError:
+                    print("Invalid input. Please enter a valid integer.")
+
+        if test_type == "1":
+            print("\n--- CPU Stress ---")
+            settings["cpu"] = get_int_input("Enter the number of CPU workers (e.g., 4): ")
+            settings["duration"] = get_int_input("Enter the test duration in seconds (e.g., 60): ")
+        elif test_type == "2":
+            print("\n--- Memory Stress ---")
+            print("Memory stress simulates heavy memory usage by launching processes (called 'workers') that allocate memory.")
+            print("For most systems, 1 or 2 workers is sufficient. If you're unsure, use a low number.")
+            settings["vm"] = get_int_input("Enter the number of memory workers (try 1 or 2): ")
+            settings["vm_bytes"] = input("Enter the memory allocation per worker (e.g., 256M for 256 MB or 1G for 1 GB): ").strip()
+            settings["duration"] = get_int_input("Enter the test duration in seconds (e.g., 60): ")
+        elif test_type == "3":
+            print("\n--- I/O Stress ---")
+            settings["io"] = get_int_input("Enter the number of I/O workers (e.g., 1 or 2): ")
+            settings["duration"] = get_int_input("Enter the test duration in seconds (e.g., 60): ")
+        elif test_type == "4":
+            print("\n--- Combined Stress (CPU + Memory + I/O) ---")
+            settings["cpu"] = get_int_input("Enter the number of CPU workers (e.g., 2): ")
+            print("Memory stress: A 'worker' allocates memory. Usually 1 or 2 is enough.")
+            settings["vm"] = get_int_input("Enter the number of memory workers (e.g., 1 or 2): ")
+            settings["vm_bytes"] = input("Enter the memory allocation per worker (e.g., 256M): ").strip()
+            settings["io"] = get_int_input("Enter the number of I/O workers (e.g., 1 or 2): ")
+            settings["duration"] = get_int_input("Enter the test duration in seconds (e.g., 60): ")
+    else:
+        # Simple Mode: Profiles scaled to this host, and multi-stage scenarios.
+        cores, ram = host_resources()
+        print("\n--- Simple Mode: Test Profiles ---")
+        print(f"Profiles scale with this host ({cores} CPUs, {ram / 1024 ** 3:.1f} GB RAM).")
+        print("Choose a stress test intensity:")
+        choices = [("profile", name) for name in profiles] + [("scenario", name) for name in scenarios]
+        for number, (kind, name) in enumerate(choices, 1):
+            if kind == "profile":
+                description = profiles[name].get("description", "")
+                print(f" {number}. {name.capitalize():<10} - {description}" if description else f" {number}. {name.capitalize()}")
+            else:
+                stage_names = ", ".join(stage.get("name", stage.get("profile", "?")) for stage in scenarios[name])
+                print(f" {number}. {name.capitalize():<10} - Scenario: {stage_names}")
+        while True:
+            choice = input(f"Enter your choice (1-{len(choices)}): ").strip()
+            if choice.isdigit() and 1 <= int(choice) <= len(choices):
+                break
+            print(f"Invalid choice. Please enter a number between 1 and {len(choices)}.")
+        kind, name = choices[int(choice) - 1]
+        try:
+            if kind == "scenario":
+                stages = expand_scenario(scenarios[name], profiles)
+                for stage in stages:
+                    resolve_stress_profile(stage, cores, ram)  # validate before starting anything
+            else:
+                settings = resolve_stress_profile(profiles[name], cores, ram)
+        except ValueError as e:
+            print(f"{RED}{e}{RESET}")
+            return
+        if stages is None:
+            default_duration = settings["duration"]
+            # Allow the user to override the default duration.
+            override = input(f"Default test duration is {default_duration} seconds. Would you like to change it? (y/n): ").strip().lower()
+            if override == 'y':
+                try:
+                    settings["duration"] = int(input("Enter desired duration in seconds: ").strip())
+                except ValueError:
+                    print("Invalid input. Using default duration.")
+                    settings["duration"] = default_duration
+
+    # Ask if the user wants to log resource usage.
+    log_file = None
+    while True:
+        log_choice = input("\nDo you want to log resource usage to a file? (y/n): ").strip().lower()
+        if log_choice in ("y", "n"):
+            break
+        print("Please enter 'y' or 'n'.")
+    if log_choice == "y":
+        log_file = input("Enter the full path for the log file (e.g., /home/user/stress_log.txt, "
+                         "or .bin for compact binary): ").strip()
+        if not psutil:
+            print(f"{RED}psutil is required for resource logging; no log will be written.{RESET}")
+
+    # Ask if CPU usage alerts should be set.
+    threshold = None
+    if psutil:
+        while True:
+            threshold_choice = input("\nWould you like to set a CPU usage threshold alert? (y/n): ").strip().lower()
+            if threshold_choice in ("y", "n"):
+                break
+            print("Please enter 'y' or 'n'.")
+        if threshold_choice == "y":
+            while True:
+                try:
+                    threshold = float(input("Enter the CPU usage threshold percentage (e.g., 90): ").strip())
+                    break
+                except ValueError:
+                    print("Invalid input. Please enter a valid number (e.g., 90).")
+
+    if stages is not None:
+        run_stress_scenario(stress_tool, stages, psutil, log_file, threshold, scenario=name)
+        return
+
+    completed, summary = run_stress_stage(stress_tool, settings, psutil, log_file, threshold)
+    record_stress_result(stress_tool, name if adv_choice == "n" else "custom", settings, completed, summary)
+    if not completed:
+        print_metrics_summary(summary)
+        return
+
+    print("\n" + f"{GREEN}Stress test completed.{RESET}")
+    print_metrics_summary(summary)
+    if psutil:
+        final_cpu = psutil.cpu_percent(interval=1)
+        final_mem = psutil.virtual_memory().percent
+        print(f"Final CPU Usage: {final_cpu}%")
+        print(f"Final Memory Usage: {final_mem}%")
+
+
+def run_stress(profile=None, scenario=None, duration=None, overrides=None, log_file=None,
+               threshold=None, profiles_file=None, sample_writer=None):
+    """Run a stress profile or scenario without prompts (headless equivalent of stress_test()).
+
+    overrides (cpu, vm, vm_bytes, io) are applied on top of the profile, or used
+    on their own when no profile is given; duration overrides the profile's (and,
+    for a scenario, every stage's) duration. Returns (exit_code, stage results).
+    """
+    stress_tool = select_stress_tool()
+    if stress_tool is None:
+        print(f"{RED}No stress tool found. Please install stress or stress-ng via your package manager.{RESET}")
+        return 1, []
+    try:
+        psutil = lazy_import("psutil")
+    except ImportError:
+        print(f"{RED}psutil module not installed. For monitoring, install it via 'pip install psutil'.{RESET}")
+        psutil = None
+
+    overrides = {key: value for key, value in (overrides or {}).items() if value is not None}
+    if duration is not None:
+        overrides["duration"] = duration
+    try:
+        profiles, scenarios = load_stress_profiles(profiles_file)
+        if scenario:
+            if scenario not in scenarios:
+                raise ValueError(f"Unknown scenario '{scenario}'. Available: {', '.join(scenarios)}")
+            stages = [{**stage, **overrides} for stage in expand_scenario(scenarios[scenario], profiles)]
+        else:
+            if profile and profile not in profiles:
+                raise ValueError(f"Unknown profile '{profile}'. Available: {', '.join(profiles)}")
+            stages = [{**(profiles[profile] if profile else {}), **overrides, "name": profile or "custom"}]
+        for stage in stages:
+            resolve_stress_profile(stage)  # validate everything before starting
+    except ValueError as e:
+        print(f"{RED}{e}{RESET}")
+        return 2, []
+
+    print(f"{GREEN}Using {stress_tool} for testing.{RESET}")
+    results = run_stress_scenario(stress_tool, stages, psutil, log_file, threshold, scenario=scenario,
+                                  sample_writer=sample_writer)
+    if not all(result["completed"] for result in results):
+        return 130, results
+    print(f"\n{GREEN}Stress test completed.{RESET}")
+    return 0, results
+
+
+def _open_results_db(db_path=None):
+    """Open (creating if needed) the stress result store."""
+    sqlite3 = lazy_import("sqlite3")
+    db_path = db_path or STRESS_RESULTS_DB
+    if os.path.dirname(db_path):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    db = sqlite3.connect(db_path)
+    db.row_factory = sqlite3.Row
+    db.executescript("""
+        CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY,
+            started REAL NOT NULL,
+            host TEXT NOT NULL,
+            profile TEXT NOT NULL,
+            kernel TEXT NOT NULL,
+            distro TEXT,
+            workload TEXT NOT NULL,
+            settings TEXT NOT NULL,
+            tool TEXT,
+            qakit_version TEXT,
+            completed INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS runs_by_key ON runs (host, profile, kernel, started);
+        CREATE TABLE IF NOT EXISTS metrics (
+            run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+            metric TEXT NOT NULL,
+            samples INTEGER NOT NULL,
+            mean REAL NOT NULL,
+            stdev REAL NOT NULL,
+            min REAL,
+            p95 REAL,
+            max REAL,
+            PRIMARY KEY (run_id, metric)
+        ) WITHOUT ROWID;
+    """)
+    return db
+
+
+def record_stress_result(stress_tool, profile, settings, completed, summary, db_path=None):
+    """Store one monitored stress run keyed by host, profile and kernel. Returns the run id (None if not stored)."""
+    if not summary:
+        return None
+    info = linux_version_info() or {"distro": None, "distro_version": None, "kernel": platform.release()}
+    # Runs are comparable when they applied the same load; the duration only changes the sample count.
+    workload = json.dumps({key: value for key, value in settings.items() if key != "duration"}, sort_keys=True)
+    try:
+        with _open_results_db(db_path) as db:
+            cursor = db.execute(
+                "INSERT INTO runs (started, host, profile, kernel, distro, workload, settings, tool, qakit_version,"
+                " completed) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (time.time(), platform.node(), profile, info["kernel"],
+                 " ".join(part for part in (info["distro"], info["distro_version"]) if part) or None,
+                 workload, json.dumps(settings, sort_keys=True), stress_tool, CURRENT_VERSION, int(completed)))
+            run_id = cursor.lastrowid
+            db.executemany(
+                "INSERT INTO metrics (run_id, metric, samples, mean, stdev, min, p95, max) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(run_id, metric, stats["samples"], stats["mean"], stats.get("stdev", 0.0), stats["min"],
+                  stats["p95"], stats["max"]) for metric, stats in summary.items()])
+        db.close()
+    except Exception as e:  # sqlite3.Error, or OSError creating the directory
+        print(f"{RED}Could not record the stress result: {e}{RESET}")
+        return None
+    print(f"Result stored as run #{run_id} ({profile} on {platform.node()}, kernel {info['kernel']}).")
+    return run_id
+
+
+def list_stress_results(host=None, profile=None, limit=20, db_path=None):
+    """Print the most recent stored runs, optionally for one host and/or profile. Returns them as dicts."""
+    query, params = "SELECT * FROM runs WHERE 1 = 1", []
+    for column, value in (("host", host), ("profile", profile)):
+        if value:
+            query += f" AND {column} = ?"
+            params.append(value)
+    db = _open_results_db(db_path)
+    try:
+        rows = [dict(row) for row in db.execute(query + " ORDER BY started DESC LIMIT ?", (*params, limit))]
+        for row in rows:
+            cpu = db.execute("SELECT mean FROM metrics WHERE run_id = ? AND metric = 'CPU(%)'", (row["id"],)).fetchone()
+            row["cpu_mean"] = cpu["mean"] if cpu else None
+    finally:
+        db.close()
+    print(f"{'Run':>5}  {'Started':<19} {'Host':<16}{'Profile':<20}{'Kernel':<24}{'CPU mean':>9}  Status")
+    for row in rows:
+        started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row["started"]))
+        cpu = f"{row['cpu_mean']:.1f}" if row["cpu_mean"] is not None else "-"
+        status = "ok" if row["completed"] else "interrupted"
+        print(f"{row['id']:>5}  {started:<19} {row['host'][:15]:<16}{row['profile'][:19]:<20}"
+              f"{row['kernel'][:23]:<24}{cpu:>9}  {status}")
+    return rows
+
+
+def _betainc(a, b, x):
+    """Regularized incomplete beta function I_x(a, b) (continued fraction, Numerical Recipes betacf)."""
+    math = lazy_import("math")
+    if x <= 0.0:
+        return 0.0
+    if x >= 1.0:
+        return 1.0
+    if x > (a + 1) / (a + b + 2):
+        return 1.0 - _betainc(b, a, 1.0 - x)
+    front = math.exp(math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) + a * math.log(x) + b * math.log(1 - x))
+    tiny = 1e-300
+    c, d = 1.0, 1.0 - (a + b) * x / (a + 1)
+    d = 1.0 / (d if abs(d) > tiny else tiny)
+    fraction = d
+    for m in range(1, 300):
+        for numerator in (m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m)),
+                          -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 2 * m + 1))):
+            d = 1.0 + numerator * d
+            d = 1.0 / (d if abs(d) > tiny else tiny)
+            c = 1.0 + numerator / c
+            c = c if abs(c) > tiny else tiny
+            fraction *= c * d
+        if abs(c * d - 1.0) < 1e-12:
+            break
+    return front * fraction / a
+
+
+def t_test_pvalue(t, df):
+    """Two-sided p-value of Student's t statistic with df degrees of freedom."""
+    if df <= 0:
+        return 1.0
+    return _betainc(df / 2.0, 0.5, df / (df + t * t))
+
+
+def _compare_metric(current, baseline):
+    """Compare one metric of a run with its baseline runs. Returns (baseline mean, t, df, p, test)."""
+    if len(baseline) >= 3:
+        # Enough runs to see run-to-run variation: is the new run mean outside the baseline's
+        # prediction interval? (t = (x - m) / (s * sqrt(1 + 1/k)), k - 1 degrees of freedom.)
+        means = [stats["mean"] for stats in baseline]
+        k = len(means)
+        mean = sum(means) / k
+        spread = (sum((value - mean) ** 2 for value in means) / (k - 1)) ** 0.5 * (1 + 1 / k) ** 0.5
+        df, test = k - 1, "runs"
+    else:
+        # One or two baseline runs: Welch's t-test on the pooled samples. Samples within a run
+        # are autocorrelated, so this overstates significance; the minimum change guards against that.
+        n = sum(stats["samples"] for stats in baseline)
+        mean = sum(stats["mean"] * stats["samples"] for stats in baseline) / n
+        m2 = sum(stats["stdev"] ** 2 * (stats["samples"] - 1) + stats["samples"] * (stats["mean"] - mean) ** 2
+                 for stats in baseline)
+        var_b = m2 / max(1, n - 1) / n
+        var_c = current["stdev"] ** 2 / current["samples"]
+        spread = (var_b + var_c) ** 0.5
+        denominator = (var_b ** 2 / max(1, n - 1) if var_b else 0) + (
+            var_c ** 2 / max(1, current["samples"] - 1) if var_c else 0)
+        df = (var_b + var_c) ** 2 / denominator if denominator else n + current["samples"] - 2
+        test = "samples"
+    difference = current["mean"] - mean
+    if spread == 0:
+        return mean, None, df, (1.0 if difference == 0 else 0.0), test
+    t = difference / spread
+    return mean, t, df, t_test_pvalue(t, df), test
+
+
+def compare_stress_results(run_id=None, baseline_id=None, baseline_kernel=None, last=RESULTS_BASELINE_RUNS,
+                           alpha=RESULTS_ALPHA, min_change=RESULTS_MIN_CHANGE, metrics=None, db_path=None):
+    """Compare a stored run (default: the latest) with its baseline and flag significant changes.
+
+    The baseline is run baseline_id, or else the last `last` completed runs
+    before it with the same host, profile and workload on the same kernel (or
+    on baseline_kernel, to compare builds). A metric is flagged when the change
+    is significant at alpha and at least min_change of the baseline mean.
+    Per-core CPU metrics are left out unless named in metrics. Returns a report
+    dict ({"error"} if there is nothing to compare).
+    """
+    db = _open_results_db(db_path)
+    try:
+        if run_id is None:
+            run = db.execute("SELECT * FROM runs WHERE completed = 1 ORDER BY started DESC LIMIT 1").fetchone()
+        else:
+            run = db.execute("SELECT * FROM runs WHERE id = ?", (run_id,)).fetchone()
+        if run is None:
+            return {"error": "no such run" if run_id is not None else "no completed runs stored"}
+        if baseline_id is not None:
+            baseline_runs = db.execute("SELECT * FROM runs WHERE id = ?", (baseline_id,)).fetchall()
+        else:
+            baseline_runs = db.execute(
+                "SELECT * FROM runs WHERE host = ? AND profile = ? AND workload = ? AND kernel = ? AND completed = 1"
+                " AND id != ? AND started < ? ORDER BY started DESC LIMIT ?",
+                (run["host"], run["profile"], run["workload"], baseline_kernel or run["kernel"], run["id"],
+                 run["started"], last)).fetchall()
+        if not baseline_runs:
+            return {"error": "no baseline runs match", "run": dict(run)}
+
+        def load(target):
+            return {row["metric"]: dict(row) for row in
+                    db.execute("SELECT * FROM metrics WHERE run_id = ?", (target["id"],))}
+
+        current = load(run)
+        baselines = [load(target) for target in baseline_runs]
+    finally:
+        db.close()
+
+    re = lazy_import("re")
+    wanted = metrics or [metric for metric in current if not re.fullmatch(r"CPU\d+\(%\)", metric)]
+    comparisons = []
+    for metric in wanted:
+        history = [stats[metric] for stats in baselines if metric in stats]
+        if metric not in current or not history:
+            continue
+        mean, t, df, p, test = _compare_metric(current[metric], history)
+        change = (current[metric]["mean"] - mean) / abs(mean) if mean else (0.0 if not current[metric]["mean"] else None)
+        significant = p < alpha and (change is None or abs(change) >= min_change)
+        comparisons.append({"metric": metric, "baseline": mean, "current": current[metric]["mean"], "change": change,
+                            "t": t, "df": df, "p": p, "test": test, "significant": significant})
+    return {"run": dict(run), "baseline_runs": [row["id"] for row in baseline_runs], "alpha": alpha,
+            "min_change": min_change, "comparisons": comparisons,
+            "changed": [entry["metric"] for entry in comparisons if entry["significant"]]}
+
+
+def print_stress_comparison(report):
+    """Print a compare_stress_results() report."""
+    run = report["run"]
+    print(f"\nRun #{run['id']} ({run['profile']} on {run['host']}, kernel {run['kernel']}) vs "
+          f"{len(report['baseline_runs'])} baseline run(s): {', '.join(f'#{i}' for i in report['baseline_runs'])}")
+    print(f"{'Metric':<18}{'Baseline':>10}{'Current':>10}{'Change':>9}{'p':>9}  Test")
+    for entry in report["comparisons"]:
+        change = f"{entry['change'] * 100:+.1f}%" if entry["change"] is not None else "new"
+        line = (f"{entry['metric']:<18}{entry['baseline']:>10.2f}{entry['current']:>10.2f}{change:>9}"
+                f"{entry['p']:>9.3g}  {entry['test']}")
+        print(f"{RED}{line}  CHANGED{RESET}" if entry["significant"] else line)
+    if report["changed"]:
+        print(f"{RED}{len(report['changed'])} metric(s) changed significantly (p < {report['alpha']}, "
+              f"at least {report['min_change'] * 100:g}%).{RESET}")
+    else:
+        print(f"{GREEN}No significant changes against the baseline.{RESET}")
+
+
+def load_inventory(path=None):
+    """Load a fleet inventory and return a list of host dicts.
+
+    The file (FLEET_INVENTORY_FILE unless path is given) is JSON: either a list
+    of hosts or {"defaults": {...}, "hosts": [...]}. A host is "user@host[:port]"
+    or a dict with name, address, user, port, transport ("ssh", "local" or
+    "docker" with a container), python (default "python3"), qakit (path of an
+    installed copy; otherwise this script is sent to the host) and ssh_options.
+    Raises ValueError if the file is malformed.
+    """
+    path = path or FLEET_INVENTORY_FILE
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ValueError(f"Could not load inventory from {path}: {e}")
+    defaults, entries = ({}, data) if isinstance(data, list) else (data.get("defaults", {}), data.get("hosts"))
+    if not isinstance(entries, list) or not entries:
+        raise ValueError(f"Inventory {path} lists no hosts.")
+    hosts = []
+    for entry in entries:
+        if isinstance(entry, str):
+            user, _, address = entry.rpartition("@")
+            address, _, port = address.partition(":")
+            entry = {"address": address, **({"user": user} if user else {}), **({"port": int(port)} if port else {})}
+        if not isinstance(entry, dict):
+            raise ValueError(f"Bad inventory entry: {entry!r}")
+        host = {"transport": "ssh", "python": "python3", **defaults, **entry}
+        host.setdefault("name", host.get("address") or host.get("container") or "localhost")
+        if host["transport"] == "ssh" and not host.get("address"):
+            raise ValueError(f"Inventory host {host['name']} has no address.")
+        if host["transport"] == "docker" and not host.get("container"):
+            raise ValueError(f"Inventory host {host['name']} has no container.")
+        if host["transport"] not in ("ssh", "local", "docker"):
+            raise ValueError(f"Inventory host {host['name']} has unknown transport '{host['transport']}'.")
+        hosts.append(host)
+    names = [host["name"] for host in hosts]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Inventory {path} has duplicate host names.")
+    return hosts
+
+
+# Run on a host that has no qakit installed: read exactly N bytes of script from
+# stdin, leaving the rest of stdin for the agent's control messages.
+_FLEET_BOOTSTRAP = ("import sys; source = sys.stdin.buffer.read(int(sys.argv[1])); sys.argv = ['qakit'] + sys.argv[2:]; "
+                    "exec(compile(source, 'qakit.py', 'exec'), {'__name__': '__main__', '__file__': 'qakit.py'})")
+
+
+def _agent_command(host, task, script_size):
+    """argv that starts the fleet agent for task on host."""
+    if host.get("qakit"):
+        remote = [host["python"], host["qakit"], "fleet", "agent", "--task", json.dumps(task)]
+    else:
+        remote = [host["python"], "-c", _FLEET_BOOTSTRAP, str(script_size), "fleet", "agent", "--task", json.dumps(task)]
+    if host["transport"] == "local":
+        return remote
+    if host["transport"] == "docker":
+        return ["docker", "exec", "-i", host["container"], *remote]
+    target = f"{host['user']}@{host['address']}" if host.get("user") else host["address"]
+    return ["ssh", "-T", "-o", "BatchMode=yes", *(["-p", str(host["port"])] if host.get("port") else []),
+            *host.get("ssh_options", []), target, shell_join(remote)]
+
+
+class _FleetSampleWriter:
+    """Metrics writer that streams each sample to the fleet orchestrator.
+
+    Each sample carries "since_start", seconds since the agent's start event on
+    its own monotonic clock, alongside the (per-stage) elapsed time.
+    """
+
+    def __init__(self, fields, emit, started):
+        self.fields = list(fields)
+        self.emit = emit
+        self.started = started
+
+    def write(self, values):
+        self.emit("sample", elapsed=values[0], since_start=round(time.monotonic() - self.started, 3),
+                  metrics=dict(zip(self.fields[1:], values[1:])))
+
+    def close(self):
+        pass
+
+
+def fleet_agent(task):
+    """Run one fleet task on this host, speaking JSON lines on stdout. Returns an exit code.
+
+    Reports "ready", waits for "go" on stdin so every host starts together,
+    then streams "sample" events and ends with "done". A "stop" line or EOF
+    on stdin interrupts the task. Human-readable output goes to stderr.
+    """
+    threading = lazy_import("threading")
+    signal = lazy_import("signal")
+    sys.stdout.flush()
+    channel = os.dup(1)
+    os.dup2(2, 1)
+    lock = threading.Lock()
+
+    def emit(event, **fields):
+        line = json.dumps({"event": event, "time": time.time(), **fields}, default=str) + "\n"
+        with lock:
+            os.write(channel, line.encode())
+
+    try:
+        psutil = lazy_import("psutil")
+    except ImportError:
+        psutil = None
+    kind = task.get("task")
+    if kind not in ("stress", "nwtest", "check"):
+        emit("done", exit_code=2, error=f"unknown task {kind!r}")
+        return 2
+    emit("ready", host=platform.node(), kernel=platform.release(), cores=os.cpu_count(),
+         python=platform.python_version(), psutil=psutil is not None,
+         stress_tool=select_stress_tool() if kind == "stress" else None)
+    if sys.stdin.readline().strip() != "go":
+        emit("done", exit_code=130, error="cancelled before start")
+        return 130
+
+    def watch_stdin():
+        sys.stdin.readline()  # "stop", or EOF when the orchestrator went away
+        # Interrupt the whole group, as Ctrl-C would, so the tools we launched stop too.
+        os.killpg(os.getpgrp(), signal.SIGINT)
+
+    try:
+        os.setpgid(0, 0)  # our own process group, so the interrupt reaches nothing but this task
+    except OSError:
+        pass  # already a group (session) leader
+
+    threading.Thread(target=watch_stdin, daemon=True).start()
+    started = time.monotonic()
+    emit("start")
+    writer = lambda fields: _FleetSampleWriter(fields, emit, started)
+    try:
+        if kind == "check":
+            emit("done", exit_code=0)
+            return 0
+        if kind == "stress":
+            exit_code, results = run_stress(task.get("profile"), task.get("scenario"), task.get("duration"),
+                                            task.get("overrides"), sample_writer=writer)
+            emit("done", exit_code=exit_code, stages=[{key: result[key] for key in
+                                                       ("stage", "settings", "completed", "summary", "run_id")}
+                                                      for result in results])
+            return exit_code
+        targets = [("", address) for address in task.get("addresses") or []] or discover_multicast_groups(
+            task.get("interface"), task.get("prefix"))
+        sampler = ResourceSampler(psutil) if psutil else None
+        if sampler:
+            sampler.start(writer(sampler.fields))
+        try:
+            records = run_nwtest_groups(targets, task.get("duration") or 10, task.get("concurrency") or 4)
+        finally:
+            if sampler:
+                sampler.stop()
+        exit_code = 0 if records and all(record["returncode"] == 0 for record in records) else 1
+        emit("done", exit_code=exit_code, tests=records, summary=sampler.summary() if sampler else {})
+        return exit_code
+    except KeyboardInterrupt:
+        emit("done", exit_code=130, error="interrupted")
+        return 130
+    except Exception as e:
+        emit("done", exit_code=1, error=str(e))
+        return 1
+
+
+def _fleet_session(host, command, script, state, lock):
+    """Drive one host's agent process: send the script, then record its events in state."""
+    collections = lazy_import("collections")
+    threading = lazy_import("threading")
+    entry = state[host["name"]]
+    started_at, start = time.time(), time.perf_counter()
+    try:
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                   env=tool_env(), start_new_session=True)
+    except OSError as e:
+        with lock:
+            entry.update(status="failed", error=str(e))
+        return
+    with lock:
+        entry["process"] = process
+        if entry["status"] == "failed":  # gave up on this host while it was being started
+            _kill_fleet_agent(entry)
+    tail = collections.deque(maxlen=COMMAND_TAIL_LINES)
+    stderr_reader = threading.Thread(target=lambda: tail.extend(
+        line.decode(errors="replace").rstrip() for line in process.stderr), daemon=True)
+    stderr_reader.start()
+    try:
+        if script is not None:
+            try:
+                process.stdin.write(script)
+                process.stdin.flush()
+            except BrokenPipeError:
+                pass  # the agent never started; its stderr says why
+        for raw in process.stdout:
+            received = time.time()
+            try:
+                message = json.loads(raw)
+            except ValueError:
+                continue
+            with lock:
+                event = message.get("event")
+                if event == "ready":
+                    # The agent's clock minus ours, give or take the one-way latency of this message.
+                    entry.update(status="ready", info=message, clock_offset=message["time"] - received)
+                elif event == "start":
+                    entry.update(status="running", started=message["time"])
+                elif event == "sample":
+                    entry["latest"] = message["metrics"]
+                    entry["timeline"].append({"since_start": message["since_start"], "elapsed": message["elapsed"],
+                                              **message["metrics"]})
+                elif event == "done":
+                    entry.update(status="ok" if message.get("exit_code") == 0 else "failed", result=message)
+    except (OSError, ValueError) as e:
+        with lock:
+            entry.update(status="failed", error=str(e))
+    process.wait()
+    stderr_reader.join(timeout=5)
+    with lock:
+        entry["stderr_tail"] = list(tail)
+        if entry["status"] not in ("ok", "failed"):
+            entry.update(status="failed", error=tail[-1] if tail else f"agent exited with code {process.returncode}")
+    trace_command(command, started_at, None, time.perf_counter() - start, process.returncode, pid=process.pid)
+
+
+def _kill_fleet_agent(entry):
+    """Kill a host's agent process and everything it started (it runs in its own session)."""
+    signal = lazy_import("signal")
+    process = entry.get("process")
+    if process is not None and process.poll() is None:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+
+def _send_fleet_control(entry, message):
+    try:
+        entry["process"].stdin.write(f"{message}\n".encode())
+        entry["process"].stdin.flush()
+    except (KeyError, OSError, ValueError):
+        pass
+
+
+def run_fleet(hosts, task, ready_timeout=FLEET_READY_TIMEOUT, report_file=None):
+    """Run a task on every host in parallel with a synchronised start, and merge the results.
+
+    Every agent is started (over ssh, docker exec or locally) and has to report
+    ready within ready_timeout; then all are told to go at once, so start skew
+    is one message latency rather than the connection setup time. Samples are
+    streamed back and shown live. Returns the merged report (also written to
+    report_file as JSON if given).
+    """
+    threading = lazy_import("threading")
+    script = None
+    script_size = 0
+    if not all(host.get("qakit") for host in hosts):
+        with open(os.path.realpath(__file__), "rb") as f:
+            script = f.read()
+        script_size = len(script)
+    lock = threading.Lock()
+    state = {host["name"]: {"status": "connecting", "timeline": [], "latest": None} for host in hosts}
+    sessions = []
+    for host in hosts:
+        command = _agent_command(host, task, script_size)
+        session = threading.Thread(target=_fleet_session, name=f"fleet-{host['name']}", daemon=True,
+                                   args=(host, command, None if host.get("qakit") else script, state, lock))
+        session.start()
+        sessions.append(session)
+
+    print(f"Connecting to {len(hosts)} host(s)...")
+    ready = []
+    go_time = None
+    try:
+        deadline = time.monotonic() + ready_timeout
+        while time.monotonic() < deadline:
+            with lock:
+                pending = [name for name, entry in state.items() if entry["status"] == "connecting"]
+            if not pending:
+                break
+            time.sleep(0.05)
+        with lock:
+            for name, entry in state.items():
+                if entry["status"] == "connecting":
+                    entry.update(status="failed", error=f"not ready after {ready_timeout:g}s")
+                    _kill_fleet_agent(entry)
+            ready = [name for name, entry in state.items() if entry["status"] == "ready"]
+        for name in state:
+            if name not in ready:
+                print(f"{RED}{name}: {state[name].get('error', 'failed to start')}{RESET}")
+        go_time = time.time()
+        for name in ready:
+            _send_fleet_control(state[name], "go")
+        if ready:
+            print(f"{GREEN}Started {task['task']} on {len(ready)} host(s).{RESET}")
+
+        while any(session.is_alive() for session in sessions):
+            for session in sessions:
+                session.join(timeout=FLEET_STATUS_INTERVAL / len(sessions))
+            with lock:
+                parts = []
+                for name in ready:
+                    entry = state[name]
+                    latest = entry["latest"] or {}
+                    if "CPU(%)" in latest:
+                        parts.append(f"{name} {entry['status']} cpu {latest['CPU(%)']:.0f}% "
+                                     f"mem {latest.get('Memory(%)', 0):.0f}%")
+                    else:
+                        parts.append(f"{name} {entry['status']}")
+            print(f"[{time.strftime('%H:%M:%S')}] " + " | ".join(parts), flush=True)
+    except KeyboardInterrupt:
+        print(f"\n{RED}Interrupted; stopping the fleet.{RESET}")
+        with lock:
+            for entry in state.values():
+                if entry["status"] in ("ready", "running"):
+                    _send_fleet_control(entry, "stop")
+                elif entry["status"] == "connecting":
+                    entry.update(status="failed", error="interrupted before start")
+                    _kill_fleet_agent(entry)
+        deadline = time.monotonic() + FLEET_STOP_TIMEOUT
+        for session in sessions:
+            session.join(timeout=max(0, deadline - time.monotonic()))
+        with lock:
+            for entry in state.values():
+                if entry["status"] not in ("ok", "failed"):
+                    entry.update(status="failed", error=f"did not stop within {FLEET_STOP_TIMEOUT}s")
+                    _kill_fleet_agent(entry)
+        for session in sessions:
+            session.join(timeout=1)
+
+    report = merge_fleet_results(task, state, go_time)
+    print_fleet_report(report)
+    if report_file:
+        try:
+            with open(report_file, "w") as f:
+                json.dump(report, f, indent=2, default=str)
+            print(f"{GREEN}Report written to {report_file}{RESET}")
+        except OSError as e:
+            print(f"{RED}Could not write report: {e}{RESET}")
+    return report
+
+
+def merge_fleet_results(task, state, go_time):
+    """Merge per-host agent results into one report with a common timeline.
+
+    Samples are aligned on each agent's own start event (seconds since it, on
+    the agent's monotonic clock, rounded to MONITOR_INTERVAL), so the timeline
+    does not depend on the hosts' wall clocks agreeing. Each host's clock offset
+    is estimated when its ready event arrives, and start offsets (the skew of
+    each start relative to the go signal) are corrected by it, so clock
+    difference and start skew are reported separately.
+    """
+    hosts = {}
+    timeline = {}
+    for name, entry in state.items():
+        clock_offset = entry.get("clock_offset")
+        start_offset = None
+        if entry.get("started") and clock_offset is not None and go_time is not None:
+            start_offset = round(entry["started"] - clock_offset - go_time, 3)
+        result = entry.get("result") or {}
+        summary = result.get("summary")
+        if summary is None and result.get("stages"):
+            summary = result["stages"][-1]["summary"]
+        hosts[name] = {
+            "status": entry["status"],
+            "exit_code": result.get("exit_code"),
+            "error": entry.get("error") or result.get("error"),
+            "info": {key: value for key, value in (entry.get("info") or {}).items() if key not in ("event", "time")},
+            "clock_offset": round(clock_offset, 3) if clock_offset is not None else None,
+            "start_offset": start_offset,
+            "summary": summary or {},
+            "result": {key: value for key, value in result.items() if key not in ("event", "time", "summary")},
+            "samples": len(entry["timeline"]),
+            "stderr_tail": entry.get("stderr_tail", [])[-10:] if not result else [],
+        }
+        for sample in entry["timeline"]:
+            tick = round(round(sample["since_start"] / MONITOR_INTERVAL) * MONITOR_INTERVAL, 3)
+            timeline.setdefault(tick, {})[name] = {key: value for key, value in sample.items()
+                                                   if key != "since_start"}
+    fleet = {}
+    for metric in ("CPU(%)", "Memory(%)", "ProcCPU(%)", "Load1"):
+        means = [host["summary"][metric]["mean"] for host in hosts.values() if metric in host["summary"]]
+        if means:
+            fleet[metric] = {"hosts": len(means), "mean": sum(means) / len(means), "min": min(means), "max": max(means)}
+    offsets = [host["start_offset"] for host in hosts.values() if host["start_offset"] is not None]
+    clocks = [host["clock_offset"] for host in hosts.values() if host["clock_offset"] is not None]
+    return {
+        "task": task,
+        "go_time": go_time,
+        "hosts": hosts,
+        "fleet": fleet,
+        "start_skew": round(max(offsets) - min(offsets), 3) if offsets else None,
+        "clock_spread": round(max(clocks) - min(clocks), 3) if clocks else None,
+        "timeline": [{"t": tick, "hosts": timeline[tick]} for tick in sorted(timeline)],
+        "passed": sum(1 for host in hosts.values() if host["status"] == "ok"),
+    }
+
+
+def print_fleet_report(report):
+    """Print the per-host and fleet-wide summary of a merged fleet report."""
+    print(f"\n{'Host':<20}{'Status':<8}{'Clock(s)':>9}{'Start(s)':>9}{'Samples':>9}{'CPU mean':>10}{'CPU p95':>9}{'Mem max':>9}")
+    for name, host in sorted(report["hosts"].items()):
+        cpu = host["summary"].get("CPU(%)") or {}
+        mem = host["summary"].get("Memory(%)") or {}
+        clock = f"{host['clock_offset']:+.3f}" if host["clock_offset"] is not None else "-"
+        offset = f"{host['start_offset']:+.3f}" if host["start_offset"] is not None else "-"
+        line = (f"{name[:19]:<20}{host['status']:<8}{clock:>9}{offset:>9}{host['samples']:>9}"
+                f"{cpu.get('mean', float('nan')):>10.1f}{cpu.get('p95', float('nan')):>9.1f}"
+                f"{mem.get('max', float('nan')):>9.1f}")
+        print(line if host["status"] == "ok" else f"{RED}{line}  {host['error'] or ''}{RESET}")
+        for stderr_line in host["stderr_tail"]:
+            if stderr_line != host["error"]:
+                print(f"{RED}    {stderr_line}{RESET}")
+    for metric, stats in report["fleet"].items():
+        print(f"Fleet {metric:<12} mean {stats['mean']:.1f}  (hosts range {stats['min']:.1f}-{stats['max']:.1f})")
+    if report["start_skew"] is not None:
+        print(f"Start skew across hosts: {report['start_skew'] * 1000:.0f} ms "
+              f"(clocks differ by up to {report['clock_spread'] * 1000:.0f} ms, corrected for)")
+    color = GREEN if report["passed"] == len(report["hosts"]) else RED
+    print(f"{color}{report['passed']}/{len(report['hosts'])} host(s) completed the {report['task']['task']} task.{RESET}")
+
+
+def linux_version_info():
+    """Return {"distro", "distro_version", "kernel"} on Linux (distro fields None without 'distro'), else None."""
+    if platform.system() != "Linux":
+        return None
+    info = {"distro": None, "distro_version": None, "kernel": platform.release()}
+    try:
+        distro = lazy_import("distro")  # Requires 'pip install distro' if not already installed
+        info["distro"], info["distro_version"] = distro.name(), distro.version()
+    except ImportError:
+        pass
+    return info
+
+
+def adjust_for_linux_version():
+    """
+    If running on Linux, print the distribution and version.
+    You can expand this function to adjust commands or behavior based on the Linux version.
+    """
+    info = linux_version_info()
+    if info:
+        if info["distro"] is not None:
+            print(f"{GREEN}Detected Linux distribution: {info['distro']} {info['distro_version']}{RESET}")
+            # Example adjustment: warn if using an older version (customize as needed)
+            # if distro.id() == "ubuntu" and tuple(map(int, distro_version.split('.'))) < (18, 4):
+            #     print(f"{RED}Warning: Your Ubuntu version ({distro_version}) might not support all features of this script.{RESET}")
+        else:
+            # Fallback if 'distro' is not available
+            print(f"{GREEN}Running on Linux, kernel version: {info['kernel']}{RESET}")
+
+
+def main_menu():
+    def image_tools_menu():
+        options = {
+            "1": ("Convert an image", imagemagick_convert),
+            "2": ("Resize an image", imagemagick_resize),
+            "3": ("Rotate an image", imagemagick_rotate),
+            "4": ("Batch process a directory of images", imagemagick_batch_menu),
+            "5": ("Run a pipeline of image operations", media_pipeline_menu),
+            "6": ("Back to Main Menu", None),
+        }
+        handle_menu("Image Tools", options)
+
+    def video_tools_menu():
+        options = {
+            "1": ("Compress a video", ffmpeg_compress_video),
+            "2": ("Resize a video", ffmpeg_resize_video),
+            "3": ("Extract audio from a video", ffmpeg_extract_audio),
+            "4": ("Set a video's background to green", ffmpeg_set_green_background),
+            "5": ("Run a pipeline of video operations", media_pipeline_menu),
+            "6": ("Back to Main Menu", None),
+        }
+        handle_menu("Video Tools", options)
+
+    def network_tools_menu():
+        options = {
+            "1": ("List multicast addresses", list_multicast_addresses),
+            "2": ("Test a multicast address", nwtest_multicast),
+            "3": ("Test multiple multicast addresses", nwtest_multiple_groups),
+            "4": ("Ping a specific IP or domain", check_connection),
+            "5": ("Ping many hosts or a CIDR range", reachability_sweep_menu),
+            "6": ("Download a file", download_file),
+            "7": ("Watch multicast joins and leaves", watch_multicast_groups),
+            "8": ("Back to Main Menu", None),
+        }
+        handle_menu("Network Tools", options)
+
+    options = {
+        "1": ("Image Tools", image_tools_menu),
+        "2": ("Video Tools", video_tools_menu),
+        "3": ("Network Tools", network_tools_menu),
+        "4": ("Check for Updates", lambda: update_script() if check_for_updates() else None),
+        "5": ("Create Alias for qakit", create_alias),
+        "6": ("Display Dependencies", display_dependencies),
+        "7": ("Stress Testing", stress_test),
+        "8": ("Exit", None),
+    }
+    handle_menu("Main Menu", options)
+
+
+def handle_menu(title, options):
+    while True:
+        print(f"\n--- {title} ---")
+        for key, (desc, _) in options.items():
+            print(f"{key}. {desc}")
+        choice = input("Enter your choice: ").strip()
+        if choice in options:
+            desc, action = options[choice]
+            if action:
+                traced_action("menu", f"{title}: {desc}", action)
+            else:
+                break
+        else:
+            print(f"{RED}Invalid choice. Please try again.{RESET}")
+
+
+def version_tuple(version):
+    return tuple(map(int, version.split(".")))
+
+
+def _load_update_state():
+    try:
+        with open(UPDATE_STATE_FILE, "r") as f:
+            state = json.load(f)
+        return state if isinstance(state, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_update_state(state):
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_file = f"{UPDATE_STATE_FILE}.{os.getpid()}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_file, UPDATE_STATE_FILE)
+    except OSError:
+        pass
+
+
+def parse_script_version(text):
+    """Return the CURRENT_VERSION declared in a qakit.py source, or None."""
+    re = lazy_import("re")
+    match = re.search(r'^CURRENT_VERSION = "([^"]+)"', text, re.MULTILINE)
+    return match.group(1) if match else None
+
+
+def update_digest_url(url=None):
+    """Where the SHA-256 of the script at url is published: UPDATE_SHA256_URL, or url + '.sha256'."""
+    if UPDATE_SHA256_URL:
+        return UPDATE_SHA256_URL
+    base, sep, query = (url or UPDATE_URL).partition("?")
+    return f"{base}.sha256{sep}{query}"
+
+
+def fetch_published_digest(requests, url):
+    """Return the SHA-256 published for url, or None if none is published."""
+    re = lazy_import("re")
+    response = requests.get(update_digest_url(url), timeout=10)
+    if response.status_code == 404:
+        return None
+    if response.status_code != 200:
+        raise IOError(f"HTTP Status {response.status_code} fetching the published checksum")
+    match = re.match(r"\s*([0-9a-fA-F]{64})\b", response.text)
+    if not match:
+        raise IOError("the published checksum is not a SHA-256 digest")
+    return match.group(1).lower()
+
+
+def fetch_latest_script(refresh=False):
+    """Fetch the published qakit.py once, reusing the cached copy where possible.
+
+    Within UPDATE_CHECK_TTL of the last check the cached result is used without
+    any request (unless refresh=True); after that the download is revalidated
+    with If-None-Match/If-Modified-Since, so an unchanged script costs a 304.
+    A new download must be as long as its Content-Length says and, when a
+    digest is published (see update_digest_url()), match it; otherwise it is
+    discarded. Returns the update state dict (latest_version, sha256,
+    published_sha256, ...) or raises.
+    """
+    state = _load_update_state()
+    cached_body = os.path.exists(UPDATE_BODY_FILE) and state.get("url") == UPDATE_URL
+    if cached_body and not refresh and time.time() - state.get("checked_at", 0) < UPDATE_CHECK_TTL:
+        return state
+
+    requests = lazy_import("requests")
+    headers = {"Accept-Encoding": "identity"}  # so Content-Length is the length of the script itself
+    if cached_body:
+        if state.get("etag"):
+            headers["If-None-Match"] = state["etag"]
+        if state.get("last_modified"):
+            headers["If-Modified-Since"] = state["last_modified"]
+    response = requests.get(UPDATE_URL, headers=headers, timeout=10)
+    if response.status_code == 304 and cached_body:
+        state["checked_at"] = time.time()
+        _save_update_state(state)
+        return state
+    if response.status_code != 200:
+        raise IOError(f"HTTP Status: {response.status_code}")
+
+    body = response.content
+    expected_size = _header_size(response.headers.get("Content-Length"))
+    if expected_size is not None and response.headers.get("Content-Encoding", "identity") == "identity" \
+            and len(body) != expected_size:
+        raise IOError(f"the download is {len(body)} bytes but the server announced {expected_size}")
+    latest_version = parse_script_version(body.decode("utf-8", errors="replace"))
+    if latest_version is None:
+        raise IOError("the downloaded script does not declare CURRENT_VERSION")
+    hashlib = lazy_import("hashlib")
+    sha256 = hashlib.sha256(body).hexdigest()
+    published_sha256 = fetch_published_digest(requests, UPDATE_URL)
+    if published_sha256 is not None and published_sha256 != sha256:
+        raise IOError(f"the download does not match the published checksum ({sha256} != {published_sha256})")
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_file = f"{UPDATE_BODY_FILE}.{os.getpid()}.tmp"
+    with open(tmp_file, "wb") as f:
+        f.write(body)
+    os.replace(tmp_file, UPDATE_BODY_FILE)
+    state = {
+        "url": UPDATE_URL,
+        "checked_at": time.time(),
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "latest_version": latest_version,
+        "sha256": sha256,
+        "published_sha256": published_sha256,
+        "size": len(body),
+    }
+    _save_update_state(state)
+    return state
+
+
+def check_for_updates(refresh=False):
+    """Report whether a newer version is published: True, False, or None if the check failed."""
+    print("Checking for updates...")
+    try:
+        state = fetch_latest_script(refresh)
+        latest_version = state["latest_version"]
+        if version_tuple(latest_version) > version_tuple(CURRENT_VERSION):
+            print(f"{GREEN}A newer version ({latest_version}) is available!{RESET}")
+            return True
         else:
-            print(f"{RED}Failed to fetch the update. HTTP Status: {response.status_code}{RESET}")
+            print(f"{GREEN}You are using the latest version.{RESET}")
+            return False
+    except Exception as e:
+        print(f"{RED}Error checking for updates: {e}{RESET}")
+    return None
+
+
+def update_script():
+    """Install the script fetched by check_for_updates().
+
+    The cached download must match the separately published SHA-256 and
+    compile; then it is written to a temporary file next to this script,
+    verified again and renamed over it, so an interruption never leaves a
+    truncated qakit.py behind. When no digest is published, the download is
+    only checked against its Content-Length (when it was fetched) and the
+    checksum recorded then, with a warning.
+    """
+    print("Updating script...")
+    try:
+        state = fetch_latest_script()
+        if "published_sha256" not in state:  # recorded before checksums were checked
+            state = fetch_latest_script(refresh=True)
+        if not state.get("published_sha256"):
+            print(f"{RED}WARNING: no checksum is published at {update_digest_url()}; the update is only checked "
+                  f"for a complete download that compiles, not against a digest from the publisher.{RESET}")
+        expected = state.get("published_sha256") or state["sha256"]
+        with open(UPDATE_BODY_FILE, "rb") as f:
+            body = f.read()
+        hashlib = lazy_import("hashlib")
+        if hashlib.sha256(body).hexdigest() != expected:
+            # The cached copy was damaged; drop it (so the server can't answer 304) and fetch it again.
+            os.remove(UPDATE_BODY_FILE)
+            state = fetch_latest_script(refresh=True)
+            with open(UPDATE_BODY_FILE, "rb") as f:
+                body = f.read()
+            expected = state.get("published_sha256") or state["sha256"]
+            if hashlib.sha256(body).hexdigest() != expected:
+                print(f"{RED}The downloaded update failed verification. Nothing was changed.{RESET}")
+                return
+        try:
+            compile(body, "qakit.py", "exec")
+        except SyntaxError as e:
+            print(f"{RED}The downloaded update is not valid Python ({e}). Nothing was changed.{RESET}")
+            return
+
+        script_path = os.path.realpath(__file__)
+        tempfile = lazy_import("tempfile")
+        try:
+            fd, tmp_file = tempfile.mkstemp(prefix=".qakit-update-", dir=os.path.dirname(script_path))
+            try:
+                with os.fdopen(fd, "wb") as script_file:
+                    script_file.write(body)
+                    script_file.flush()
+                    os.fsync(script_file.fileno())
+                shutil.copymode(script_path, tmp_file)
+                if file_digest(tmp_file) != expected:
+                    raise IOError("the written update does not match the downloaded checksum")
+                os.replace(tmp_file, script_path)
+            except BaseException:
+                if os.path.exists(tmp_file):
+                    os.remove(tmp_file)
+                raise
+            print(f"{GREEN}Script updated successfully to version {state['latest_version']}! Please restart.{RESET}")
+            sys.exit()
+        except PermissionError:
+            print(f"{RED}Permission denied. Please run the script with sudo privileges to update.{RESET}")
     except Exception as e:
         print(f"{RED}Error updating script: {e}{RESET}")
 
 
+def _write_png(path, width=16, height=16):
+    """Write a small valid RGB PNG without any imaging library."""
+    struct = lazy_import("struct")
+    zlib = lazy_import("zlib")
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    raw = b"".join(b"\x00" + b"".join(bytes(((x * 15) % 256, (y * 15) % 256, 128)) for x in range(width))
+                   for y in range(height))
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+        f.write(chunk(b"IDAT", zlib.compress(raw)))
+        f.write(chunk(b"IEND", b""))
+
+
+def _write_stub(bin_dir, name, script):
+    path = os.path.join(bin_dir, name)
+    with open(path, "w") as f:
+        f.write("#!/bin/sh\n" + script + "\n")
+    os.chmod(path, 0o755)
+
+
+def make_bench_fixtures(work_dir, images=BENCH_IMAGES):
+    """Create synthetic fixtures: tiny PNGs, a tiny video if ffmpeg exists, and stub tools.
+
+    A stub nwtest is always used; 'convert' and 'ffmpeg' are
+    stubbed only when the real tools are missing. Returns a description dict.
+    """
+    bin_dir = os.path.join(work_dir, "bin")
+    image_dir = os.path.join(work_dir, "images")
+    os.makedirs(bin_dir, exist_ok=True)
+    os.makedirs(image_dir, exist_ok=True)
+    for index in range(images):
+        _write_png(os.path.join(image_dir, f"fixture_{index:04d}.png"))
+    _write_stub(bin_dir, "nwtest", 'echo "nwtest stub $*"')
+    fixtures = {"work_dir": work_dir, "bin_dir": bin_dir, "image_dir": image_dir, "images": images,
+                "convert": "real" if shutil.which("convert") else "stub",
+                "ffmpeg": "real" if shutil.which("ffmpeg") else "stub"}
+    if fixtures["convert"] == "stub":
+        _write_stub(bin_dir, "convert", 'for last; do :; done; cp "$1" "$last"')
+    video = os.path.join(work_dir, "fixture.mp4")
+    if fixtures["ffmpeg"] == "real":
+        subprocess.run(["ffmpeg", "-v", "error", "-y", "-f", "lavfi", "-i", "testsrc=size=64x48:rate=10",
+                        "-t", "1", video], stdin=subprocess.DEVNULL, check=False)
+    else:
+        # Copies the -i input to the output (the last argument), whatever the options in between.
+        _write_stub(bin_dir, "ffmpeg", 'while [ $# -gt 1 ]; do [ "$1" = -i ] && input=$2; shift; done; cp "$input" "$1"')
+        with open(video, "wb") as f:
+            f.write(os.urandom(4096))
+    fixtures["video"] = video
+    return fixtures
+
+
+def _silenced(func, *args, **kwargs):
+    """Call func with stdout/stderr (ours and any child's) sent to /dev/null."""
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = os.dup(1), os.dup(2)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.dup2(devnull, 2)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(saved[0], 1)
+        os.dup2(saved[1], 2)
+        for fd in (*saved, devnull):
+            os.close(fd)
+
+
+def _bench_stats(samples, unit):
+    statistics = lazy_import("statistics")
+    return {"unit": unit, "samples": [round(sample, 6) for sample in samples],
+            "min": min(samples), "median": statistics.median(samples), "mean": statistics.mean(samples),
+            "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0, "max": max(samples)}
+
+
+def _time_repeated(func, warmup, repeat):
+    """Run func warmup times untimed, then repeat times timed. Returns the durations in seconds."""
+    for _ in range(warmup):
+        _silenced(func)
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _silenced(func)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def run_benchmarks(warmup=1, repeat=5, only=None):
+    """Run the built-in benchmark suite against synthetic fixtures.
+
+    Measures startup (subcommand fast path and cached dependency probe),
+    run_command() spawn overhead (argv and shell), image batch and nwtest runner throughput, and
+    stress monitor sampling jitter. Returns a JSON-serialisable results dict.
+    """
+    global _tool_env
+    tempfile = lazy_import("tempfile")
+    results = {
+        "qakit_version": CURRENT_VERSION,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "host": platform.node(),
+        "cpus": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "warmup": warmup,
+        "repeat": repeat,
+        "benchmarks": {},
+    }
+    benchmarks = results["benchmarks"]
+    saved_env = {key: os.environ.get(key) for key in ("PATH", "XDG_CACHE_HOME", "QAKIT_TRACE", "QAKIT_RESULTS_DB",
+                                                       "QAKIT_SOCKET")}
+    with tempfile.TemporaryDirectory(prefix="qakit-bench-") as work_dir:
+        fixtures = make_bench_fixtures(work_dir)
+        results["fixtures"] = {key: fixtures[key] for key in ("images", "convert", "ffmpeg")}
+        # Both the qakit subprocesses and this process keep their state (transcode
+        # cache, trace, media index...) in the scratch directory, not the user's.
+        os.environ["PATH"] = fixtures["bin_dir"] + os.pathsep + os.environ.get("PATH", "")
+        os.environ["XDG_CACHE_HOME"] = os.path.join(work_dir, "cache")
+        for key in ("QAKIT_TRACE", "QAKIT_RESULTS_DB", "QAKIT_SOCKET"):
+            os.environ.pop(key, None)
+        saved_settings = _use_cache_dir(os.path.join(work_dir, "cache", "qakit"))
+        _tool_env = None  # rebuild the tool environment with the fixture PATH
+        script = os.path.realpath(__file__)
+        wanted = lambda name: not only or any(name.startswith(prefix) for prefix in only)
+        try:
+            if wanted("startup.version"):
+                benchmarks["startup.version"] = _bench_stats(_time_repeated(
+                    lambda: subprocess.run([sys.executable, script, "version"], check=False), warmup, repeat), "s")
+            if wanted("startup.deps"):
+                benchmarks["startup.deps"] = _bench_stats(_time_repeated(
+                    lambda: subprocess.run([sys.executable, script, "deps"], check=False), max(1, warmup), repeat), "s")
+            if wanted("run_command"):
+                calls = 20
+                samples = _time_repeated(lambda: [run_command(["true"]) for _ in range(calls)], warmup, repeat)
+                benchmarks["run_command.overhead"] = _bench_stats([sample / calls for sample in samples], "s/call")
+                samples = _time_repeated(lambda: [run_command("true") for _ in range(calls)], warmup, repeat)
+                benchmarks["run_command.shell"] = _bench_stats([sample / calls for sample in samples], "s/call")
+            if wanted("media.image_batch"):
+                out_dir = os.path.join(work_dir, "batch_out")
+                samples = _time_repeated(
+                    lambda: imagemagick_batch(fixtures["image_dir"], "resize:8x8", out_dir, force=True),
+                    warmup, repeat)
+                benchmarks["media.image_batch"] = _bench_stats([fixtures["images"] / sample for sample in samples],
+                                                               "files/s")
+            if wanted("media.video_cache_hit"):
+                out_file = os.path.join(work_dir, "video_out.mp4")
+                args = ["-vf", "scale=32:24"]
+                _silenced(cached_transcode, fixtures["video"], args, out_file)  # populate the cache
+                benchmarks["media.video_cache_hit"] = _bench_stats(_time_repeated(
+                    lambda: cached_transcode(fixtures["video"], args, out_file), warmup, repeat), "s")
+            if wanted("network.nwtest_groups"):
+                targets = [("bench0", f"239.255.0.{index}") for index in range(1, 17)]
+                benchmarks["network.nwtest_groups"] = _bench_stats(_time_repeated(
+                    lambda: run_nwtest_groups(targets, 0, concurrency=8), warmup, repeat), "s")
+            if wanted("stress.monitor_jitter"):
+                try:
+                    psutil = lazy_import("psutil")
+                except ImportError:
+                    results.setdefault("skipped", {})["stress.monitor_jitter"] = "psutil not installed"
+                else:
+                    jitter = []
+                    for _ in range(repeat):
+                        sampler = ResourceSampler(psutil, interval=0.05)
+                        sample = sampler.sample
+
+                        def timed_sample(elapsed, sampler=sampler, sample=sample):
+                            jitter.append(time.monotonic() - sampler.start_time - elapsed)
+                            sample(elapsed)
+
+                        sampler.sample = timed_sample
+                        sampler.start()
+                        time.sleep(1.0)
+                        sampler.stop()
+                    benchmarks["stress.monitor_jitter"] = _bench_stats([abs(value) for value in jitter], "s")
+        finally:
+            for key, value in saved_env.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+            _restore_settings(saved_settings)
+            _tool_env = None
+    return results
+
+
+def print_benchmarks(results, baseline=None, tolerance=BENCH_TOLERANCE):
+    """Print benchmark medians, and the change against a baseline results dict if given.
+
+    Returns the names of benchmarks that regressed by more than tolerance.
+    """
+    regressions = []
+    print(f"\nqakit {results['qakit_version']} benchmarks ({results['repeat']} runs after {results['warmup']} warm-up)")
+    header = f"{'Benchmark':<28}{'Median':>12} {'Unit':<8}{'Stdev':>10}"
+    print(header + (f"{'Baseline':>14}{'Change':>10}" if baseline else ""))
+    for name, stats in results["benchmarks"].items():
+        line = f"{name:<28}{stats['median']:>12.4f} {stats['unit']:<8}{stats['stdev']:>10.4f}"
+        old = (baseline or {}).get("benchmarks", {}).get(name)
+        if old and old["median"]:
+            change = (stats["median"] - old["median"]) / old["median"]
+            # Throughput units are better when higher; everything else when lower.
+            worse = -change if stats["unit"].endswith("/s") else change
+            color = RED if worse > tolerance else GREEN if worse < -tolerance else ""
+            if worse > tolerance:
+                regressions.append(name)
+            line += f"{old['median']:>14.4f}{color}{change * 100:>+9.1f}%{RESET if color else ''}"
+        print(line)
+    for name, reason in results.get("skipped", {}).items():
+        print(f"{name:<28}skipped: {reason}")
+    if baseline:
+        if regressions:
+            print(f"{RED}Regressions beyond {tolerance * 100:.0f}%: {', '.join(regressions)}{RESET}")
+        else:
+            print(f"{GREEN}No regressions beyond {tolerance * 100:.0f}%.{RESET}")
+    return regressions
+
+
+def _daemon_request(request, fds=(), socket_path=None, timeout=None, on_message=None):
+    """Send one JSON request to the daemon, optionally passing file descriptors.
+
+    The daemon answers with JSON lines; on_message is called for each one and
+    the last is returned. Raises OSError when no daemon is listening.
+    """
+    socket = lazy_import("socket")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.settimeout(timeout)
+        conn.connect(socket_path or DAEMON_SOCKET)
+        payload = json.dumps(request).encode() + b"\n"
+        if fds:
+            socket.send_fds(conn, [payload], list(fds))
+        else:
+            conn.sendall(payload)
+        reply, buffer = None, b""
+        for chunk in iter(lambda: conn.recv(65536), b""):
+            buffer += chunk
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                reply = json.loads(line)
+                if on_message:
+                    on_message(reply)
+    return reply
+
+
+def load_environment_settings():
+    """Reapply _environment_settings() from the current environment.
+
+    Used when a job runs with another process's environment (a forwarded daemon
+    job), so it sees the same settings as running qakit directly would.
+    """
+    global _tool_env
+    _restore_settings(_environment_settings())
+    _tool_env = None
+
+
+def _run_forwarded(request, fds):
+    """Run a forwarded subcommand in a forked daemon child, as if the client had run it."""
+    sys.stdout.flush()
+    sys.stderr.flush()
+    for target, fd in zip((0, 1, 2), fds):
+        os.dup2(fd, target)
+    os.environ.clear()
+    os.environ.update(request.get("env") or {})
+    os.environ.pop("QAKIT_DAEMON", None)  # the job runs here; do not forward it again
+    try:
+        load_environment_settings()
+        os.chdir(request.get("cwd") or "/")
+        return main(request["argv"])
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except KeyboardInterrupt:
+        print(f"{RED}Interrupted.{RESET}")
+        return 130
+    except Exception as e:
+        print(f"{RED}Error running forwarded command: {e}{RESET}")
+        return 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+
+def serve_daemon(socket_path=None):
+    """Serve forwarded subcommands on a Unix socket until stopped.
+
+    Imports and dependency probes are paid once at startup. Each request is
+    handled in a forked child that inherits this warm state, adopts the
+    client's stdin/stdout/stderr (passed over the socket), environment and
+    working directory, and runs the subcommand exactly as main() would.
+    """
+    socket = lazy_import("socket")
+    socketserver = lazy_import("socketserver")
+    signal = lazy_import("signal")
+    struct = lazy_import("struct")
+    socket_path = socket_path or DAEMON_SOCKET
+    if not hasattr(socket, "AF_UNIX") or not hasattr(os, "fork"):
+        print(f"{RED}The job daemon needs Unix domain sockets and fork().{RESET}")
+        return 1
+    if os.path.exists(socket_path):
+        try:
+            status = _daemon_request({"op": "status"}, socket_path=socket_path, timeout=2)
+            print(f"{RED}A daemon is already listening on {socket_path} (pid {status['pid']}).{RESET}")
+            return 1
+        except (OSError, ValueError, TypeError):
+            os.remove(socket_path)  # stale socket from a daemon that did not shut down cleanly
+    socket_dir = os.path.dirname(os.path.abspath(socket_path))
+    if not os.path.isdir(socket_dir) or socket_dir == os.path.abspath(CACHE_DIR):
+        # Only directories qakit owns are locked down; an existing one named by QAKIT_SOCKET is left alone.
+        os.makedirs(socket_dir, mode=0o700, exist_ok=True)
+        os.chmod(socket_dir, 0o700)
+
+    probe_tools(DEPENDENCY_TOOLS.values())
+    for name in ("argparse", "shlex", "hashlib", "concurrent.futures", "asyncio", "psutil", "requests"):
+        try:
+            lazy_import(name)
+        except ImportError:
+            pass
+    tool_env()
+    state = {"pid": os.getpid(), "started": time.time(), "requests": 0, "socket": socket_path}
+
+    class Handler(socketserver.BaseRequestHandler):
+        def handle(self):
+            conn = self.request
+            if hasattr(socket, "SO_PEERCRED"):
+                # Jobs run with this user's privileges; only serve the same user.
+                _, uid, _ = struct.unpack("3i", conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                                                                struct.calcsize("3i")))
+                if uid != os.getuid():
+                    conn.sendall(b'{"error": "permission denied"}\n')
+                    return
+            data, fds, _, _ = socket.recv_fds(conn, 65536, 3)
+            while data and not data.endswith(b"\n"):
+                chunk = conn.recv(65536)
+                if not chunk:
+                    break
+                data += chunk
+            try:
+                request = json.loads(data)
+                op = request["op"]
+            except (ValueError, KeyError, TypeError):
+                conn.sendall(b'{"error": "bad request"}\n')
+                return
+            if op == "status":
+                conn.sendall(json.dumps({**state, "uptime": round(time.time() - state["started"], 1)}).encode() + b"\n")
+            elif op == "stop":
+                conn.sendall(b'{"stopping": true}\n')
+                os.kill(state["pid"], signal.SIGTERM)
+            elif op == "run" and len(fds) == 3:
+                # Lead a process group so the client can interrupt the whole job with killpg().
+                os.setpgid(0, 0)
+                conn.sendall(json.dumps({"pid": os.getpid()}).encode() + b"\n")
+                exit_code = _run_forwarded(request, fds)
+                conn.sendall(json.dumps({"exit_code": exit_code}).encode() + b"\n")
+            else:
+                conn.sendall(b'{"error": "unsupported request"}\n')
+
+    class Server(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+        def process_request(self, request, client_address):
+            state["requests"] += 1
+            super().process_request(request, client_address)
+
+    def stop(signum, frame):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    # Bind under a private umask so the socket is never reachable by other users, even briefly.
+    previous_umask = os.umask(0o077)
+    try:
+        server = Server(socket_path, Handler)
+    finally:
+        os.umask(previous_umask)
+    with server:
+        print(f"{GREEN}qakit daemon {os.getpid()} listening on {socket_path}{RESET}", flush=True)
+        try:
+            server.serve_forever()
+        except (SystemExit, KeyboardInterrupt):
+            pass
+        finally:
+            if os.getpid() == state["pid"]:
+                os.remove(socket_path)
+    print("qakit daemon stopped.", flush=True)
+    return 0
+
+
+def start_daemon(socket_path=None, foreground=False):
+    """Start the job daemon, detached unless foreground=True. Returns an exit code."""
+    socket_path = socket_path or DAEMON_SOCKET
+    if foreground or not hasattr(os, "fork"):
+        return serve_daemon(socket_path)
+    sys.stdout.flush()
+    pid = os.fork()
+    if pid == 0:
+        os.setsid()
+        if os.fork():
+            os._exit(0)
+        os.makedirs(os.path.dirname(DAEMON_LOG_FILE), exist_ok=True)
+        with open(os.devnull, "rb") as null, open(DAEMON_LOG_FILE, "ab") as log:
+            os.dup2(null.fileno(), 0)
+            os.dup2(log.fileno(), 1)
+            os.dup2(log.fileno(), 2)
+        try:
+            code = serve_daemon(socket_path)
+        except BaseException:
+            code = 1
+        sys.stdout.flush()
+        os._exit(code or 0)
+    os.waitpid(pid, 0)
+    deadline = time.monotonic() + 30  # startup includes the dependency probes
+    while time.monotonic() < deadline:
+        status = daemon_status(socket_path)
+        if status:
+            print(f"{GREEN}qakit daemon started (pid {status['pid']}) on {socket_path}.{RESET}")
+            return 0
+        time.sleep(0.1)
+    print(f"{RED}The daemon did not come up; see {DAEMON_LOG_FILE}.{RESET}")
+    return 1
+
+
+def daemon_status(socket_path=None):
+    """Status dict of the running daemon, or None if none is listening."""
+    try:
+        return _daemon_request({"op": "status"}, socket_path=socket_path, timeout=2)
+    except (OSError, ValueError):
+        return None
+
+
+def forward_to_daemon(argv, socket_path=None):
+    """Run a subcommand in the daemon with this process's stdio. Returns its exit code, or None if no daemon."""
+    job = {}
+    signal = lazy_import("signal")
+    request = {"op": "run", "argv": argv, "cwd": os.getcwd(), "env": dict(os.environ)}
+    sys.stdout.flush()
+    try:
+        reply = _daemon_request(request, fds=(0, 1, 2), socket_path=socket_path, on_message=job.update)
+    except KeyboardInterrupt:
+        if "pid" in job:
+            try:
+                os.killpg(job["pid"], signal.SIGINT)
+            except OSError:
+                pass
+        raise
+    except (OSError, ValueError):
+        return None
+    return reply.get("exit_code", 1) if reply else 1
+
+
+def build_parser():
+    """Build the command-line parser. Without a subcommand qakit starts the interactive menu.
+
+    Every subcommand sets a handler returning (exit_code, result); the result is
+    what --json prints.
+    """
+    argparse = lazy_import("argparse")
+    parser = argparse.ArgumentParser(
+        prog="qakit",
+        description=f"Craig's QA Kit - Version {CURRENT_VERSION}",
+    )
+    parser.add_argument("--startup-profile", action="store_true",
+                        help="report import and startup-stage timings on stderr")
+    parser.add_argument("--log", metavar="FILE",
+                        help="append the output of every executed command to FILE")
+    parser.add_argument("--json", action="store_true",
+                        help="print a JSON result on stdout; human-readable output goes to stderr")
+    parser.add_argument("--daemon", action="store_true", default=os.getenv("QAKIT_DAEMON") == "1",
+                        help="run the subcommand in the running 'qakit daemon' (default when QAKIT_DAEMON=1)")
+    subparsers = parser.add_subparsers(dest="command", metavar="<command>")
+
+    deps_parser = subparsers.add_parser("deps", help="show tool dependency status")
+    deps_parser.add_argument("--refresh", action="store_true",
+                             help="ignore the probe cache and re-run the version probes")
+    deps_parser.set_defaults(handler=_cmd_deps)
+
+    subparsers.add_parser("version", help="print the qakit version").set_defaults(handler=_cmd_version)
+    subparsers.add_parser("alias", help="create a shell alias for qakit").set_defaults(handler=_cmd_alias)
+
+    cache_parser = subparsers.add_parser("cache", help="inspect or clear the ffmpeg transcode cache")
+    cache_parser.add_argument("action", choices=["stats", "clear"])
+    cache_parser.set_defaults(handler=_cmd_cache)
+
+    media_parser = subparsers.add_parser("media", help="index image/video metadata used to skip no-op work")
+    media_parser.add_argument("action", choices=["scan", "info"],
+                              help="scan: index a directory, glob or file; info: show one file's metadata")
+    media_parser.add_argument("path")
+    media_parser.add_argument("--workers", type=int, help="concurrent probes for scan (default: one per CPU)")
+    media_parser.add_argument("--refresh", action="store_true", help="re-probe files even if already indexed")
+    media_parser.set_defaults(handler=_cmd_media)
+
+    metrics_parser = subparsers.add_parser("metrics", help="print a stress monitoring log (CSV or .bin) as CSV")
+    metrics_parser.add_argument("file")
+    metrics_parser.set_defaults(handler=_cmd_metrics)
+
+    image_parser = subparsers.add_parser("image", help="ImageMagick tools")
+    image_subparsers = image_parser.add_subparsers(dest="action", metavar="<action>", required=True)
+    convert_parser = image_subparsers.add_parser("convert", help="convert an image to another format")
+    convert_parser.add_argument("--in", dest="input_file", required=True)
+    convert_parser.add_argument("--format", required=True, help="output format, e.g. png")
+    convert_parser.set_defaults(handler=lambda args: _returncode_result(
+        imagemagick_convert(args.input_file, args.format)))
+    resize_parser = image_subparsers.add_parser("resize", help="resize an image")
+    resize_parser.add_argument("--in", dest="input_file", required=True)
+    resize_parser.add_argument("--size", required=True, help="dimensions, e.g. 800x600")
+    resize_parser.add_argument("--out", dest="output_file", required=True)
+    resize_parser.set_defaults(handler=lambda args: _returncode_result(
+        imagemagick_resize(args.input_file, args.size, args.output_file)))
+    rotate_parser = image_subparsers.add_parser("rotate", help="rotate an image")
+    rotate_parser.add_argument("--in", dest="input_file", required=True)
+    rotate_parser.add_argument("--angle", required=True, help="degrees, e.g. 90")
+    rotate_parser.add_argument("--out", dest="output_file", required=True)
+    rotate_parser.set_defaults(handler=lambda args: _returncode_result(
+        imagemagick_rotate(args.input_file, args.angle, args.output_file)))
+    batch_parser = image_subparsers.add_parser("batch", help="apply an operation to a directory or glob of images")
+    batch_parser.add_argument("source", help="input directory, glob pattern or file")
+    batch_parser.add_argument("--op", required=True,
+                              help="operation spec: convert:<format>, resize:<WxH> or rotate:<degrees>")
+    batch_parser.add_argument("--out", required=True, help="output directory")
+    batch_parser.add_argument("--workers", type=int, default=None,
+                              help="maximum concurrent jobs (default: CPU count)")
+    batch_parser.add_argument("--force", action="store_true",
+                              help="reprocess files even if the output is newer than the input")
+    batch_parser.set_defaults(handler=_cmd_image_batch)
+
+    video_parser = subparsers.add_parser("video", help="FFmpeg tools")
+    video_subparsers = video_parser.add_subparsers(dest="action", metavar="<action>", required=True)
+    compress_parser = video_subparsers.add_parser("compress", help="compress a video (H.264, CRF 28)")
+    compress_parser.add_argument("--in", dest="input_file", required=True)
+    compress_parser.add_argument("--out", dest="output_file", required=True)
+    compress_parser.set_defaults(handler=lambda args: _returncode_result(
+        ffmpeg_compress_video(args.input_file, args.output_file)))
+    video_resize_parser = video_subparsers.add_parser("resize", help="resize a video")
+    video_resize_parser.add_argument("--in", dest="input_file", required=True)
+    video_resize_parser.add_argument("--size", required=True, help="dimensions, e.g. 1280x720")
+    video_resize_parser.add_argument("--out", dest="output_file", required=True)
+    video_resize_parser.set_defaults(handler=lambda args: _returncode_result(
+        ffmpeg_resize_video(args.input_file, args.size, args.output_file)))
+    audio_parser = video_subparsers.add_parser("extract-audio", help="extract the audio track from a video")
+    audio_parser.add_argument("--in", dest="input_file", required=True)
+    audio_parser.add_argument("--out", dest="output_file", required=True)
+    audio_parser.set_defaults(handler=lambda args: _returncode_result(
+        ffmpeg_extract_audio(args.input_file, args.output_file)))
+    green_parser = video_subparsers.add_parser("green-background", help="replace a background colour with green")
+    green_parser.add_argument("--in", dest="input_file", required=True)
+    green_parser.add_argument("--color", required=True, help="colour to replace, e.g. black")
+    green_parser.add_argument("--out", dest="output_file", required=True)
+    green_parser.set_defaults(handler=lambda args: _returncode_result(
+        ffmpeg_set_green_background(args.input_file, args.color, args.output_file)))
+
+    pipeline_parser = subparsers.add_parser("pipeline", help="run chained media operations as a job graph")
+    pipeline_source = pipeline_parser.add_mutually_exclusive_group(required=True)
+    pipeline_source.add_argument("--file", help="JSON pipeline file declaring jobs and their dependencies")
+    pipeline_source.add_argument("--in", dest="source", help="input directory, glob or file (one job per input)")
+    pipeline_parser.add_argument("--steps", help="comma-separated steps, e.g. resize:1280x720,compress,extract-audio")
+    pipeline_parser.add_argument("--out", help="output directory (with --in)")
+    pipeline_parser.add_argument("--budget", type=int, help="CPUs to use across all jobs (default: CPU count)")
+    pipeline_parser.set_defaults(handler=_cmd_pipeline)
+
+    network_parser = subparsers.add_parser("network", help="network tools")
+    network_subparsers = network_parser.add_subparsers(dest="action", metavar="<action>", required=True)
+    for name, help_text in (("list-multicast", "list joined multicast addresses"),
+                            ("watch-multicast", "print multicast joins and leaves as they happen")):
+        multicast_parser = network_subparsers.add_parser(name, help=help_text)
+        multicast_parser.add_argument("--interface", help="only groups joined on this interface")
+        multicast_parser.add_argument("--prefix", help="only addresses starting with this prefix (e.g. 239.)")
+        multicast_parser.add_argument("--family", action="append", choices=["inet", "inet6", "link"],
+                                      help="only this address family (repeatable)")
+        multicast_parser.add_argument("--source", choices=["auto", "proc", "ip"], default="auto",
+                                      help="read /proc/net/igmp{,6} or parse 'ip maddr show' (default: auto)")
+    multicast_parser.add_argument("--interval", type=float, default=MULTICAST_WATCH_INTERVAL,
+                                  help=f"seconds between polls (default: {MULTICAST_WATCH_INTERVAL:g})")
+    multicast_parser.add_argument("--duration", type=float, help="stop after this many seconds")
+    network_subparsers.choices["list-multicast"].set_defaults(handler=lambda args: _returncode_result(
+        list_multicast_addresses(args.interface, args.prefix, args.family, args.source)))
+    multicast_parser.set_defaults(handler=lambda args: (0, {"events": watch_multicast_groups(
+        args.interval, args.interface, args.prefix, args.family, args.source, args.duration)}))
+    nwtest_parser = network_subparsers.add_parser("nwtest", help="test one multicast address with nwtest")
+    nwtest_parser.add_argument("--address", required=True)
+    nwtest_parser.add_argument("--duration", type=int, required=True, help="seconds")
+    nwtest_parser.set_defaults(handler=lambda args: _returncode_result(
+        nwtest_multicast(args.address, args.duration)))
+    groups_parser = network_subparsers.add_parser("nwtest-groups",
+                                                  help="run nwtest against many joined multicast groups")
+    groups_parser.add_argument("--duration", type=int, required=True, help="seconds per test")
+    groups_parser.add_argument("--concurrency", type=int, default=4, help="tests to run at once (default: 4)")
+    groups_parser.add_argument("--interface", help="only test groups joined on this interface")
+    groups_parser.add_argument("--prefix", help="only test addresses starting with this prefix (e.g. 239.)")
+    groups_parser.add_argument("--address", action="append",
+                               help="test this address instead of discovering groups (repeatable)")
+    groups_parser.add_argument("--ipv6", action="store_true", help="include IPv6 groups")
+    groups_parser.add_argument("--include-local", action="store_true",
+                               help="include link-local control groups such as 224.0.0.1")
+    groups_parser.add_argument("--results", dest="json_file", metavar="FILE", help="write results to FILE as JSON")
+    groups_parser.set_defaults(handler=_cmd_nwtest_groups)
+    ping_parser = network_subparsers.add_parser("ping", help="ping an IP or domain")
+    ping_parser.add_argument("target")
+    ping_parser.set_defaults(handler=lambda args: _returncode_result(check_connection(args.target)))
+    sweep_parser = network_subparsers.add_parser("sweep", help="ping many hosts or CIDR ranges concurrently")
+    sweep_parser.add_argument("targets", nargs="*", help="IPs, domains or CIDR ranges")
+    sweep_parser.add_argument("--file", help="read targets from FILE (one per line)")
+    sweep_parser.add_argument("--count", type=int, default=4, help="packets per host (default: 4)")
+    sweep_parser.add_argument("--timeout", type=int, default=1, help="seconds to wait for each reply (default: 1)")
+    sweep_parser.add_argument("--concurrency", type=int, default=SWEEP_CONCURRENCY,
+                              help=f"hosts pinged at once (default: {SWEEP_CONCURRENCY})")
+    sweep_parser.set_defaults(handler=_cmd_sweep)
+    download_parser = network_subparsers.add_parser("download", help="download a file or a manifest of files")
+    download_source = download_parser.add_mutually_exclusive_group(required=True)
+    download_source.add_argument("--url")
+    download_source.add_argument("--manifest", help="JSON list or 'url [output] [sha256]' lines")
+    download_parser.add_argument("--out", dest="output_path", required=True,
+                                 help="output file (with --url) or directory (with --manifest)")
+    download_parser.add_argument("--sha256", help="expected checksum of the file (with --url)")
+    download_parser.add_argument("--connections", type=int, default=DOWNLOAD_CONNECTIONS,
+                                 help=f"parallel range requests per file (default: {DOWNLOAD_CONNECTIONS})")
+    download_parser.add_argument("--concurrency", type=int, default=DOWNLOAD_CONCURRENCY,
+                                 help=f"files downloaded at once from a manifest (default: {DOWNLOAD_CONCURRENCY})")
+    download_parser.set_defaults(handler=_cmd_download)
+
+    stress_parser = subparsers.add_parser("stress", help="run a stress test profile or scenario")
+    stress_target = stress_parser.add_mutually_exclusive_group()
+    stress_target.add_argument("--profile", help="profile name, e.g. light, moderate or heavy")
+    stress_target.add_argument("--scenario", help="multi-stage scenario name, e.g. ramp")
+    stress_target.add_argument("--list", action="store_true", help="list the available profiles and scenarios")
+    stress_parser.add_argument("--duration", type=int, help="override the duration in seconds")
+    stress_parser.add_argument("--cpu", help="CPU workers (N, N%% of cores or Nx cores)")
+    stress_parser.add_argument("--vm", help="memory workers")
+    stress_parser.add_argument("--vm-bytes", help="memory per worker (e.g. 512M, 1G or N%% of RAM)")
+    stress_parser.add_argument("--io", help="I/O workers")
+    stress_parser.add_argument("--metrics-log", metavar="FILE", help="log resource usage to FILE (.bin for binary)")
+    stress_parser.add_argument("--threshold", type=float, help="alert when CPU usage exceeds this percentage")
+    stress_parser.add_argument("--profiles", dest="profiles_file", metavar="FILE",
+                               help=f"profiles file (default: {STRESS_PROFILES_FILE})")
+    stress_parser.set_defaults(handler=_cmd_stress)
+
+    fleet_parser = subparsers.add_parser("fleet", help="run stress or nwtest on many hosts at once over SSH")
+    fleet_parser.add_argument("action", choices=["run", "agent"],
+                              help="run: orchestrate the inventory; agent: the per-host side (used by run)")
+    fleet_parser.add_argument("--inventory", metavar="FILE", help=f"inventory file (default: {FLEET_INVENTORY_FILE})")
+    fleet_parser.add_argument("--hosts", help="comma-separated host names to use from the inventory")
+    fleet_parser.add_argument("--task", help="stress, nwtest or check (agent: the task as JSON)")
+    fleet_parser.add_argument("--profile", help="stress profile")
+    fleet_parser.add_argument("--scenario", help="stress scenario")
+    fleet_parser.add_argument("--duration", type=int, help="seconds (stress override; nwtest seconds per test)")
+    fleet_parser.add_argument("--cpu", help="stress: CPU workers (N, N%% of cores or Nx cores)")
+    fleet_parser.add_argument("--vm", help="stress: memory workers")
+    fleet_parser.add_argument("--vm-bytes", help="stress: memory per worker (e.g. 512M, 1G or N%% of RAM)")
+    fleet_parser.add_argument("--io", help="stress: I/O workers")
+    fleet_parser.add_argument("--address", action="append", help="nwtest: multicast address (repeatable)")
+    fleet_parser.add_argument("--prefix", help="nwtest: discover groups with this address prefix on each host")
+    fleet_parser.add_argument("--concurrency", type=int, default=4, help="nwtest: tests at once per host (default: 4)")
+    fleet_parser.add_argument("--ready-timeout", type=float, default=FLEET_READY_TIMEOUT,
+                              help=f"seconds for every host to report ready (default: {FLEET_READY_TIMEOUT})")
+    fleet_parser.add_argument("--report", metavar="FILE", help="write the merged report to FILE as JSON")
+    fleet_parser.set_defaults(handler=_cmd_fleet)
+
+    results_parser = subparsers.add_parser("results", help="list stored stress results or compare a run with its baseline")
+    results_parser.add_argument("action", choices=["list", "compare"])
+    results_parser.add_argument("--run", type=int, help="compare: run id to check (default: the latest completed run)")
+    results_parser.add_argument("--baseline", type=int, help="compare: use this run as the baseline")
+    results_parser.add_argument("--baseline-kernel", metavar="RELEASE",
+                                help="compare: baseline runs from this kernel instead of the run's own")
+    results_parser.add_argument("--last", type=int, default=RESULTS_BASELINE_RUNS,
+                                help=f"compare: earlier runs used as the baseline (default: {RESULTS_BASELINE_RUNS})")
+    results_parser.add_argument("--alpha", type=float, default=RESULTS_ALPHA,
+                                help=f"compare: significance level (default: {RESULTS_ALPHA})")
+    results_parser.add_argument("--min-change", type=float, default=RESULTS_MIN_CHANGE * 100,
+                                help="compare: smallest change flagged, in percent (default: 2)")
+    results_parser.add_argument("--metric", action="append", help="compare: only this metric (repeatable)")
+    results_parser.add_argument("--host", help="list: only runs from this host")
+    results_parser.add_argument("--profile", help="list: only runs of this profile")
+    results_parser.add_argument("--limit", type=int, default=20, help="list: runs shown (default: 20)")
+    results_parser.add_argument("--db", metavar="FILE", help=f"result store (default: {STRESS_RESULTS_DB})")
+    results_parser.set_defaults(handler=_cmd_results)
+
+    bench_parser = subparsers.add_parser("bench", help="run the benchmark suite on synthetic fixtures")
+    bench_parser.add_argument("--repeat", type=int, default=5, help="timed runs per benchmark (default: 5)")
+    bench_parser.add_argument("--warmup", type=int, default=1, help="untimed warm-up runs (default: 1)")
+    bench_parser.add_argument("--only", action="append", metavar="PREFIX",
+                              help="only run benchmarks whose name starts with PREFIX (repeatable)")
+    bench_parser.add_argument("--save", metavar="FILE", help="write the results to FILE as JSON")
+    bench_parser.add_argument("--compare", metavar="FILE", help="compare against results saved by an earlier run")
+    bench_parser.add_argument("--tolerance", type=float, default=BENCH_TOLERANCE * 100,
+                              help="percent change counted as a regression (default: 10)")
+    bench_parser.set_defaults(handler=_cmd_bench)
+
+    daemon_parser = subparsers.add_parser("daemon", help="run a long-lived job daemon on a Unix socket")
+    daemon_parser.add_argument("action", choices=["start", "stop", "status"])
+    daemon_parser.add_argument("--socket", metavar="PATH", help=f"socket path (default: {DAEMON_SOCKET})")
+    daemon_parser.add_argument("--foreground", action="store_true", help="start: do not detach")
+    daemon_parser.set_defaults(handler=_cmd_daemon)
+
+    trace_parser = subparsers.add_parser("trace", help="summarise or export the command trace")
+    trace_parser.add_argument("action", choices=["summary", "export"])
+    trace_parser.add_argument("--chrome", metavar="FILE", help="export: write Chrome trace-event JSON to FILE")
+    trace_parser.add_argument("--file", metavar="FILE", help=f"trace file to read (default: {TRACE_FILE})")
+    trace_parser.set_defaults(handler=_cmd_trace)
+
+    update_parser = subparsers.add_parser("update", help="check for (and apply) updates")
+    update_parser.add_argument("--check", action="store_true",
+                               help="only check, do not apply an available update")
+    update_parser.add_argument("--refresh", action="store_true",
+                               help="revalidate with the server even if the last check is recent")
+    update_parser.set_defaults(handler=_cmd_update)
+    return parser
+
+
+def _returncode_result(returncode):
+    """Map a run_command()-style return code (None on launch errors) to (exit_code, result)."""
+    exit_code = 1 if returncode is None else returncode
+    return exit_code, {"returncode": returncode}
+
+
+def _cmd_deps(args):
+    display_dependencies(refresh=args.refresh)
+    probes = probe_tools(DEPENDENCY_TOOLS.values())
+    return (0 if all(probe["installed"] for probe in probes.values()) else 1), probes
+
+
+def _cmd_version(args):
+    print(CURRENT_VERSION)
+    return 0, {"version": CURRENT_VERSION}
+
+
+def _cmd_alias(args):
+    create_alias()
+    return (0 if alias_exists() else 1), {"alias": alias_exists()}
+
+
+def _cmd_cache(args):
+    if args.action == "clear":
+        clear_transcode_cache()
+    else:
+        display_transcode_cache()
+    index = _load_transcode_index()
+    return 0, {"entries": len(index["entries"]),
+               "bytes": sum(entry["size"] for entry in index["entries"].values())}
+
+
+def _cmd_media(args):
+    if args.action == "scan":
+        summary = scan_media(args.path, args.workers, args.refresh)
+        return (0 if summary["files"] else 1), summary
+    info = media_info(args.path, refresh=args.refresh)
+    if info is None:
+        print(f"{RED}Could not read media metadata from {args.path}.{RESET}")
+        return 1, None
+    for key, value in info.items():
+        print(f"{key:<12}{value}")
+    return 0, info
+
+
+def _cmd_metrics(args):
+    try:
+        fields, rows = read_metrics_file(args.file)
+    except (OSError, ValueError) as e:
+        print(f"{RED}Could not read metrics file: {e}{RESET}")
+        return 1, {"error": str(e)}
+    print(",".join(fields))
+    for row in rows:
+        print(",".join(f"{value:g}" for value in row))
+    return 0, {"fields": fields, "rows": len(rows)}
+
+
+def _cmd_image_batch(args):
+    try:
+        summary = imagemagick_batch(args.source, args.op, args.out, workers=args.workers, force=args.force)
+    except ValueError as e:
+        print(f"{RED}{e}{RESET}")
+        return 2, {"error": str(e)}
+    return (1 if summary["failed"] else 0), summary
+
+
+def _cmd_pipeline(args):
+    try:
+        if args.file:
+            jobs = load_pipeline_file(args.file)
+        else:
+            if not args.steps or not args.out:
+                raise ValueError("--in needs --steps and --out.")
+            steps = [step.strip() for step in args.steps.split(",") if step.strip()]
+            jobs = pipeline_jobs_for_inputs(args.source, steps, args.out)
+            if not jobs:
+                raise ValueError(f"No input files found for '{args.source}'.")
+        results = run_pipeline(jobs, args.budget)
+    except (OSError, ValueError) as e:
+        print(f"{RED}{e}{RESET}")
+        return 2, {"error": str(e)}
+    return (0 if all(result["status"] == "ok" for result in results.values()) else 1), results
+
+
+def _cmd_nwtest_groups(args):
+    if args.address:
+        targets = [(args.interface or "-", address) for address in args.address]
+    else:
+        families = ("inet", "inet6") if args.ipv6 else ("inet",)
+        targets = discover_multicast_groups(args.interface, args.prefix, args.include_local, families)
+    records = run_nwtest_groups(targets, args.duration, args.concurrency, args.json_file)
+    return (0 if records and all(record["returncode"] == 0 for record in records) else 1), records
+
+
+def _cmd_sweep(args):
+    specs = list(args.targets)
+    try:
+        if args.file:
+            specs += read_target_file(args.file)
+        targets = expand_targets(specs)
+    except (OSError, ValueError) as e:
+        print(f"{RED}{e}{RESET}")
+        return 2, {"error": str(e)}
+    results = reachability_sweep(targets, args.count, args.timeout, args.concurrency)
+    return (0 if results and all(result["received"] for result in results) else 1), results
+
+
+def _cmd_download(args):
+    if args.url:
+        return _returncode_result(download_file(args.url, args.output_path, args.sha256, max(1, args.connections)))
+    try:
+        entries = load_download_manifest(args.manifest, args.output_path)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"{RED}Could not read manifest: {e}{RESET}")
+        return 2, {"error": str(e)}
+    results = download_manifest(entries, max(1, args.concurrency), max(1, args.connections))
+    return (0 if results and all(result["ok"] for result in results) else 1), results
+
+
+def _cmd_stress(args):
+    if args.list:
+        try:
+            profiles, scenarios = load_stress_profiles(args.profiles_file)
+            cores, ram = host_resources()
+            for name, profile in profiles.items():
+                settings = resolve_stress_profile(profile, cores, ram)
+                print(f"{name:<12} cpu={settings['cpu']} vm={settings['vm']} vm_bytes={settings['vm_bytes'] or '-'} "
+                      f"io={settings['io']} duration={settings['duration']}s")
+        except ValueError as e:
+            print(f"{RED}{e}{RESET}")
+            return 2, {"error": str(e)}
+        for name, stages in scenarios.items():
+            print(f"{name:<12} scenario: " + ", ".join(stage.get("name", stage.get("profile", "?")) for stage in stages))
+        return 0, {"profiles": profiles, "scenarios": scenarios}
+    overrides = {"cpu": args.cpu, "vm": args.vm, "vm_bytes": args.vm_bytes, "io": args.io}
+    if not args.profile and not args.scenario and not any(overrides.values()):
+        print(f"{RED}Give --profile, --scenario or explicit --cpu/--vm/--io workers.{RESET}")
+        return 2, {"error": "no profile, scenario or workers given"}
+    exit_code, results = run_stress(args.profile, args.scenario, args.duration, overrides,
+                                    args.metrics_log, args.threshold, args.profiles_file)
+    return exit_code, {"stages": results}
+
+
+def _cmd_fleet(args):
+    if args.action == "agent":
+        try:
+            task = json.loads(args.task or "")
+        except ValueError:
+            print(f"{RED}fleet agent needs --task with a JSON task.{RESET}")
+            return 2, None
+        return fleet_agent(task), None
+    if args.task not in ("stress", "nwtest", "check"):
+        print(f"{RED}Give --task stress, nwtest or check.{RESET}")
+        return 2, {"error": "no task"}
+    try:
+        hosts = load_inventory(args.inventory)
+    except ValueError as e:
+        print(f"{RED}{e}{RESET}")
+        return 2, {"error": str(e)}
+    if args.hosts:
+        wanted = args.hosts.split(",")
+        unknown = set(wanted) - {host["name"] for host in hosts}
+        if unknown:
+            print(f"{RED}Not in the inventory: {', '.join(sorted(unknown))}{RESET}")
+            return 2, {"error": "unknown hosts"}
+        hosts = [host for host in hosts if host["name"] in wanted]
+    task = {"task": args.task}
+    if args.task == "stress":
+        overrides = {"cpu": args.cpu, "vm": args.vm, "vm_bytes": args.vm_bytes, "io": args.io}
+        if not args.profile and not args.scenario and not any(overrides.values()):
+            print(f"{RED}Give --profile, --scenario or worker counts for a stress task.{RESET}")
+            return 2, {"error": "no profile or scenario"}
+        task.update(profile=args.profile, scenario=args.scenario, duration=args.duration, overrides=overrides)
+    elif args.task == "nwtest":
+        task.update(addresses=args.address, prefix=args.prefix, duration=args.duration,
+                    concurrency=args.concurrency)
+    report = run_fleet(hosts, task, args.ready_timeout, args.report)
+    return (0 if report["passed"] == len(report["hosts"]) else 1), report
+
+
+def _cmd_results(args):
+    if args.action == "list":
+        return 0, {"runs": list_stress_results(args.host, args.profile, args.limit, args.db)}
+    report = compare_stress_results(args.run, args.baseline, args.baseline_kernel, args.last, args.alpha,
+                                    args.min_change / 100, args.metric, args.db)
+    if "error" in report:
+        print(f"{RED}Nothing to compare: {report['error']}.{RESET}")
+        return 2, report
+    print_stress_comparison(report)
+    return (1 if report["changed"] else 0), report
+
+
+def _cmd_bench(args):
+    baseline = None
+    if args.compare:
+        try:
+            with open(args.compare, "r") as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"{RED}Could not read baseline: {e}{RESET}")
+            return 2, {"error": str(e)}
+    results = run_benchmarks(max(0, args.warmup), max(1, args.repeat), args.only)
+    regressions = print_benchmarks(results, baseline, args.tolerance / 100)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"{GREEN}Results saved to {args.save}{RESET}")
+    results["regressions"] = regressions
+    return (1 if regressions else 0), results
+
+
+def _cmd_daemon(args):
+    if args.action == "start":
+        return start_daemon(args.socket, args.foreground), {"socket": args.socket or DAEMON_SOCKET}
+    status = daemon_status(args.socket)
+    if status is None:
+        print(f"{RED}No qakit daemon is listening on {args.socket or DAEMON_SOCKET}.{RESET}")
+        return 1, None
+    if args.action == "stop":
+        _daemon_request({"op": "stop"}, socket_path=args.socket, timeout=5)
+        print(f"{GREEN}Stopped qakit daemon {status['pid']}.{RESET}")
+    else:
+        print(f"qakit daemon {status['pid']} on {status['socket']}: up {status['uptime']:.0f}s, "
+              f"{status['requests']} request(s) served")
+    return 0, status
+
+
+def _cmd_trace(args):
+    records = load_trace(args.file)
+    if not records:
+        print(f"{RED}No trace records found in {args.file or TRACE_FILE}{RESET}")
+        return 1, {"records": 0}
+    if args.action == "summary":
+        print_trace_summary(records)
+        return 0, {"records": len(records)}
+    if not args.chrome:
+        print(f"{RED}trace export needs --chrome FILE{RESET}")
+        return 2, {"error": "missing --chrome"}
+    events = export_chrome_trace(records, args.chrome)
+    print(f"{GREEN}Wrote {events} trace events to {args.chrome}{RESET}")
+    return 0, {"records": len(records), "output": args.chrome}
+
+
+def _cmd_update(args):
+    available = check_for_updates(refresh=args.refresh)
+    if available is None:
+        return 1, {"update_available": None, "error": "update check failed"}
+    if available and not args.check:
+        update_script()  # exits once the new version is installed
+        return 1, {"update_available": True, "error": "update failed"}
+    return 0, {"update_available": available}
+
+
+def run_subcommand(args):
+    """Run a non-interactive subcommand. Returns (exit_code, result)."""
+    name = " ".join(part for part in (args.command, getattr(args, "action", None)) if part)
+    return traced_action("subcommand", name, args.handler, args)
+
+
+def main(argv=None):
+    """Entry point. Subcommands skip the intro, distro and dependency banner."""
+    argv = sys.argv[1:] if argv is None else argv
+    args = timed_stage("parse arguments", build_parser().parse_args, argv)
+    if args.log:
+        global COMMAND_LOG_FILE
+        COMMAND_LOG_FILE = args.log
+
+    if args.command and args.daemon and args.command != "daemon":
+        exit_code = forward_to_daemon([arg for arg in argv if arg != "--daemon"])
+        if exit_code is not None:
+            return exit_code
+        print(f"{RED}No qakit daemon is running; running the command locally.{RESET}", file=sys.stderr)
+
+    if args.command:
+        try:
+            if not args.json:
+                exit_code, _ = timed_stage(f"command: {args.command}", run_subcommand, args)
+                return exit_code
+            # Keep stdout clean for the JSON document: point fd 1 at stderr while the
+            # command runs, so our own output and every child process's goes there.
+            start = time.perf_counter()
+            sys.stdout.flush()
+            saved_stdout = os.dup(1)
+            os.dup2(2, 1)
+            try:
+                exit_code, result = timed_stage(f"command: {args.command}", run_subcommand, args)
+            finally:
+                sys.stdout.flush()
+                os.dup2(saved_stdout, 1)
+                os.close(saved_stdout)
+            print(json.dumps({
+                "command": " ".join(part for part in (args.command, getattr(args, "action", None)) if part),
+                "exit_code": exit_code,
+                "elapsed": round(time.perf_counter() - start, 3),
+                "result": result,
+                "commands": command_results,
+            }, default=str))
+            return exit_code
+        finally:
+            if args.startup_profile:
+                report_startup_profile()
+
+    timed_stage("intro", display_intro)
+    timed_stage("distro detection", adjust_for_linux_version)  # Check and display Linux version details (if applicable)
+    timed_stage("dependency probe", display_dependencies)
+    if args.startup_profile:
+        report_startup_profile()
+    main_menu()
+    return 0
+
+
 if __name__ == "__main__":
     try:
-        display_intro()
-        adjust_for_linux_version()  # Check and display Linux version details (if applicable)
-        display_dependencies()
-        main_menu()
+        sys.exit(main())
     except KeyboardInterrupt:
         print(f"{RED}Program interrupted by user..{RESET}")
         sys.exit(0)
@@ -0,0 +1,132 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import qakit  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def isolated_state(tmp_path, monkeypatch):
+    """Keep every test's cache, trace and results out of the real home directory."""
+    cache_home = tmp_path / "cache"
+    monkeypatch.setenv("XDG_CACHE_HOME", str(cache_home))
+    for key in ("QAKIT_TRACE", "QAKIT_RESULTS_DB", "QAKIT_SOCKET", "QAKIT_DAEMON"):
+        monkeypatch.delenv(key, raising=False)
+    saved = qakit._use_cache_dir(str(cache_home / "qakit"))
+    monkeypatch.setattr(qakit, "_tool_env", None)
+    monkeypatch.setattr(qakit, "_probe_results", {})
+    yield
+    qakit._restore_settings(saved)
+
+
+@pytest.fixture
+def stub_bin(tmp_path, monkeypatch):
+    """Return a function that installs a shell-script stand-in for a tool on PATH."""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setattr(qakit, "_tool_env", None)
+
+    def install(name, script):
+        qakit._write_stub(str(bin_dir), name, script)
+        return str(bin_dir / name)
+
+    return install
+
+
+class StandInServer:
+    """A local HTTP server serving in-memory files, with ranges, validators and fault injection.
+
+    files maps a path to {"body": bytes} plus optional "etag", "last_modified",
+    "ranges" (default True), "content_length" (sent verbatim instead of the real
+    length) and "fail_ranges" (range starts answered with a truncated body).
+    Every request is recorded as (method, path, headers) in requests.
+    """
+
+    def __init__(self):
+        import http.server
+        import threading
+
+        self.files = {}
+        self.requests = []
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                self.respond(send_body=False)
+
+            def do_GET(self):
+                self.respond(send_body=True)
+
+            def respond(self, send_body):
+                path = self.path.split("?", 1)[0]
+                server.requests.append((self.command, path, dict(self.headers)))
+                entry = server.files.get(path)
+                if entry is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body = entry["body"]
+                etag = entry.get("etag")
+                if etag and self.headers.get("If-None-Match") == etag or (
+                        entry.get("last_modified") and self.headers.get("If-Modified-Since") == entry["last_modified"]):
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                status, start, end = 200, 0, len(body) - 1
+                spec = self.headers.get("Range", "")
+                if entry.get("ranges", True) and spec.startswith("bytes=") and (
+                        not self.headers.get("If-Range") or self.headers["If-Range"] == etag):
+                    first, _, last = spec[len("bytes="):].partition("-")
+                    status, start, end = 206, int(first), min(int(last or len(body) - 1), len(body) - 1)
+                self.send_response(status)
+                if status == 206:
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{len(body)}")
+                if entry.get("ranges", True):
+                    self.send_header("Accept-Ranges", "bytes")
+                if etag:
+                    self.send_header("ETag", etag)
+                if entry.get("last_modified"):
+                    self.send_header("Last-Modified", entry["last_modified"])
+                self.send_header("Content-Length", entry.get("content_length", str(end - start + 1)))
+                if "content_length" in entry:
+                    self.send_header("Connection", "close")
+                    self.close_connection = True
+                self.end_headers()
+                if not send_body:
+                    return
+                data = body[start:end + 1]
+                if status == 206 and start in entry.get("fail_ranges", ()):
+                    data = data[:len(data) // 2]
+                    self.close_connection = True
+                self.wfile.write(data)
+
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def range_gets(self, path):
+        return [headers["Range"] for method, request_path, headers in self.requests
+                if method == "GET" and request_path == path and "Range" in headers and headers["Range"] != "bytes=0-0"]
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def http_server():
+    server = StandInServer()
+    yield server
+    server.close()
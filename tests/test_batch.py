@@ -0,0 +1,32 @@
+import pytest
+
+import qakit
+
+# Stand-in for ImageMagick's convert: copies the input to the output (the last argument).
+COPY_CONVERT = r'''
+for last; do :; done
+cp "$1" "$last"
+'''
+
+
+@pytest.fixture
+def convert(stub_bin):
+    return stub_bin("convert", COPY_CONVERT)
+
+
+def test_batch_refuses_inputs_that_share_an_output(convert, tmp_path):
+    source = tmp_path / "in"
+    source.mkdir()
+    for name in ("a.png", "a.jpg", "b.png"):
+        (source / name).write_bytes(name.encode())
+    out = tmp_path / "out"
+
+    summary = qakit.imagemagick_batch(str(source), "convert:webp", str(out), workers=2)
+
+    assert summary["processed"] == 1
+    assert summary["failed"] == 2
+    assert sorted(input_file for input_file, _ in summary["failures"]) == [str(source / "a.jpg"),
+                                                                          str(source / "a.png")]
+    assert all("would also be written by" in error for _, error in summary["failures"])
+    assert not (out / "a.webp").exists()
+    assert (out / "b.webp").read_bytes() == b"b.png"
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+
+import pytest
+
+import qakit
+
+BODY = bytes(range(256)) * 40  # 10240 bytes
+
+
+@pytest.fixture
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(qakit, "DOWNLOAD_RETRIES", 1)
+
+
+def test_parallel_range_download(http_server, tmp_path):
+    http_server.files["/media.bin"] = {"body": BODY, "etag": '"v1"'}
+    output = tmp_path / "media.bin"
+    result = qakit.download_url(f"{http_server.url}/media.bin", str(output), hashlib.sha256(BODY).hexdigest(),
+                                connections=4, chunk_size=1000, quiet=True)
+    assert output.read_bytes() == BODY
+    assert result["bytes"] == len(BODY)
+    assert len(http_server.range_gets("/media.bin")) == 11
+    assert not os.path.exists(f"{output}.part") and not os.path.exists(f"{output}.part.json")
+
+
+def test_checksum_mismatch_discards_the_download(http_server, tmp_path):
+    http_server.files["/media.bin"] = {"body": BODY}
+    output = tmp_path / "media.bin"
+    with pytest.raises(IOError, match="checksum mismatch"):
+        qakit.download_url(f"{http_server.url}/media.bin", str(output), "0" * 64, chunk_size=4096, quiet=True)
+    assert not output.exists() and not os.path.exists(f"{output}.part")
+
+
+def test_resume_fetches_only_missing_chunks(http_server, tmp_path, fast_retries):
+    http_server.files["/media.bin"] = {"body": BODY, "etag": '"v1"', "fail_ranges": {3000}}
+    url, output = f"{http_server.url}/media.bin", tmp_path / "media.bin"
+    with pytest.raises(Exception):
+        qakit.download_url(url, str(output), connections=2, chunk_size=1000, quiet=True)
+    state = json.loads(open(f"{output}.part.json").read())
+    assert "3" not in state["chunks"] and len(state["chunks"]) == 10
+
+    # Corrupt a chunk that was recorded as done: its checksum no longer matches, so it is fetched again.
+    with open(f"{output}.part", "r+b") as f:
+        f.seek(5000)
+        f.write(b"\xff" * 10)
+    http_server.files["/media.bin"]["fail_ranges"] = set()
+    http_server.requests.clear()
+    qakit.download_url(url, str(output), connections=2, chunk_size=1000, quiet=True)
+    assert output.read_bytes() == BODY
+    assert sorted(http_server.range_gets("/media.bin")) == ["bytes=3000-3999", "bytes=5000-5999"]
+
+
+def test_changed_file_restarts_the_download(http_server, tmp_path, fast_retries):
+    http_server.files["/media.bin"] = {"body": BODY, "etag": '"v1"', "fail_ranges": {0}}
+    url, output = f"{http_server.url}/media.bin", tmp_path / "media.bin"
+    with pytest.raises(Exception):
+        qakit.download_url(url, str(output), chunk_size=1000, quiet=True)
+    new_body = BODY[::-1]
+    http_server.files["/media.bin"] = {"body": new_body, "etag": '"v2"'}
+    qakit.download_url(url, str(output), chunk_size=1000, quiet=True)
+    assert output.read_bytes() == new_body
+
+
+def test_server_without_ranges(http_server, tmp_path):
+    http_server.files["/plain.bin"] = {"body": BODY, "ranges": False}
+    output = tmp_path / "plain.bin"
+    qakit.download_url(f"{http_server.url}/plain.bin", str(output), chunk_size=1000, quiet=True)
+    assert output.read_bytes() == BODY
+    assert http_server.range_gets("/plain.bin") == []
+
+
+def test_malformed_content_length_is_treated_as_unknown(http_server, tmp_path):
+    http_server.files["/odd.bin"] = {"body": BODY, "ranges": False, "content_length": "lots"}
+    output = tmp_path / "odd.bin"
+    qakit.download_url(f"{http_server.url}/odd.bin", str(output), quiet=True)
+    assert output.read_bytes() == BODY
+
+
+def test_manifest_downloads_concurrently(http_server, tmp_path, capsys):
+    for index in range(5):
+        http_server.files[f"/clip{index}.bin"] = {"body": BODY[index:]}
+    http_server.files["/odd.bin"] = {"body": BODY, "ranges": False, "content_length": "lots"}
+    manifest = tmp_path / "manifest.txt"
+    manifest.write_text("# test media\n" + "".join(f"{http_server.url}/clip{index}.bin\n" for index in range(5))
+                        + f"{http_server.url}/odd.bin\n{http_server.url}/missing.bin\n")
+    out_dir = tmp_path / "out"
+    assert qakit.main(["network", "download", "--manifest", str(manifest), "--out", str(out_dir)]) == 1
+    for index in range(5):
+        assert (out_dir / f"clip{index}.bin").read_bytes() == BODY[index:]
+    assert (out_dir / "odd.bin").read_bytes() == BODY
+    assert not (out_dir / "missing.bin").exists()
+    assert "6/7 download(s) complete" in capsys.readouterr().out
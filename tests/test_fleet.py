@@ -0,0 +1,156 @@
+import json
+import os
+import shutil
+import signal
+import sys
+import threading
+import time
+
+import pytest
+
+import qakit
+
+# Stand-in stress-ng: sleeps for the --timeout it is given, so the agent has a process to monitor.
+STRESS_NG = 'while [ $# -gt 0 ]; do [ "$1" = --timeout ] && t=${2%s}; shift; done; exec sleep "$t"'
+
+
+@pytest.fixture
+def tools(stub_bin):
+    stub_bin("stress-ng", STRESS_NG)
+    stub_bin("nwtest", 'sleep 0.2; echo "nwtest $*"')
+    return stub_bin
+
+
+def local_hosts(*names, **fields):
+    return [{"name": name, "transport": "local", "python": sys.executable, **fields} for name in names]
+
+
+def test_load_inventory(tmp_path):
+    inventory = tmp_path / "inventory.json"
+    inventory.write_text(json.dumps({
+        "defaults": {"user": "qa", "ssh_options": ["-o", "StrictHostKeyChecking=no"]},
+        "hosts": ["10.0.0.5:2222", "root@10.0.0.6", {"name": "rig", "transport": "docker", "container": "rig1"}],
+    }))
+    hosts = qakit.load_inventory(str(inventory))
+    assert [host["name"] for host in hosts] == ["10.0.0.5", "10.0.0.6", "rig"]
+    assert (hosts[0]["user"], hosts[0]["port"]) == ("qa", 2222)
+    assert hosts[1]["user"] == "root"
+    command = qakit._agent_command(hosts[0], {"task": "check"}, 100)
+    assert command[:9] == ["ssh", "-T", "-o", "BatchMode=yes", "-p", "2222", "-o", "StrictHostKeyChecking=no",
+                           "qa@10.0.0.5"]
+    assert qakit._agent_command(hosts[2], {"task": "check"}, 100)[:4] == ["docker", "exec", "-i", "rig1"]
+
+
+@pytest.mark.parametrize("content", ['{"hosts": []}', '[{"transport": "ssh"}]', '["a", "a"]', "not json"])
+def test_load_inventory_rejects_bad_files(tmp_path, content):
+    inventory = tmp_path / "inventory.json"
+    inventory.write_text(content)
+    with pytest.raises(ValueError):
+        qakit.load_inventory(str(inventory))
+
+
+def test_check_task(tools, tmp_path):
+    report_file = tmp_path / "report.json"
+    report = qakit.run_fleet(local_hosts("a", "b"), {"task": "check"}, ready_timeout=30,
+                             report_file=str(report_file))
+    assert report["passed"] == 2
+    assert report["hosts"]["a"]["info"]["stress_tool"] is None
+    assert report["hosts"]["a"]["clock_offset"] == pytest.approx(0, abs=1)
+    assert json.loads(report_file.read_text())["passed"] == 2
+
+
+def test_stress_task_streams_samples(tools):
+    task = {"task": "stress", "duration": 2, "overrides": {"cpu": "1"}}
+    report = qakit.run_fleet(local_hosts("a", "b"), task, ready_timeout=30)
+    assert report["passed"] == 2
+    for host in report["hosts"].values():
+        assert host["exit_code"] == 0
+        assert host["samples"] >= 2
+        assert "CPU(%)" in host["summary"]
+        assert host["result"]["stages"][0]["completed"]
+    assert report["start_skew"] < 1
+    assert report["fleet"]["CPU(%)"]["hosts"] == 2
+    assert {"a", "b"} <= set().union(*(tick["hosts"] for tick in report["timeline"]))
+
+
+def test_nwtest_task(tools):
+    task = {"task": "nwtest", "addresses": ["239.1.1.1", "239.1.1.2"], "duration": 1}
+    report = qakit.run_fleet(local_hosts("a", "b"), task, ready_timeout=30)
+    assert report["passed"] == 2
+    tests = report["hosts"]["b"]["result"]["tests"]
+    assert sorted(test["address"] for test in tests) == ["239.1.1.1", "239.1.1.2"]
+    assert all(test["returncode"] == 0 for test in tests)
+
+
+def test_nwtest_failure_fails_the_host(tools):
+    tools("nwtest", "exit 3")
+    report = qakit.run_fleet(local_hosts("a"), {"task": "nwtest", "addresses": ["239.1.1.1"], "duration": 1},
+                             ready_timeout=30)
+    assert report["hosts"]["a"]["status"] == "failed"
+    assert report["hosts"]["a"]["exit_code"] == 1
+
+
+def test_host_failing_before_ready(tools):
+    broken = tools("broken-python", 'echo "broken-python: cannot start" >&2; exit 127')
+    hosts = local_hosts("good") + local_hosts("bad", python=broken)
+    report = qakit.run_fleet(hosts, {"task": "check"}, ready_timeout=30)
+    assert report["hosts"]["good"]["status"] == "ok"
+    assert report["hosts"]["bad"]["status"] == "failed"
+    assert report["hosts"]["bad"]["error"] == "broken-python: cannot start"
+    assert report["passed"] == 1
+
+
+def test_ready_timeout(tools):
+    hung = tools("hung-python", "exec sleep 60")
+    hosts = local_hosts("good") + local_hosts("hung", python=hung)
+    start = time.monotonic()
+    report = qakit.run_fleet(hosts, {"task": "check"}, ready_timeout=2)
+    assert time.monotonic() - start < 15
+    assert report["hosts"]["hung"]["status"] == "failed"
+    assert report["hosts"]["hung"]["error"] == "not ready after 2s"
+    assert report["hosts"]["good"]["status"] == "ok"
+
+
+def test_interrupt_stops_every_host(tools):
+    psutil = pytest.importorskip("psutil")
+    task = {"task": "stress", "duration": 37, "overrides": {"cpu": "1"}}
+    timer = threading.Timer(4, os.kill, (os.getpid(), signal.SIGINT))
+    timer.start()
+    start = time.monotonic()
+    try:
+        report = qakit.run_fleet(local_hosts("a", "b"), task, ready_timeout=30)
+    finally:
+        timer.cancel()
+    assert time.monotonic() - start < 25
+    for host in report["hosts"].values():
+        assert host["status"] == "failed"
+        assert host["exit_code"] == 130
+    time.sleep(0.5)
+    assert not [process for process in psutil.process_iter(["cmdline"])
+                if process.info["cmdline"] == ["sleep", "37"]]
+
+
+def test_merge_separates_clock_offset_from_start_skew():
+    go_time = 1000.0
+    state = {
+        # "fast" runs 100 s ahead; both started 10 ms after the go signal by our clock.
+        "fast": {"status": "ok", "clock_offset": 100.0, "started": 1100.01,
+                 "timeline": [{"since_start": 0.5, "elapsed": 0.5, "CPU(%)": 10.0}]},
+        "slow": {"status": "ok", "clock_offset": 0.0, "started": 1000.01,
+                 "timeline": [{"since_start": 0.5, "elapsed": 0.5, "CPU(%)": 20.0}]},
+    }
+    report = qakit.merge_fleet_results({"task": "check"}, state, go_time)
+    assert report["hosts"]["fast"]["start_offset"] == pytest.approx(0.01)
+    assert report["start_skew"] == pytest.approx(0)
+    assert report["clock_spread"] == pytest.approx(100)
+    assert report["timeline"] == [{"t": 0.5, "hosts": {"fast": {"elapsed": 0.5, "CPU(%)": 10.0},
+                                                       "slow": {"elapsed": 0.5, "CPU(%)": 20.0}}}]
+
+
+@pytest.mark.skipif(not (shutil.which("docker") and os.getenv("QAKIT_TEST_CONTAINER")),
+                    reason="set QAKIT_TEST_CONTAINER to a running container with python3")
+def test_check_task_in_container():
+    host = {"name": "container", "transport": "docker", "container": os.environ["QAKIT_TEST_CONTAINER"],
+            "python": "python3"}
+    report = qakit.run_fleet([host], {"task": "check"}, ready_timeout=60)
+    assert report["hosts"]["container"]["status"] == "ok"
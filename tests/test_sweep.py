@@ -0,0 +1,67 @@
+import pytest
+
+import qakit
+
+# Stand-in for ping: hosts on 127.0.0.0/8 answer every packet, anything else is lost.
+LOOPBACK_PING = r'''
+count=4
+while [ $# -gt 1 ]; do [ "$1" = -c ] && count=$2; shift; done
+case "$1" in
+127.*)
+    echo "$count packets transmitted, $count received, 0% packet loss, time 1ms"
+    echo "rtt min/avg/max/mdev = 0.021/0.034/0.052/0.010 ms"
+    exit 0;;
+esac
+echo "$count packets transmitted, 0 received, 100% packet loss, time 1ms"
+exit 1
+'''
+
+
+@pytest.fixture
+def ping(stub_bin):
+    return stub_bin("ping", LOOPBACK_PING)
+
+
+def test_expand_targets_cidr_and_duplicates():
+    assert qakit.expand_targets(["127.0.0.0/30", "127.0.0.1", "# comment", "localhost"]) == [
+        "127.0.0.1", "127.0.0.2", "localhost"]
+
+
+def test_expand_targets_rejects_oversized_range():
+    with pytest.raises(ValueError):
+        qakit.expand_targets(["10.0.0.0/16"], limit=256)
+
+
+def test_read_target_file_strips_comments(tmp_path):
+    targets = tmp_path / "targets.txt"
+    targets.write_text("# rack 3\n127.0.0.1, 127.0.0.2  # encoders\n\n   \n127.0.0.8/30\n")
+    assert qakit.read_target_file(str(targets)) == ["127.0.0.1", "127.0.0.2", "127.0.0.8/30"]
+
+
+def test_parse_ping_output():
+    result = qakit.parse_ping_output("4 packets transmitted, 3 received, 25% packet loss, time 3004ms\n"
+                                     "rtt min/avg/max/mdev = 0.031/0.045/0.060/0.010 ms\n")
+    assert result == {"sent": 4, "received": 3, "loss": 25.0,
+                      "rtt_min": 0.031, "rtt_avg": 0.045, "rtt_max": 0.06}
+
+
+def test_sweep_against_loopback(ping, capsys):
+    results = qakit.reachability_sweep(["127.0.0.1", "192.0.2.1", "127.0.0.2"], count=2, concurrency=2)
+    assert [result["host"] for result in results] == ["127.0.0.1", "192.0.2.1", "127.0.0.2"]
+    assert [result["received"] for result in results] == [2, 0, 2]
+    assert results[0]["rtt_avg"] == 0.034
+    assert results[1]["loss"] == 100.0
+    assert "2/3 target(s) reachable" in capsys.readouterr().out
+
+
+def test_sweep_subcommand_reads_target_file(ping, tmp_path, capsys):
+    targets = tmp_path / "targets.txt"
+    targets.write_text("# rack 3\n127.0.0.1\n127.0.0.4/31  # receivers\n")
+    assert qakit.main(["network", "sweep", "--file", str(targets), "--count", "1"]) == 0
+    out = capsys.readouterr().out
+    assert "3/3 target(s) reachable" in out
+    assert "rack" not in out
+
+
+def test_sweep_subcommand_fails_on_unreachable(ping):
+    assert qakit.main(["network", "sweep", "127.0.0.1", "192.0.2.1", "--count", "1"]) == 1
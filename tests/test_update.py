@@ -0,0 +1,109 @@
+import hashlib
+
+import pytest
+
+import qakit
+
+NEW_SCRIPT = b'#!/usr/bin/env python3\nCURRENT_VERSION = "99.0.0"\nprint("updated")\n'
+
+
+@pytest.fixture
+def update_server(http_server, monkeypatch):
+    http_server.files["/qakit.py"] = {"body": NEW_SCRIPT, "etag": '"v99"'}
+    http_server.files["/qakit.py.sha256"] = {"body": f"{hashlib.sha256(NEW_SCRIPT).hexdigest()}  qakit.py\n".encode()}
+    monkeypatch.setattr(qakit, "UPDATE_URL", f"{http_server.url}/qakit.py?nocache=1")
+    monkeypatch.setattr(qakit, "UPDATE_SHA256_URL", None)
+    return http_server
+
+
+@pytest.fixture
+def installed(tmp_path, monkeypatch):
+    """A stand-in installed copy of the script for update_script() to replace."""
+    script = tmp_path / "install" / "qakit.py"
+    script.parent.mkdir()
+    script.write_bytes(b'CURRENT_VERSION = "1.0.0"\n')
+    script.chmod(0o755)
+    monkeypatch.setattr(qakit, "__file__", str(script))
+    return script
+
+
+def script_gets(server):
+    return [headers for method, path, headers in server.requests if method == "GET" and path == "/qakit.py"]
+
+
+def test_digest_url():
+    assert qakit.update_digest_url("https://host/qakit.py?nocache=1") == "https://host/qakit.py.sha256?nocache=1"
+
+
+def test_check_is_cached_then_revalidated(update_server):
+    assert qakit.check_for_updates() is True
+    assert qakit.check_for_updates() is True  # within the TTL: no request at all
+    assert len(script_gets(update_server)) == 1
+    assert qakit.check_for_updates(refresh=True) is True
+    revalidation = script_gets(update_server)[-1]
+    assert revalidation["If-None-Match"] == '"v99"'
+    assert len(update_server.requests) == 3  # script, its checksum, then a 304
+
+
+def test_update_installs_verified_script(update_server, installed):
+    with pytest.raises(SystemExit):
+        qakit.update_script()
+    assert installed.read_bytes() == NEW_SCRIPT
+    assert installed.stat().st_mode & 0o777 == 0o755
+    assert [path.name for path in installed.parent.iterdir()] == ["qakit.py"]
+
+
+def test_mismatched_published_digest_is_rejected(update_server, installed, capsys):
+    update_server.files["/qakit.py.sha256"]["body"] = b"0" * 64 + b"  qakit.py\n"
+    assert qakit.check_for_updates() is None
+    assert "published checksum" in capsys.readouterr().out
+    qakit.update_script()
+    assert installed.read_bytes() == b'CURRENT_VERSION = "1.0.0"\n'
+
+
+def test_unpublished_digest_installs_with_a_warning(update_server, installed, capsys):
+    del update_server.files["/qakit.py.sha256"]
+    assert qakit.check_for_updates() is True
+    with pytest.raises(SystemExit):
+        qakit.update_script()
+    assert "WARNING: no checksum is published" in capsys.readouterr().out
+    assert installed.read_bytes() == NEW_SCRIPT
+
+
+def test_unpublished_digest_still_needs_valid_python(update_server, installed):
+    del update_server.files["/qakit.py.sha256"]
+    update_server.files["/qakit.py"]["body"] = b'CURRENT_VERSION = "99.0.0"\ndef broken(:\n'
+    assert qakit.check_for_updates() is True
+    qakit.update_script()
+    assert installed.read_bytes() == b'CURRENT_VERSION = "1.0.0"\n'
+
+
+def test_truncated_download_is_rejected(update_server, installed):
+    update_server.files["/qakit.py"]["content_length"] = str(len(NEW_SCRIPT) + 100)
+    assert qakit.check_for_updates() is None
+    qakit.update_script()
+    assert installed.read_bytes() == b'CURRENT_VERSION = "1.0.0"\n'
+
+
+def test_damaged_cache_is_fetched_again(update_server, installed):
+    assert qakit.check_for_updates() is True
+    with open(qakit.UPDATE_BODY_FILE, "ab") as f:
+        f.write(b"# tampered\n")
+    with pytest.raises(SystemExit):
+        qakit.update_script()
+    assert installed.read_bytes() == NEW_SCRIPT
+
+
+def test_latest_version_needs_no_install(update_server, installed, monkeypatch):
+    monkeypatch.setattr(qakit, "CURRENT_VERSION", "99.0.0")
+    assert qakit.check_for_updates() is False
+
+
+def test_update_command_exit_codes(update_server, installed, monkeypatch):
+    assert qakit.main(["update", "--check"]) == 0
+    monkeypatch.setattr(qakit, "UPDATE_URL", f"{update_server.url}/missing.py")
+    assert qakit.main(["update", "--check", "--refresh"]) == 1
+    monkeypatch.setattr(qakit, "UPDATE_URL", f"{update_server.url}/qakit.py")
+    update_server.files["/qakit.py.sha256"]["body"] = hashlib.sha256(b"something else").hexdigest().encode()
+    assert qakit.main(["update", "--refresh"]) == 1
+    assert installed.read_bytes() == b'CURRENT_VERSION = "1.0.0"\n'